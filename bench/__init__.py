@@ -0,0 +1,13 @@
+"""离线压测与基准：本地 OpenAI 兼容的 mock LLM、数据库夹具、压测驱动与微基准。
+
+    python -m bench.mock_llm --port 9997 --latency lognormal:800,0.5 --error-rate 0.02
+    python -m bench.load --rps 20 --duration 30
+    python -m bench.micro --save bench/baseline.json
+"""
+import sys
+from pathlib import Path
+
+# 与 uvicorn 的 --app-dir src 一致：让 bench 模块可以直接 import app
+_SRC = str(Path(__file__).resolve().parents[1] / "src")
+if _SRC not in sys.path:
+    sys.path.insert(0, _SRC)
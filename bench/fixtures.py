@@ -0,0 +1,86 @@
+import random, uuid
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, List
+from sqlalchemy import insert, text
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+from sqlalchemy.ext.compiler import compiles
+
+# 压测用数据库夹具：SQLite 文件库（默认）或临时 Postgres 库，按 app/db/models.py 建表并灌入种子数据。
+
+@compiles(JSONB, "sqlite")
+def _jsonb_sqlite(type_, compiler, **kw):
+    # SQLite 没有 JSONB，按 JSON 存储
+    return "JSON"
+
+DIMENSIONS = [
+    (101, "课堂提问"), (102, "课堂管理"), (103, "反馈与纠错"), (104, "任务设计"),
+    (105, "跨文化交际"), (106, "汉字教学"), (107, "语法教学"), (108, "评价设计"),
+]
+
+def sqlite_url(path: str) -> str:
+    return f"sqlite+aiosqlite:///{path}"
+
+@asynccontextmanager
+async def ephemeral_postgres(admin_url: str) -> AsyncIterator[str]:
+    """在 admin_url 所在实例上建一个临时库，退出时删除；产出临时库的连接串。"""
+    name = f"bench_{uuid.uuid4().hex[:8]}"
+    admin = create_async_engine(admin_url, isolation_level="AUTOCOMMIT")
+    try:
+        async with admin.connect() as conn:
+            await conn.execute(text(f'CREATE DATABASE "{name}"'))
+        yield make_url(admin_url).set(database=name).render_as_string(hide_password=False)
+    finally:
+        async with admin.connect() as conn:
+            await conn.execute(text(f'DROP DATABASE IF EXISTS "{name}" WITH (FORCE)'))
+        await admin.dispose()
+
+async def create_schema(engine: AsyncEngine) -> None:
+    from app.db.base import Base
+    from app.db import models  # noqa: F401  注册全部模型
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+
+async def seed(engine: AsyncEngine, users: int = 100, questions: int = 50, seed: int = 0) -> List[int]:
+    """灌入知识维度、用户与题目，返回题目 ID 列表（供评分压测使用）。"""
+    from app.db import models as m
+    from app.db.repo import content_hash
+    rng = random.Random(seed)
+    async with engine.begin() as conn:
+        await conn.execute(insert(m.KnowledgeDimension), [{"id": i, "name": n} for i, n in DIMENSIONS])
+        await conn.execute(insert(m.Users), [{"id": i, "username": f"bench{i}"} for i in range(1, users + 1)])
+        rows, rels = [], []
+        for i in range(1, questions + 1):
+            kd = rng.choice(DIMENSIONS)[0]
+            rels.append({"q_id": i, "kd_id": kd})
+            points = rng.sample(["明确目标", "分层提问", "即时反馈", "同伴互评", "任务产出检核"], 3)
+            rows.append({
+                "id": i,
+                "question_type": 1,
+                "difficulty": rng.randint(1, 3),
+                "title": f"压测题目 {i}：请分析材料中的教学问题并提出改进建议。",
+                "material": "【情境材料】" + "学生口语表达缺乏信心，讨论停留在表层。" * 10,
+                "requirements": None,
+                "score": 10,
+                "suggest_time": 10,
+                "word_limit": 300,
+                "knowledge_ids": None,
+                "score_points": points,
+                "answer_content": "；".join(points),
+                "scoring_criteria": "满分：要点齐全；部分：覆盖部分要点；不得分：偏题。",
+                "dim_key": str(kd),
+            })
+            r = rows[-1]
+            r["content_hash"] = content_hash(1, r["difficulty"], r["title"], r["material"], r["answer_content"],
+                                             r["scoring_criteria"])
+        await conn.execute(insert(m.Question), rows)
+        await conn.execute(insert(m.QuestionKdRelation), rels)
+    if engine.dialect.name == "postgresql":
+        # 显式指定了 id，需要把序列推进到最大值之后
+        async with engine.begin() as conn:
+            for t in ("question", "users"):
+                await conn.execute(text(
+                    f"SELECT setval(pg_get_serial_sequence('{t}', 'id'), (SELECT max(id) FROM {t}))"))
+    return [r["id"] for r in rows]
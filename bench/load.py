@@ -0,0 +1,241 @@
+import argparse, asyncio, json, logging, math, os, random, tempfile, time
+from collections import Counter, defaultdict
+from contextlib import AsyncExitStack
+from typing import Dict, List, Optional
+import httpx
+from bench import mock_llm
+
+# 压测驱动：按目标 RPS（开环，不等待上一个请求返回）请求 /practice/generate 与 /practice/answer，
+# 输出每个接口的 p50/p95/p99、吞吐、兜底率，以及进程内模式下的数据库连接池等待时间。
+#
+# 默认进程内运行：app 通过 ASGITransport 调用，LLM 指向进程内 mock，数据库为 SQLite 临时文件，
+# Redis 未指定 --redis-url 时使用 fakeredis。指定 --target 时压测外部已部署的服务（不统计连接池等待）。
+
+# 兜底输出的特征（见 services.generator._fallback_item / services.grader._fallback_grade）
+_GEN_FALLBACK = "【情境材料】在一节中文为第二语言的课堂中"
+_GRADE_FALLBACK = "（兜底机评）"
+
+_ANSWERS = [
+    "材料中教师讲解过多，学生输出机会不足。建议设计分层提问并给予等待时间，同时通过同伴互评与即时反馈形成闭环。",
+    "关键问题是目标不明确、任务缺少产出检核。应先明确可观察的教学目标，再用小组任务和评价量表检查学习效果。",
+    "我认为应该多让学生说，老师少讲。",
+]
+
+def percentile(values: List[float], p: float) -> Optional[float]:
+    if not values:
+        return None
+    s = sorted(values)
+    k = max(0, min(len(s) - 1, math.ceil(p / 100 * len(s)) - 1))
+    return s[k]
+
+class Recorder:
+    def __init__(self):
+        self.latency: Dict[str, List[float]] = defaultdict(list)
+        self.status: Dict[str, Counter] = defaultdict(Counter)
+        self.fallback: Counter = Counter()
+        self.pool_wait: List[float] = []
+        self.dropped = 0
+
+    def record(self, name: str, ms: float, status: int, fallback: bool) -> None:
+        self.status[name][status] += 1
+        if status == 200:
+            self.latency[name].append(ms)
+            self.fallback[name] += int(fallback)
+
+    def report(self, elapsed: float) -> dict:
+        out = {"elapsed_s": round(elapsed, 2), "dropped": self.dropped, "endpoints": {}}
+        for name in sorted(self.status):
+            lat, total = self.latency[name], sum(self.status[name].values())
+            out["endpoints"][name] = {
+                "requests": total,
+                "ok": len(lat),
+                "status": dict(self.status[name]),
+                "throughput_rps": round(len(lat) / elapsed, 2) if elapsed else 0.0,
+                "p50_ms": _r(percentile(lat, 50)),
+                "p95_ms": _r(percentile(lat, 95)),
+                "p99_ms": _r(percentile(lat, 99)),
+                "fallback_rate": round(self.fallback[name] / len(lat), 4) if lat else 0.0,
+            }
+        if self.pool_wait:
+            out["db_pool_wait_ms"] = {
+                "checkouts": len(self.pool_wait),
+                "p50": _r(percentile(self.pool_wait, 50)),
+                "p95": _r(percentile(self.pool_wait, 95)),
+                "p99": _r(percentile(self.pool_wait, 99)),
+                "max": _r(max(self.pool_wait)),
+            }
+        return out
+
+def _r(v: Optional[float]) -> Optional[float]:
+    return round(v, 1) if v is not None else None
+
+def instrument_pool(engine, rec: Recorder) -> None:
+    """包装连接池的 checkout，记录每次取连接的等待时间。"""
+    pool = engine.sync_engine.pool
+    connect = pool.connect
+
+    def timed_connect():
+        t0 = time.perf_counter()
+        try:
+            return connect()
+        finally:
+            rec.pool_wait.append((time.perf_counter() - t0) * 1000)
+
+    pool.connect = timed_connect
+
+async def _generate(client: httpx.AsyncClient, rec: Recorder, rng: random.Random, qids: List[int], dims: List[int]):
+    body = {"得分": None, "维度": rng.sample(dims, rng.randint(1, 3)), "难度": rng.randint(1, 3), "题型": 1,
+            "user_id": rng.randint(1, 100)}
+    t0 = time.perf_counter()
+    try:
+        r = await client.post("/practice/generate", json=body)
+    except httpx.HTTPError:
+        rec.record("generate", 0.0, 599, False)
+        return
+    ms = (time.perf_counter() - t0) * 1000
+    fallback = False
+    if r.status_code == 200:
+        data = r.json()
+        qids.append(data["question_id"])
+        fallback = data["item"]["材料"].startswith(_GEN_FALLBACK)
+    rec.record("generate", ms, r.status_code, fallback)
+
+async def _answer(client: httpx.AsyncClient, rec: Recorder, rng: random.Random, qids: List[int]):
+    # 作答末尾加随机后缀，避免全部命中评分缓存
+    body = {"question_id": rng.choice(qids), "user_id": rng.randint(1, 100),
+            "original_answer": f"{rng.choice(_ANSWERS)}（{rng.randint(0, 10 ** 6)}）"}
+    t0 = time.perf_counter()
+    try:
+        r = await client.post("/practice/answer", json=body)
+    except httpx.HTTPError:
+        rec.record("answer", 0.0, 599, False)
+        return
+    ms = (time.perf_counter() - t0) * 1000
+    fallback = r.status_code == 200 and (r.json().get("comments") or "").startswith(_GRADE_FALLBACK)
+    rec.record("answer", ms, r.status_code, fallback)
+
+async def drive(client: httpx.AsyncClient, rec: Recorder, a: argparse.Namespace, qids: List[int],
+                dims: List[int]) -> float:
+    rng = random.Random(a.seed)
+    loop = asyncio.get_running_loop()
+    interval = 1.0 / a.rps
+    tasks: set = set()
+    start = loop.time()
+    i = 0
+    while i * interval < a.duration:
+        delay = start + i * interval - loop.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        i += 1
+        if len(tasks) >= a.max_inflight:
+            rec.dropped += 1
+            continue
+        if rng.random() < a.answer_ratio and qids:
+            coro = _answer(client, rec, rng, qids)
+        else:
+            coro = _generate(client, rec, rng, qids, dims)
+        t = asyncio.create_task(coro)
+        tasks.add(t)
+        t.add_done_callback(tasks.discard)
+    await asyncio.gather(*tasks)
+    return loop.time() - start
+
+def _configure_env(a: argparse.Namespace, db_url: str) -> None:
+    # 必须在 import app 之前设置：app.config / app.db.base 在导入时读取环境变量
+    os.environ.update({
+        "DATABASE_URL": db_url,
+        "LLM_BASE_URL": "http://mock-llm/v1",
+        "LLM_DEBUG": "0",
+        "RATE_LIMIT_ENABLED": "false",
+        "INVENTORY_ENABLED": "false",
+    })
+    if db_url.startswith("sqlite"):
+        # 写后持久化依赖 Postgres 序列取号
+        os.environ["WRITE_BEHIND_MODE"] = "off"
+    if a.redis_url:
+        os.environ["REDIS_URL"] = a.redis_url
+
+async def run_inprocess(a: argparse.Namespace) -> dict:
+    from bench import fixtures
+    async with AsyncExitStack() as stack:
+        if a.pg_admin_url:
+            db_url = await stack.enter_async_context(fixtures.ephemeral_postgres(a.pg_admin_url))
+        else:
+            tmp = stack.enter_context(tempfile.TemporaryDirectory())
+            db_url = fixtures.sqlite_url(os.path.join(tmp, "bench.db"))
+        _configure_env(a, db_url)
+
+        from app import deps
+        from app.db.base import engine
+        from app.llm import client as llm_client
+        from app.main import app
+
+        if not a.redis_url:
+            import fakeredis
+            deps._redis = fakeredis.aioredis.FakeRedis(decode_responses=True)
+        mock = mock_llm.create_app(mock_llm.config_from_args(a))
+        # 在 lifespan 之前接入 mock，lifespan 退出时关闭
+        await llm_client.startup(transport=httpx.ASGITransport(app=mock))
+
+        await fixtures.create_schema(engine)
+        qids = await fixtures.seed(engine, questions=a.questions)
+        rec = Recorder()
+        instrument_pool(engine, rec)
+
+        await stack.enter_async_context(app.router.lifespan_context(app))
+        client = await stack.enter_async_context(
+            httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=120))
+        elapsed = await drive(client, rec, a, qids, [d for d, _ in fixtures.DIMENSIONS])
+        report = rec.report(elapsed)
+        report["mock_llm"] = dict(mock.state.cfg.stats)
+        report["llm"] = (await client.get("/health/llm")).json()
+        await engine.dispose()
+        return report
+
+async def run_external(a: argparse.Namespace) -> dict:
+    from bench.fixtures import DIMENSIONS
+    rec = Recorder()
+    limits = httpx.Limits(max_connections=a.max_inflight, max_keepalive_connections=a.max_inflight)
+    async with httpx.AsyncClient(base_url=a.target, timeout=120, limits=limits, trust_env=False) as client:
+        qids = list(range(1, a.questions + 1))
+        elapsed = await drive(client, rec, a, qids, [d for d, _ in DIMENSIONS])
+    return rec.report(elapsed)
+
+def _print(report: dict) -> None:
+    print(f"\n用时 {report['elapsed_s']}s，因在途请求达上限丢弃 {report['dropped']} 个")
+    print(f"{'endpoint':<10}{'req':>7}{'ok':>7}{'rps':>8}{'p50':>9}{'p95':>9}{'p99':>9}{'fallback':>10}")
+    for name, s in report["endpoints"].items():
+        print(f"{name:<10}{s['requests']:>7}{s['ok']:>7}{s['throughput_rps']:>8}"
+              f"{s['p50_ms'] or '-':>9}{s['p95_ms'] or '-':>9}{s['p99_ms'] or '-':>9}{s['fallback_rate']:>10.2%}")
+        if set(s["status"]) - {200}:
+            print(f"{'':<10}status={s['status']}")
+    if "db_pool_wait_ms" in report:
+        w = report["db_pool_wait_ms"]
+        print(f"DB连接池等待(ms) checkouts={w['checkouts']} p50={w['p50']} p95={w['p95']} p99={w['p99']} max={w['max']}")
+
+def main() -> None:
+    p = argparse.ArgumentParser(description="练习服务压测")
+    p.add_argument("--rps", type=float, default=10.0, help="目标请求速率（开环）")
+    p.add_argument("--duration", type=float, default=30.0, help="持续秒数")
+    p.add_argument("--answer-ratio", type=float, default=0.7, help="评分请求占比，其余为生成")
+    p.add_argument("--max-inflight", type=int, default=500, help="在途请求上限，超过则丢弃并计数")
+    p.add_argument("--questions", type=int, default=50, help="种子题目数（外部模式下假定题目 ID 1..N 存在）")
+    p.add_argument("--target", default=None, help="外部服务地址，例如 http://127.0.0.1:8000；不指定则进程内运行")
+    p.add_argument("--pg-admin-url", default=None, help="使用临时 Postgres 库代替 SQLite，例如 postgresql+asyncpg://postgres:pw@localhost/postgres")
+    p.add_argument("--redis-url", default=None, help="进程内模式使用的 Redis；不指定则使用 fakeredis")
+    p.add_argument("--json", default=None, help="把结果写入 JSON 文件")
+    p.add_argument("--log-level", default="CRITICAL", help="服务日志级别，默认只输出压测结果")
+    mock_llm.add_args(p)
+    a = p.parse_args()
+    if a.seed is None:
+        a.seed = 0
+    logging.basicConfig(level=getattr(logging, a.log_level.upper(), logging.CRITICAL))
+
+    report = asyncio.run(run_external(a) if a.target else run_inprocess(a))
+    _print(report)
+    if a.json:
+        with open(a.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+if __name__ == "__main__":
+    main()
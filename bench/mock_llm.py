@@ -0,0 +1,190 @@
+import argparse, asyncio, json, random, time, uuid
+from dataclasses import dataclass, field
+from typing import List, Optional
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+# 本地 OpenAI 兼容的 /v1/chat/completions：按配置的时延分布、错误率、畸形 JSON 比例返回
+# 生成题目或评分结果，用于离线压测（不需要真实模型）。
+
+@dataclass
+class MockConfig:
+    # 时延分布："fixed:800" | "uniform:300,1500" | "lognormal:800,0.5"（中位数毫秒, sigma）
+    latency: str = "lognormal:800,0.5"
+    # 返回 5xx 的比例
+    error_rate: float = 0.0
+    # 返回畸形 JSON 的比例（其中一部分可被容错解析修复，一部分是截断的不可修复输出）
+    malformed_rate: float = 0.0
+    # 后端不支持 response_format 时对带该字段的请求返回 400
+    reject_response_format: bool = False
+    seed: Optional[int] = None
+    stats: dict = field(default_factory=lambda: {"requests": 0, "errors": 0, "malformed": 0, "stream": 0})
+
+def sample_latency(spec: str, rng: random.Random) -> float:
+    """按分布描述返回一次时延（秒）。"""
+    kind, _, args = spec.partition(":")
+    nums = [float(x) for x in args.split(",") if x.strip()] if args else []
+    if kind == "fixed":
+        ms = nums[0] if nums else 0.0
+    elif kind == "uniform":
+        ms = rng.uniform(nums[0], nums[1])
+    elif kind == "lognormal":
+        median, sigma = (nums + [800.0, 0.5][len(nums):])[:2]
+        ms = rng.lognormvariate(0, sigma) * median
+    else:
+        raise ValueError(f"未知时延分布: {spec}")
+    return max(0.0, ms) / 1000
+
+_POINTS = ["明确目标", "分层提问", "即时反馈", "同伴互评", "任务产出检核", "等待时间"]
+
+def _item(rng: random.Random, user: str) -> dict:
+    material = (
+        "【情境材料】某国际学校初级汉语班共有十五名学生，来自不同母语背景。"
+        "教师在讲授“问路”话题时以讲解为主，学生开口机会少，部分学生在小组活动中依赖母语交流，"
+        "课堂节奏前松后紧，练习环节仓促收尾。课后学生反馈听得懂但说不出，教师希望调整教学设计。"
+    ) * 2
+    return {
+        "材料": material,
+        # 带编号让每道题内容不同，否则入库时按 content_hash 合并为同一道题
+        "题目": f"请分析材料中教师面临的主要问题，并提出两条可操作的改进建议。（{rng.randrange(1_000_000):06d}）",
+        "参考答案": "要点1：增加有意义的输出机会；要点2：任务设计分层；要点3：及时反馈与纠错。",
+        "评分标准": "满分：问题识别准确且建议可操作；部分：建议笼统；不得分：偏题。",
+        "维度": [int(x) for x in _ids_in(user)] or [1],
+        "核心知识点": rng.sample(_POINTS, rng.randint(2, 4)),
+        "难度": 1,
+        "题型": 1,
+        "满分": 10,
+        "建议用时": 10,
+        "字数上限": 300,
+    }
+
+def _ids_in(user: str) -> List[str]:
+    # 从 "维度ID: [101, 103]" 中取出 ID
+    head = user.split("\n", 1)[0]
+    return [x.strip() for x in head.partition("[")[2].partition("]")[0].split(",") if x.strip().isdigit()]
+
+def _grade(rng: random.Random) -> dict:
+    hit = rng.sample(_POINTS, 2)
+    return {
+        "total_score": round(rng.uniform(3, 9), 1),
+        "subitem_scores": {p: round(rng.uniform(1, 3), 1) for p in hit},
+        "comments": "要点基本覆盖，建议补充课堂实例。",
+        "hit_score_points": hit,
+    }
+
+def _malformed(text: str, rng: random.Random) -> str:
+    kind = rng.choice(("think_fence", "trailing_comma", "truncated"))
+    if kind == "think_fence":
+        return f"<think>先分析要点……</think>\n好的，结果如下：\n```json\n{text}\n```"
+    if kind == "trailing_comma":
+        return text[:-1] + ",}"
+    return text[: len(text) // 2]
+
+def _point_grade(rng: random.Random, user: str) -> dict:
+    # 从 "该要点分值: 3.33" 中取出分值
+    share = next((float(line.partition(":")[2]) for line in user.splitlines() if line.startswith("该要点分值:")), 3.0)
+    dims = next((line.partition(":")[2].strip() for line in user.splitlines() if line.startswith("知识维度:")), "")
+    hit = rng.random() < 0.7
+    return {"score": round(rng.uniform(0.5, 1.0) * share if hit else 0.0, 1), "hit": hit,
+            "comment": "论述到位，可补充实例。" if hit else "未涉及该要点。",
+            "dim": rng.choice(dims.split("、")) if dims else ""}
+
+def _batch(rng: random.Random, user: str) -> dict:
+    # 从 "题目数量: 5" 中取出题数
+    n = next((int(line.partition(":")[2]) for line in user.splitlines() if line.startswith("题目数量:")), 1)
+    return {"items": [_item(rng, user) for _ in range(n)]}
+
+def _kind(body: dict) -> str:
+    """请求类型：grade_result / point_grade / practice_batch / practice_item。"""
+    fmt = ((body.get("response_format") or {}).get("json_schema") or {}).get("name")
+    if fmt:
+        return fmt
+    system = next((m.get("content", "") for m in body.get("messages", []) if m.get("role") == "system"), "")
+    if "阅卷" not in system:
+        return "practice_batch" if "一次生成" in system else "practice_item"
+    return "point_grade" if "一个要点" in system else "grade_result"
+
+def _usage(body: dict, content: str) -> dict:
+    prompt = sum(len(m.get("content", "")) for m in body.get("messages", []))
+    return {"prompt_tokens": prompt, "completion_tokens": len(content), "total_tokens": prompt + len(content)}
+
+def create_app(cfg: Optional[MockConfig] = None) -> FastAPI:
+    cfg = cfg or MockConfig()
+    rng = random.Random(cfg.seed)
+    app = FastAPI(title="Mock LLM")
+    app.state.cfg = cfg
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        cfg.stats["requests"] += 1
+        if cfg.reject_response_format and body.get("response_format"):
+            return JSONResponse(status_code=400, content={"error": {"message": "response_format not supported"}})
+        await asyncio.sleep(sample_latency(cfg.latency, rng))
+        if rng.random() < cfg.error_rate:
+            cfg.stats["errors"] += 1
+            return JSONResponse(status_code=503, content={"error": {"message": "mock upstream error"}})
+
+        user = next((m.get("content", "") for m in body.get("messages", []) if m.get("role") == "user"), "")
+        kind = _kind(body)
+        data = (_grade(rng) if kind == "grade_result" else
+                _point_grade(rng, user) if kind == "point_grade" else
+                _batch(rng, user) if kind == "practice_batch" else _item(rng, user))
+        content = json.dumps(data, ensure_ascii=False)
+        if rng.random() < cfg.malformed_rate:
+            cfg.stats["malformed"] += 1
+            content = _malformed(content, rng)
+
+        rid = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+        if body.get("stream"):
+            cfg.stats["stream"] += 1
+            return StreamingResponse(_sse(rid, body.get("model"), content), media_type="text/event-stream")
+        return {
+            "id": rid,
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": _usage(body, content),
+        }
+
+    @app.get("/v1/models")
+    async def models():
+        return {"object": "list", "data": [{"id": "mock", "object": "model"}]}
+
+    @app.get("/stats")
+    async def stats():
+        return cfg.stats
+
+    return app
+
+async def _sse(rid: str, model: Optional[str], content: str):
+    for i in range(0, len(content), 16):
+        chunk = {"id": rid, "object": "chat.completion.chunk", "model": model,
+                 "choices": [{"index": 0, "delta": {"content": content[i:i + 16]}}]}
+        yield f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
+        await asyncio.sleep(0)
+    yield "data: [DONE]\n\n"
+
+def add_args(p: argparse.ArgumentParser) -> None:
+    p.add_argument("--latency", default="lognormal:800,0.5", help="fixed:MS | uniform:LO,HI | lognormal:MEDIAN,SIGMA")
+    p.add_argument("--error-rate", type=float, default=0.0)
+    p.add_argument("--malformed-rate", type=float, default=0.0)
+    p.add_argument("--reject-response-format", action="store_true")
+    p.add_argument("--seed", type=int, default=None)
+
+def config_from_args(a: argparse.Namespace) -> MockConfig:
+    return MockConfig(latency=a.latency, error_rate=a.error_rate, malformed_rate=a.malformed_rate,
+                      reject_response_format=a.reject_response_format, seed=a.seed)
+
+def main() -> None:
+    import uvicorn
+    p = argparse.ArgumentParser(description="本地 mock LLM（OpenAI 兼容）")
+    p.add_argument("--host", default="127.0.0.1")
+    p.add_argument("--port", type=int, default=9997)
+    add_args(p)
+    a = p.parse_args()
+    uvicorn.run(create_app(config_from_args(a)), host=a.host, port=a.port, log_level="warning")
+
+if __name__ == "__main__":
+    main()
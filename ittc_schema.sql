@@ -37,7 +37,11 @@ CREATE TABLE IF NOT EXISTS question (
   score_points JSONB,
   create_time TIMESTAMPTZ NOT NULL DEFAULT NOW(),
   answer_content TEXT,
-  scoring_criteria TEXT
+  scoring_criteria TEXT,
+  -- canonical sorted dimension-set key ("101,103") for question-bank reuse; NULL = not reusable
+  dim_key VARCHAR(200),
+  -- md5 of the question content, unique; dedupes bulk imports (see app.db.repo.content_hash)
+  content_hash CHAR(32)
 );
 
 -- Relation: question <-> knowledge_dimension
@@ -63,12 +67,47 @@ CREATE TABLE IF NOT EXISTS answer_record (
   hit_score_points JSONB
 );
 
+-- Per-(user, dimension) mastery rollup, updated incrementally on every answer_record insert
+-- scores are normalized to 0-1 (total_score / question.score)
+CREATE TABLE IF NOT EXISTS user_dim_mastery (
+  user_id BIGINT NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+  kd_id BIGINT NOT NULL REFERENCES knowledge_dimension(id) ON DELETE CASCADE,
+  attempts INT NOT NULL DEFAULT 0,
+  score_sum DOUBLE PRECISION NOT NULL DEFAULT 0,
+  ewma_score DOUBLE PRECISION,
+  last_attempt TIMESTAMPTZ,
+  PRIMARY KEY (user_id, kd_id)
+);
+
 -- Constraints
 ALTER TABLE question
   ADD CONSTRAINT IF NOT EXISTS question_score_nonneg CHECK (score >= 0);
 ALTER TABLE answer_record
   ADD CONSTRAINT IF NOT EXISTS total_score_nonneg CHECK (total_score IS NULL OR total_score >= 0);
 
+-- Upgrade existing databases: add and backfill question.dim_key
+ALTER TABLE question ADD COLUMN IF NOT EXISTS dim_key VARCHAR(200);
+UPDATE question q SET dim_key = r.k
+FROM (SELECT q_id, string_agg(kd_id::text, ',' ORDER BY kd_id) AS k FROM question_kd_relation GROUP BY q_id) r
+WHERE r.q_id = q.id AND q.dim_key IS NULL;
+
+-- Upgrade existing databases: add and backfill question.content_hash (unique; NULL for fallback questions).
+-- Duplicate content keeps the hash on its lowest id only; the backfill skips hashes that already exist,
+-- so the script can be re-run after the unique index is in place.
+ALTER TABLE question ADD COLUMN IF NOT EXISTS content_hash CHAR(32);
+UPDATE question q SET content_hash = NULL
+FROM question d
+WHERE d.content_hash = q.content_hash AND d.id < q.id;
+UPDATE question q SET content_hash = h.hash
+FROM (
+  SELECT DISTINCT ON (hash) id, hash
+  FROM (SELECT id, md5(concat_ws(E'\x1f', question_type, difficulty, title, coalesce(material, ''),
+          coalesce(answer_content, ''), coalesce(scoring_criteria, ''))) AS hash
+        FROM question WHERE content_hash IS NULL) c
+  ORDER BY hash, id
+) h
+WHERE q.id = h.id AND NOT EXISTS (SELECT 1 FROM question e WHERE e.content_hash = h.hash);
+
 -- Indexes
 CREATE INDEX IF NOT EXISTS idx_question_created_at ON question (create_time DESC);
 CREATE INDEX IF NOT EXISTS idx_question_type ON question (question_type, difficulty);
@@ -77,3 +116,8 @@ CREATE INDEX IF NOT EXISTS idx_answer_record_user ON answer_record (user_id, sub
 CREATE INDEX IF NOT EXISTS idx_answer_record_qid ON answer_record (q_id, submit_time DESC);
 CREATE INDEX IF NOT EXISTS idx_answer_record_dim_scores_gin ON answer_record USING GIN (dimension_scores);
 CREATE INDEX IF NOT EXISTS idx_qkd_kd ON question_kd_relation (kd_id);
+CREATE INDEX IF NOT EXISTS idx_question_dim_key ON question (dim_key, difficulty, question_type, id DESC)
+  WHERE dim_key IS NOT NULL;
+DROP INDEX IF EXISTS idx_question_content_hash;
+CREATE UNIQUE INDEX IF NOT EXISTS uq_question_content_hash ON question (content_hash);
+CREATE INDEX IF NOT EXISTS idx_answer_record_submit_time ON answer_record (submit_time);
@@ -0,0 +1,96 @@
+import hmac, logging
+from datetime import datetime
+from typing import Literal, Optional
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from app import config
+from app.db import repo
+from app.deps import get_db
+from app.schemas.practice import QuestionUpdate
+from app.services import dimension, transfer
+
+logger = logging.getLogger("routes.admin")
+
+def require_admin(x_admin_token: str = Header(default="")) -> None:
+    # 未配置 ADMIN_TOKEN 时全部拒绝，避免题库与作答记录被匿名导出
+    if not config.ADMIN_TOKEN or not hmac.compare_digest(x_admin_token, config.ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="无权访问管理接口")
+
+router = APIRouter(prefix="/admin", tags=["Admin"], dependencies=[Depends(require_admin)])
+
+def _filters(dims: Optional[str] = Query(None, description="逗号分隔的维度ID，命中任一即导出"),
+             difficulty: Optional[int] = Query(None, ge=1, le=3),
+             since: Optional[datetime] = Query(None, description="起始时间（含），题目按创建时间、作答按提交时间"),
+             until: Optional[datetime] = Query(None, description="截止时间（不含）")) -> transfer.Filters:
+    try:
+        kd_ids = [int(d) for d in dims.split(",") if d.strip()] if dims else None
+    except ValueError:
+        raise HTTPException(status_code=422, detail="dims 需为逗号分隔的整数")
+    return transfer.Filters(dims=kd_ids, difficulty=difficulty, since=since, until=until)
+
+@router.get("/export/{kind}")
+async def export_data(kind: Literal["questions", "answers"], request: Request,
+                      format: Literal["ndjson", "csv"] = "ndjson",
+                      f: transfer.Filters = Depends(_filters)) -> StreamingResponse:
+    rid = getattr(request.state, "request_id", "-")
+    logger.info(f"[{rid}] /admin/export/{kind} format={format} filters={f}")
+    return StreamingResponse(transfer.export(kind, format, f), media_type=transfer.FORMATS[format],
+                             headers={"Content-Disposition": f'attachment; filename="{kind}.{format}"'})
+
+@router.post("/import/questions")
+async def import_questions(request: Request) -> dict:
+    """请求体为 NDJSON（与 /admin/export/questions?format=ndjson 的输出格式相同），边接收边分批入库。"""
+    rid = getattr(request.state, "request_id", "-")
+    try:
+        stats = await transfer.import_questions(request.stream())
+    except Exception as e:
+        logger.exception(f"[{rid}] import FAIL: {e}")
+        raise HTTPException(status_code=502, detail=f"导入失败：{e}")
+    logger.info(f"[{rid}] import OK {stats}")
+    return stats
+
+@router.patch("/questions/{q_id}")
+async def update_question(q_id: int, body: QuestionUpdate, request: Request,
+                          session: AsyncSession = Depends(get_db)) -> dict:
+    """修改题目；评分缓存（本进程与其他进程）随之失效。"""
+    rid = getattr(request.state, "request_id", "-")
+    fields = body.model_dump(exclude_unset=True)
+    if not fields:
+        raise HTTPException(status_code=422, detail="没有要修改的字段")
+    try:
+        updated = await repo.update_question(session, q_id, **fields)
+    except IntegrityError:
+        await session.rollback()
+        raise HTTPException(status_code=409, detail="修改后的内容与已有题目重复")
+    if not updated:
+        raise HTTPException(status_code=404, detail="题目不存在")
+    logger.info(f"[{rid}] question {q_id} updated fields={sorted(fields)}")
+    return {"question_id": q_id, "updated": sorted(fields)}
+
+@router.delete("/questions/{q_id}")
+async def delete_question(q_id: int, request: Request, session: AsyncSession = Depends(get_db)) -> dict:
+    rid = getattr(request.state, "request_id", "-")
+    try:
+        deleted = await repo.delete_question(session, q_id)
+    except IntegrityError:
+        await session.rollback()
+        raise HTTPException(status_code=409, detail="题目已有作答记录，不能删除")
+    if not deleted:
+        raise HTTPException(status_code=404, detail="题目不存在")
+    logger.info(f"[{rid}] question {q_id} deleted")
+    return {"question_id": q_id, "deleted": True}
+
+@router.post("/dimensions/reload")
+async def reload_dimensions(request: Request) -> dict:
+    """从数据库重新加载维度目录（本进程）。"""
+    rid = getattr(request.state, "request_id", "-")
+    try:
+        await dimension.load()
+    except Exception as e:
+        logger.exception(f"[{rid}] dimensions reload FAIL: {e}")
+        raise HTTPException(status_code=502, detail=f"维度目录刷新失败：{e}")
+    count = len(await dimension.catalog())
+    logger.info(f"[{rid}] dimensions reloaded count={count}")
+    return {"count": count}
@@ -1,6 +1,37 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, Request, Response
+from app.cache import question as question_cache
+from app.db import base, writebehind
+from app.llm import backends, client, resilience, singleflight
+from app.services import jobs
+from app.utils import metrics, ratelimit
 router = APIRouter()
 
 @router.get("/health")
 async def health():
     return {"ok": True}
+
+@router.get("/health/llm")
+async def health_llm():
+    return {**resilience.snapshot(), "singleflight": singleflight.stats(), "routing": backends.snapshot(),
+            "json": client.json_stats()}
+
+@router.get("/health/db")
+async def health_db():
+    return {"pools": base.pool_stats(), "writebehind": writebehind.stats()}
+
+@router.get("/health/cache")
+async def health_cache():
+    return {"question": question_cache.stats()}
+
+@router.get("/health/ratelimit")
+async def health_ratelimit():
+    return ratelimit.stats()
+
+@router.get("/health/jobs")
+async def health_jobs():
+    return await jobs.stats()
+
+@router.get("/metrics", include_in_schema=False)
+async def prometheus_metrics(request: Request):
+    body, content_type = metrics.render(request.headers.get("Accept", ""))
+    return Response(content=body, media_type=content_type)
@@ -1,37 +1,164 @@
 import logging
-from fastapi import APIRouter, Depends, HTTPException, Request
+from typing import Annotated, Any, AsyncIterator, Optional, Tuple
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
-from app.schemas.practice import PracticeRequest, GenerateResponse, AnswerRequest, AnswerResponse, ErrorResponse
+from app.schemas.practice import (PracticeRequest, GenerateResponse, AnswerRequest, AnswerResponse, ErrorResponse,
+                                  BatchAnswerRequest, BatchAnswerResponse, BatchGenerateRequest,
+                                  BatchGenerateResponse, JobAccepted, JobStatus)
 from app.deps import get_db
-from app.services.generator import generate_practice_item
-from app.services.grader import submit_answer
+from app.services.generator import generate_practice_batch, generate_practice_item, stream_practice_item
+from app.services.grader import submit_answer, submit_answers_batch, stream_submit_answer
+from app.services import dimension, inventory, jobs, mastery
+from app.utils import idempotency
 import json
 
 logger = logging.getLogger("routes.practice")
 router = APIRouter(prefix="/practice", tags=["Practice"])
 
+# 客户端/网关重试时带同一个 Idempotency-Key：不会重复调用 LLM 与重复入库，重放首次的响应
+IdempotencyKey = Annotated[Optional[str], Header(alias="Idempotency-Key",
+                                                 description="可选，幂等键；同一 key 的重复请求重放首次结果")]
+
 @router.post("/generate", response_model=GenerateResponse,
              responses={400: {"model": ErrorResponse}, 422: {"model": ErrorResponse}, 500: {"model": ErrorResponse}})
-async def generate(req: PracticeRequest, request: Request, session: AsyncSession = Depends(get_db)) -> GenerateResponse:
+async def generate(req: PracticeRequest, request: Request, response: Response,
+                   session: AsyncSession = Depends(get_db), idem_key: IdempotencyKey = None) -> dict:
     rid = getattr(request.state, "request_id", "-")
     logger.info(f"[{rid}] /practice/generate req={json.dumps(req.model_dump(), ensure_ascii=False)}")
-    try:
-        item, qid = await generate_practice_item(req, session)
-        logger.info(f"[{rid}] generate OK qid={qid} dims={item.维度} diff={item.难度} points={len(item.核心知识点)}")
-        return GenerateResponse(question_id=qid, item=item)
-    except Exception as e:
-        logger.exception(f"[{rid}] generate FAIL: {e}")
-        raise HTTPException(status_code=502, detail=f"生成失败：{e}")
+
+    async def run() -> dict:
+        try:
+            item, qid = await generate_practice_item(req, session)
+            logger.info(f"[{rid}] generate OK qid={qid} dims={item.维度} diff={item.难度} points={len(item.核心知识点)}")
+            return GenerateResponse(question_id=qid, item=item).model_dump()
+        except Exception as e:
+            logger.exception(f"[{rid}] generate FAIL: {e}")
+            raise HTTPException(status_code=502, detail=f"生成失败：{e}")
+
+    return await idempotency.handle("generate", request, idem_key, req.model_dump(), run, response)
+
+@router.post("/generate/batch", response_model=BatchGenerateResponse,
+             responses={400: {"model": ErrorResponse}, 422: {"model": ErrorResponse}, 500: {"model": ErrorResponse}})
+async def generate_batch(req: BatchGenerateRequest, request: Request, response: Response,
+                         session: AsyncSession = Depends(get_db), idem_key: IdempotencyKey = None) -> dict:
+    rid = getattr(request.state, "request_id", "-")
+    logger.info(f"[{rid}] /practice/generate/batch req={json.dumps(req.model_dump(), ensure_ascii=False)}")
+
+    async def run() -> dict:
+        try:
+            pairs, shortfall = await generate_practice_batch(req, session)
+            logger.info(f"[{rid}] generate batch OK n={len(pairs)} shortfall={shortfall}")
+            return BatchGenerateResponse(items=[GenerateResponse(question_id=qid, item=item) for qid, item in pairs],
+                                         shortfall=shortfall).model_dump()
+        except Exception as e:
+            logger.exception(f"[{rid}] generate batch FAIL: {e}")
+            raise HTTPException(status_code=502, detail=f"批量生成失败：{e}")
+
+    return await idempotency.handle("generate_batch", request, idem_key, req.model_dump(), run, response)
 
 @router.post("/answer", response_model=AnswerResponse,
              responses={400: {"model": ErrorResponse}, 422: {"model": ErrorResponse}, 500: {"model": ErrorResponse}})
-async def answer(body: AnswerRequest, request: Request, session: AsyncSession = Depends(get_db)) -> AnswerResponse:
+async def answer(body: AnswerRequest, request: Request, response: Response,
+                 session: AsyncSession = Depends(get_db), idem_key: IdempotencyKey = None) -> dict:
     rid = getattr(request.state, "request_id", "-")
     logger.info(f"[{rid}] /practice/answer req={{'q':{body.question_id},'user':{body.user_id}}}")
+
+    async def run() -> dict:
+        try:
+            resp = await submit_answer(body, session)
+            logger.info(f"[{rid}] answer OK ar_id={resp.answer_record_id} total={resp.total_score}")
+            return resp.model_dump()
+        except Exception as e:
+            logger.exception(f"[{rid}] answer FAIL: {e}")
+            raise HTTPException(status_code=502, detail=f"评分失败：{e}")
+
+    return await idempotency.handle("answer", request, idem_key, body.model_dump(), run, response)
+
+@router.post("/answer/batch", response_model=BatchAnswerResponse,
+             responses={400: {"model": ErrorResponse}, 422: {"model": ErrorResponse}, 500: {"model": ErrorResponse}})
+async def answer_batch(body: BatchAnswerRequest, request: Request, response: Response,
+                       session: AsyncSession = Depends(get_db), idem_key: IdempotencyKey = None) -> dict:
+    rid = getattr(request.state, "request_id", "-")
+    logger.info(f"[{rid}] /practice/answer/batch n={len(body.items)}")
+
+    async def run() -> dict:
+        try:
+            items = await submit_answers_batch(body.items, session)
+            logger.info(f"[{rid}] answer batch OK ok={sum(1 for it in items if it.ok)}/{len(items)}")
+            return BatchAnswerResponse(items=items).model_dump()
+        except Exception as e:
+            logger.exception(f"[{rid}] answer batch FAIL: {e}")
+            raise HTTPException(status_code=502, detail=f"批量评分失败：{e}")
+
+    return await idempotency.handle("answer_batch", request, idem_key, body.model_dump(), run, response)
+
+def _sse(event: str, data: Any) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+async def _sse_stream(rid: str, name: str, events: AsyncIterator[Tuple[str, Any]]) -> AsyncIterator[str]:
+    try:
+        async for event, data in events:
+            yield _sse(event, data)
+    except Exception as e:
+        logger.exception(f"[{rid}] {name} stream FAIL: {e}")
+        yield _sse("error", {"message": str(e)})
+
+@router.post("/generate/stream")
+async def generate_stream(req: PracticeRequest, request: Request) -> StreamingResponse:
+    rid = getattr(request.state, "request_id", "-")
+    logger.info(f"[{rid}] /practice/generate/stream req={json.dumps(req.model_dump(), ensure_ascii=False)}")
+    return StreamingResponse(_sse_stream(rid, "generate", stream_practice_item(req)),
+                             media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+@router.post("/answer/stream")
+async def answer_stream(body: AnswerRequest, request: Request) -> StreamingResponse:
+    rid = getattr(request.state, "request_id", "-")
+    logger.info(f"[{rid}] /practice/answer/stream req={{'q':{body.question_id},'user':{body.user_id}}}")
+    return StreamingResponse(_sse_stream(rid, "answer", stream_submit_answer(body)),
+                             media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+async def _enqueue(rid: str, kind: str, payload: dict) -> JobAccepted:
+    try:
+        job_id = await jobs.enqueue(kind, payload)
+    except Exception as e:
+        logger.exception(f"[{rid}] {kind} job enqueue FAIL: {e}")
+        raise HTTPException(status_code=503, detail=f"任务入队失败：{e}")
+    logger.info(f"[{rid}] {kind} job queued job_id={job_id}")
+    return JobAccepted(job_id=job_id)
+
+@router.post("/jobs/generate", response_model=JobAccepted, status_code=202)
+async def generate_job(req: PracticeRequest, request: Request) -> JobAccepted:
+    # 不占用数据库会话与 LLM 名额，由 worker 进程异步执行
+    return await _enqueue(getattr(request.state, "request_id", "-"), "generate", req.model_dump())
+
+@router.post("/jobs/answer", response_model=JobAccepted, status_code=202)
+async def answer_job(body: AnswerRequest, request: Request) -> JobAccepted:
+    return await _enqueue(getattr(request.state, "request_id", "-"), "answer", body.model_dump())
+
+@router.get("/jobs/{job_id}", response_model=JobStatus)
+async def get_job(job_id: str, wait: float = Query(0, ge=0, description="长轮询：最多等待的秒数，任务结束即返回")) -> JobStatus:
+    job = await (jobs.wait(job_id, wait) if wait > 0 else jobs.get(job_id))
+    if job is None:
+        raise HTTPException(status_code=404, detail="任务不存在或已过期")
+    return JobStatus(**job)
+
+@router.get("/inventory/stats")
+async def inventory_stats() -> dict:
     try:
-        resp = await submit_answer(body, session)
-        logger.info(f"[{rid}] answer OK ar_id={resp.answer_record_id} total={resp.total_score}")
-        return resp
+        return await inventory.stats()
     except Exception as e:
-        logger.exception(f"[{rid}] answer FAIL: {e}")
-        raise HTTPException(status_code=502, detail=f"评分失败：{e}")
+        logger.exception(f"inventory stats FAIL: {e}")
+        raise HTTPException(status_code=502, detail=f"库存统计失败：{e}")
+
+@router.get("/mastery/{user_id}")
+async def user_mastery(user_id: int) -> dict:
+    try:
+        return {"user_id": user_id, "dimensions": await mastery.profile(user_id)}
+    except Exception as e:
+        logger.exception(f"mastery FAIL user={user_id}: {e}")
+        raise HTTPException(status_code=502, detail=f"掌握度查询失败：{e}")
+
+@router.get("/dimensions")
+async def list_dimensions() -> dict:
+    return {str(k): v for k, v in (await dimension.catalog()).items()}
@@ -0,0 +1,145 @@
+import asyncio, json, logging, time
+from collections import OrderedDict
+from dataclasses import asdict, dataclass
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+from app import config
+from app.deps import get_redis
+
+logger = logging.getLogger("cache.question")
+
+# 评分用题目投影的两级读穿缓存：进程内 LRU + Redis（qv:<版本>:<id>）。
+# 题目更新/删除时清两级缓存，并通过 qv:invalidate 频道通知其他进程清本地缓存。
+# GradingView 字段或含义变化时提升 _VERSION，旧版本进程写入的条目不会被读到，按 TTL 自然过期。
+_VERSION = 4
+_REDIS_PREFIX = f"qv:{_VERSION}:"
+_CHANNEL = "qv:invalidate"
+
+@dataclass(frozen=True)
+class GradingView:
+    """评分只需要的题目字段（不含大字段 material），属性名与 models.Question 一致。
+
+    title / answer_content 供本地预评分做照抄检测；dims 为所属知识维度名称，分项评分按维度汇总用。
+    dims 为 None 表示题目还在写后队列中、维度关系未落库，这样的投影不进缓存。
+    """
+    id: int
+    question_type: int
+    score: int
+    word_limit: Optional[int]
+    score_points: Optional[list]
+    scoring_criteria: Optional[str]
+    title: Optional[str] = None
+    answer_content: Optional[str] = None
+    dims: Optional[list] = None
+
+_local: "OrderedDict[int, Tuple[float, GradingView]]" = OrderedDict()
+_stats = {"local_hit": 0, "redis_hit": 0, "miss": 0, "invalidated": 0}
+
+def _local_get(q_id: int) -> Optional[GradingView]:
+    hit = _local.get(q_id)
+    if hit is None:
+        return None
+    ts, view = hit
+    if time.monotonic() - ts > config.QUESTION_CACHE_TTL:
+        _local.pop(q_id, None)
+        return None
+    _local.move_to_end(q_id)
+    return view
+
+def _local_put(view: GradingView) -> None:
+    _local[view.id] = (time.monotonic(), view)
+    _local.move_to_end(view.id)
+    while len(_local) > config.QUESTION_CACHE_SIZE:
+        _local.popitem(last=False)
+
+async def get(q_id: int, loader: Callable[[], Awaitable[Optional[GradingView]]]) -> Optional[GradingView]:
+    views = await get_many([q_id], lambda ids: _single(loader))
+    return views.get(q_id)
+
+async def _single(loader) -> Dict[int, GradingView]:
+    view = await loader()
+    return {view.id: view} if view else {}
+
+async def get_many(q_ids: Iterable[int],
+                   loader: Callable[[List[int]], Awaitable[Dict[int, GradingView]]]) -> Dict[int, GradingView]:
+    out: Dict[int, GradingView] = {}
+    missing = []
+    for q_id in dict.fromkeys(q_ids):
+        view = _local_get(q_id)
+        if view is not None:
+            _stats["local_hit"] += 1
+            out[q_id] = view
+        else:
+            missing.append(q_id)
+    if not missing:
+        return out
+
+    try:
+        r = await get_redis()
+        raws = await r.mget([f"{_REDIS_PREFIX}{i}" for i in missing])
+    except Exception as e:
+        logger.warning(f"题目缓存读取 Redis 失败: {e}")
+        r, raws = None, [None] * len(missing)
+    still = []
+    for q_id, raw in zip(missing, raws):
+        if raw:
+            _stats["redis_hit"] += 1
+            view = GradingView(**json.loads(raw))
+            _local_put(view)
+            out[q_id] = view
+        else:
+            still.append(q_id)
+    if not still:
+        return out
+
+    _stats["miss"] += len(still)
+    loaded = await loader(still)
+    out.update(loaded)
+    # 写后队列中的题目缺维度，落库后下次读取再缓存完整投影
+    complete = [view for view in loaded.values() if view.dims is not None]
+    for view in complete:
+        _local_put(view)
+    if r is not None and complete:
+        try:
+            pipe = r.pipeline()
+            for view in complete:
+                pipe.set(f"{_REDIS_PREFIX}{view.id}", json.dumps(asdict(view), ensure_ascii=False),
+                         ex=config.QUESTION_CACHE_REDIS_TTL)
+            await pipe.execute()
+        except Exception as e:
+            logger.warning(f"题目缓存写入 Redis 失败: {e}")
+    return out
+
+async def invalidate(q_id: int) -> None:
+    _local.pop(q_id, None)
+    _stats["invalidated"] += 1
+    try:
+        r = await get_redis()
+        await r.delete(f"{_REDIS_PREFIX}{q_id}")
+        await r.publish(_CHANNEL, str(q_id))
+    except Exception as e:
+        logger.warning(f"题目缓存失效通知失败 q_id={q_id}: {e}")
+
+async def listen_invalidations() -> None:
+    """订阅其他进程的失效通知，清理本进程的 LRU，在 app lifespan 中启动。"""
+    while True:
+        try:
+            r = await get_redis()
+            pubsub = r.pubsub()
+            await pubsub.subscribe(_CHANNEL)
+            async for msg in pubsub.listen():
+                if msg.get("type") == "message":
+                    _local.pop(int(msg["data"]), None)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"题目缓存失效订阅中断，5s 后重连: {e}")
+            await asyncio.sleep(5)
+
+def stats() -> dict:
+    lookups = _stats["local_hit"] + _stats["redis_hit"] + _stats["miss"]
+    hits = _stats["local_hit"] + _stats["redis_hit"]
+    return {
+        **_stats,
+        "size": len(_local),
+        "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+    }
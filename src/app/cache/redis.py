@@ -0,0 +1,56 @@
+import hashlib, json, logging, re, time, unicodedata
+from typing import Any, List, Optional
+from app import config
+from app.deps import get_redis
+
+logger = logging.getLogger("cache.redis")
+
+# 评分缓存：grade:<q_id>:<评分标准哈希>:<作答哈希>:<模型>，grade:index 按写入时间记录全部键用于容量淘汰
+_GRADE_PREFIX = "grade:"
+_GRADE_INDEX = "grade:index"
+
+# 空白与中英文标点，归一化时全部去掉
+_NOISE = re.compile(r"[\s　​，。、；：？！…—·“”‘’「」『』（）【】《》〈〉,.;:?!\"'`()\[\]{}<>\-_/\\|~]+")
+
+def normalize_answer(text: str) -> str:
+    return _NOISE.sub("", unicodedata.normalize("NFKC", text or "")).lower()
+
+def _digest(s: str) -> str:
+    return hashlib.sha1(s.encode("utf-8")).hexdigest()[:20]
+
+def rubric_hash(full_score: int, score_points: Optional[List[str]], rubric: Optional[str]) -> str:
+    return _digest(json.dumps([full_score, score_points or [], rubric or ""], ensure_ascii=False))
+
+def grade_key(q_id: int, rubric_digest: str, answer: str, model: str) -> str:
+    return f"{_GRADE_PREFIX}{q_id}:{rubric_digest}:{_digest(normalize_answer(answer))}:{model}"
+
+async def get_grading(key: str) -> Optional[dict]:
+    if not config.GRADE_CACHE_ENABLED:
+        return None
+    try:
+        raw = await (await get_redis()).get(key)
+    except Exception as e:
+        logger.warning(f"评分缓存读取失败: {e}")
+        return None
+    return json.loads(raw) if raw else None
+
+async def set_grading(key: str, grading: dict[str, Any]) -> None:
+    if not config.GRADE_CACHE_ENABLED:
+        return
+    try:
+        r = await get_redis()
+        now = time.time()
+        pipe = r.pipeline()
+        pipe.set(key, json.dumps(grading, ensure_ascii=False), ex=config.GRADE_CACHE_TTL)
+        pipe.zadd(_GRADE_INDEX, {key: now})
+        pipe.zremrangebyscore(_GRADE_INDEX, 0, now - config.GRADE_CACHE_TTL)
+        pipe.zcard(_GRADE_INDEX)
+        *_, size = await pipe.execute()
+        overflow = int(size) - config.GRADE_CACHE_MAX_ENTRIES
+        if overflow > 0:
+            # 超出容量：淘汰最早写入的条目
+            evicted = [k for k, _ in await r.zpopmin(_GRADE_INDEX, overflow)]
+            if evicted:
+                await r.delete(*evicted)
+    except Exception as e:
+        logger.warning(f"评分缓存写入失败: {e}")
@@ -1,18 +1,55 @@
 from sqlalchemy.orm import DeclarativeBase
-from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine, async_sessionmaker
 import os
+from app import config
+from app.utils.metrics import instrument_pool
 
 # 声明基类，所有模型都要继承它
 class Base(DeclarativeBase):
     pass
 
-# 数据库 URL 从环境变量读取
+# 数据库 URL 从环境变量读取；DATABASE_REPLICA_URL 为只读副本，未设置时读写都走主库
 DB_URL = os.getenv("DATABASE_URL")
+REPLICA_URL = os.getenv("DATABASE_REPLICA_URL") or None
 
-engine = create_async_engine(
-    DB_URL,
-    pool_pre_ping=True,
-    echo=os.getenv("SQL_ECHO", "0") == "1",
-)
+def _make_engine(url: str, role: str) -> AsyncEngine:
+    u, kw = make_url(url), {}
+    if u.get_backend_name() != "sqlite":
+        # SQLite（压测夹具）使用 NullPool，不接受池参数
+        kw.update(pool_size=config.DB_POOL_SIZE, max_overflow=config.DB_MAX_OVERFLOW,
+                  pool_timeout=config.DB_POOL_TIMEOUT, pool_recycle=config.DB_POOL_RECYCLE)
+    if u.get_driver_name() == "asyncpg":
+        # SQLAlchemy 适配层与 asyncpg 各有一层预编译语句缓存（按连接）；经 pgbouncer 事务模式时需设为 0
+        kw["connect_args"] = {
+            "prepared_statement_cache_size": config.DB_STATEMENT_CACHE_SIZE,
+            "statement_cache_size": config.DB_STATEMENT_CACHE_SIZE,
+        }
+    eng = create_async_engine(url, pool_pre_ping=True, echo=os.getenv("SQL_ECHO", "0") == "1", **kw)
+    # 记录连接池 checkout 等待时间与连接数（/metrics: db_pool_checkout_wait_seconds / db_pool_connections）
+    instrument_pool(eng.sync_engine.pool, role)
+    return eng
+
+engine = _make_engine(DB_URL, "primary")
+replica_engine = _make_engine(REPLICA_URL, "replica") if REPLICA_URL else engine
+HAS_REPLICA = replica_engine is not engine
+
+# 只读查询走副本：session.execute(stmt, bind_arguments=READ)。写入、刷新与未指定的查询仍走主库
+READ = {"bind": replica_engine.sync_engine}
 
 AsyncSessionLocal = async_sessionmaker(engine, expire_on_commit=False)
+
+def _pool_stats(eng: AsyncEngine) -> dict:
+    pool = eng.sync_engine.pool
+    out = {"class": type(pool).__name__}
+    for k in ("size", "checkedin", "checkedout", "overflow"):
+        fn = getattr(pool, k, None)
+        if fn is not None:
+            out[k] = fn()
+    return out
+
+def pool_stats() -> dict:
+    stats = {"primary": _pool_stats(engine)}
+    if HAS_REPLICA:
+        stats["replica"] = _pool_stats(replica_engine)
+    return stats
@@ -4,7 +4,7 @@ from __future__ import annotations
 from datetime import datetime
 from typing import Optional
 
-from sqlalchemy import String, Integer, DateTime, Text, ForeignKey, func
+from sqlalchemy import String, Integer, DateTime, Text, ForeignKey, Float, func
 from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import Mapped, mapped_column
 
@@ -56,6 +56,12 @@ class Question(Base):
     answer_content: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
     scoring_criteria: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
 
+    # 规范化维度集合键（升序逗号分隔，如 "101,103"），用于题库复用查找；兜底题为空，不参与复用
+    dim_key: Mapped[Optional[str]] = mapped_column(String(200), nullable=True)
+
+    # 题目内容的 md5（见 repo.content_hash），唯一；写入时 ON CONFLICT DO NOTHING 去重。兜底题为空
+    content_hash: Mapped[Optional[str]] = mapped_column(String(32), nullable=True, unique=True)
+
 
 class QuestionKdRelation(Base):
     __tablename__ = "question_kd_relation"
@@ -83,3 +89,17 @@ class AnswerRecord(Base):
     dimension_scores: Mapped[Optional[dict]] = mapped_column(JSONB, nullable=True)
     comments: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
     hit_score_points: Mapped[Optional[list]] = mapped_column(JSONB, nullable=True)
+
+
+# 按 (用户, 维度) 汇总的掌握度，写作答记录时增量更新；得分均按 本题得分/满分 归一到 0-1
+class UserDimMastery(Base):
+    __tablename__ = "user_dim_mastery"
+
+    user_id: Mapped[int] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    kd_id: Mapped[int] = mapped_column(ForeignKey("knowledge_dimension.id", ondelete="CASCADE"), primary_key=True)
+
+    attempts: Mapped[int] = mapped_column(Integer, default=0)
+    score_sum: Mapped[float] = mapped_column(Float, default=0.0)
+    # 指数加权平均，近期作答权重更高（MASTERY_EWMA_ALPHA）
+    ewma_score: Mapped[Optional[float]] = mapped_column(Float, nullable=True)
+    last_attempt: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), nullable=True)
@@ -1,15 +1,38 @@
-from sqlalchemy import select, func
+import hashlib
+from typing import Iterable, Optional, Sequence
+from sqlalchemy import select, insert, update, delete, func
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import aliased
 from sqlalchemy.ext.asyncio import AsyncSession
-from app.db import models as m
+from app.db import models as m, writebehind
+from app.db.base import HAS_REPLICA, READ
+from app.db.rollup import mastery_upsert
+from app.cache import question as question_cache
+from app.cache.question import GradingView
 
-async def sample_dimensions(session: AsyncSession, k:int) -> list[int]:
+# 只读查询通过 bind_arguments=READ 走只读副本；按 ID 读取时副本查不到的（复制延迟）再回主库查一次
+
+async def list_dimensions(session: AsyncSession) -> list[tuple[int, str]]:
     rows = (await session.execute(
-        select(m.KnowledgeDimension.id).order_by(func.random()).limit(k)
-    )).scalars().all()
-    return rows
+        select(m.KnowledgeDimension.id, m.KnowledgeDimension.name).order_by(m.KnowledgeDimension.id),
+        bind_arguments=READ,
+    )).all()
+    return [(r.id, r.name) for r in rows]
+
+def dim_key(dims: Iterable[int]) -> str:
+    """规范化维度集合键：去重、升序、逗号分隔。"""
+    return ",".join(str(d) for d in sorted(set(dims)))
 
-async def insert_question(session: AsyncSession, *, item_json: dict) -> int:
-    q = m.Question(
+def content_hash(question_type: int, difficulty: int, title: str, material: Optional[str],
+                 answer_content: Optional[str], scoring_criteria: Optional[str]) -> str:
+    """题目内容哈希，与 ittc_schema.sql 中回填用的 md5(concat_ws(E'\\x1f', ...)) 一致。"""
+    parts = (str(question_type), str(difficulty), title, material or "", answer_content or "", scoring_criteria or "")
+    return hashlib.md5("\x1f".join(parts).encode("utf-8")).hexdigest()
+
+def _question_row(item_json: dict, reusable: bool = True) -> dict:
+    """兜底模板题内容相同，不写 dim_key 与 content_hash（唯一索引允许多个 NULL）。"""
+    key = dim_key(item_json["维度"]) if reusable else None
+    return dict(
         question_type=item_json["题型"],
         difficulty=item_json["难度"],
         title=item_json["题目"],
@@ -20,20 +43,163 @@ async def insert_question(session: AsyncSession, *, item_json: dict) -> int:
         score_points=item_json.get("核心知识点"),
         answer_content=item_json.get("参考答案"),
         scoring_criteria=item_json.get("评分标准"),
+        dim_key=key if key and len(key) <= 200 else None,
+        content_hash=content_hash(item_json["题型"], item_json["难度"], item_json["题目"], item_json["材料"],
+                                  item_json.get("参考答案"), item_json.get("评分标准")) if reusable else None,
     )
-    session.add(q)
-    await session.flush()
-    for kd in item_json["维度"]:
-        session.add(m.QuestionKdRelation(q_id=q.id, kd_id=kd))
+
+def question_insert(dialect: str):
+    """INSERT INTO question ... ON CONFLICT (content_hash) DO NOTHING；与 app 其他部分一致只面向 Postgres，
+    SQLite 仅供 bench 夹具使用。"""
+    ins = sqlite.insert if dialect == "sqlite" else postgresql.insert
+    return ins(m.Question).on_conflict_do_nothing(index_elements=["content_hash"])
+
+async def _insert_dedup(session: AsyncSession, rows: list[dict]) -> tuple[list[int], list[bool]]:
+    """按 content_hash 去重写入题目，返回与 rows 对应的 (题目ID, 是否新写入)；内容已存在的取已有题目的 ID。"""
+    stmt = question_insert(session.get_bind().dialect.name).returning(m.Question.id, m.Question.content_hash)
+    new = {h: i for i, h in (await session.execute(stmt, rows)).all()}
+    missing = {r["content_hash"] for r in rows} - new.keys()
+    old = dict((await session.execute(
+        select(m.Question.content_hash, m.Question.id).where(m.Question.content_hash.in_(missing))
+    )).all()) if missing else {}
+    ids, fresh, seen = [], [], set()
+    for r in rows:
+        h = r["content_hash"]
+        ids.append(new[h] if h in new else old[h])
+        # 同一批内重复的内容只有第一条算新写入
+        fresh.append(h in new and h not in seen)
+        seen.add(h)
+    return ids, fresh
+
+async def _wb_put(item_jsons: list[dict], rows: list[dict]) -> list[int]:
+    # 写后模式：先取号再入队，由后台批量落库。不写 content_hash：ID 已返回给调用方，
+    # 落库时撞上唯一索引只能进死信，宁可放弃这几条的导入去重
+    ids = [await writebehind.allocate_id("question") for _ in rows]
+    await writebehind.put([("question", {"id": i, **row, "content_hash": None}) for i, row in zip(ids, rows)]
+                          + [("question_kd_relation", {"q_id": i, "kd_id": kd})
+                             for i, it in zip(ids, item_jsons) for kd in it["维度"]])
+    return ids
+
+async def insert_question(session: AsyncSession, *, item_json: dict, reusable: bool = True) -> int:
+    """reusable=False（兜底模板题）时不写 dim_key，不会被题库复用。
+    内容与已有题目完全相同时不重复写入，返回已有题目的 ID。"""
+    row = _question_row(item_json, reusable)
+    if writebehind.enabled():
+        return (await _wb_put([item_json], [row]))[0]
+    if row["content_hash"] is None:
+        qid = (await session.execute(insert(m.Question).returning(m.Question.id), row)).scalar_one()
+        fresh = True
+    else:
+        (qid,), (fresh,) = await _insert_dedup(session, [row])
+    if fresh:
+        await session.execute(insert(m.QuestionKdRelation), [{"q_id": qid, "kd_id": kd} for kd in item_json["维度"]])
     await session.commit()
-    return q.id
+    return qid
 
-async def get_question(session: AsyncSession, q_id:int) -> m.Question | None:
-    return await session.get(m.Question, q_id)
+async def insert_questions(session: AsyncSession, item_jsons: list[dict]) -> list[int]:
+    """批量写入题目及其 question_kd_relation：题目一条多行 INSERT ... ON CONFLICT DO NOTHING RETURNING，
+    关联一次 executemany，同一事务提交。返回与 item_jsons 对应的题目 ID（内容重复的为已有题目的 ID）。"""
+    if not item_jsons:
+        return []
+    rows = [_question_row(it) for it in item_jsons]
+    if writebehind.enabled():
+        return await _wb_put(item_jsons, rows)
+    ids, fresh = await _insert_dedup(session, rows)
+    rels = [{"q_id": i, "kd_id": kd} for i, f, it in zip(ids, fresh, item_jsons) if f for kd in it["维度"]]
+    if rels:
+        await session.execute(insert(m.QuestionKdRelation), rels)
+    await session.commit()
+    return ids
 
-async def insert_answer_record(session: AsyncSession, *, user_id:int|None, q_id:int,
-                               original_answer:str, grading:dict) -> int:
-    row = m.AnswerRecord(
+async def find_reusable_question(session: AsyncSession, *, dims: Iterable[int], difficulty: int,
+                                 question_type: int, user_id: int | None,
+                                 candidates: int = 200) -> m.Question | None:
+    """题库复用：按 (dim_key, 难度, 题型) 走 idx_question_dim_key 取最近 candidates 道，
+    排除该用户已作答过的题（idx_answer_record_user），从中随机返回一道。一条 SQL。"""
+    q = m.Question
+    stmt = select(q).where(q.dim_key == dim_key(dims), q.difficulty == difficulty, q.question_type == question_type)
+    if user_id is not None:
+        answered = select(m.AnswerRecord.id).where(m.AnswerRecord.user_id == user_id, m.AnswerRecord.q_id == q.id)
+        stmt = stmt.where(~answered.exists())
+    cand = stmt.order_by(q.id.desc()).limit(candidates).subquery()
+    picked = aliased(q, cand)
+    return (await session.execute(select(picked).order_by(func.random()).limit(1),
+                                  bind_arguments=READ)).scalar_one_or_none()
+
+_VIEW_COLUMNS = (m.Question.id, m.Question.question_type, m.Question.score, m.Question.word_limit,
+                 m.Question.score_points, m.Question.scoring_criteria, m.Question.title,
+                 m.Question.answer_content)
+
+_VIEW_FIELDS = [k for k in GradingView.__dataclass_fields__ if k != "dims"]
+
+def _view_of(row, dims: Optional[list] = None) -> GradingView:
+    return GradingView(**{k: (row[k] if isinstance(row, dict) else getattr(row, k)) for k in _VIEW_FIELDS}, dims=dims)
+
+async def _dim_names(session: AsyncSession, q_ids: Sequence[int]) -> dict[int, list[str]]:
+    rel, kd = m.QuestionKdRelation, m.KnowledgeDimension
+    rows = (await session.execute(
+        select(rel.q_id, kd.name).join(kd, kd.id == rel.kd_id).where(rel.q_id.in_(q_ids)).order_by(rel.q_id, rel.kd_id),
+        bind_arguments=READ,
+    )).all()
+    out: dict[int, list[str]] = {}
+    for q_id, name in rows:
+        out.setdefault(q_id, []).append(name)
+    return out
+
+async def get_grading_views(session: AsyncSession, q_ids: Iterable[int]) -> dict[int, GradingView]:
+    """只取评分需要的列，避免读取 material 等大字段。"""
+    ids = list(set(q_ids))
+    out = {}
+    for i in ids:
+        pending = writebehind.pending_question(i)
+        if pending is not None:
+            out[i] = _view_of(pending)
+    rest = [i for i in ids if i not in out]
+    rows = []
+    if rest:
+        rows = (await session.execute(select(*_VIEW_COLUMNS).where(m.Question.id.in_(rest)), bind_arguments=READ)).all()
+    lagging = [i for i in rest if i not in {r.id for r in rows}] if HAS_REPLICA else []
+    if lagging:
+        rows += (await session.execute(select(*_VIEW_COLUMNS).where(m.Question.id.in_(lagging)))).all()
+    if rows:
+        dims = await _dim_names(session, [r.id for r in rows])
+        # 已落库的题目 dims 不为 None（没有维度关系时为空列表），与写后队列中的题目区分
+        out.update({r.id: _view_of(r, dims.get(r.id, [])) for r in rows})
+    missing = [i for i in rest if i not in out]
+    if missing and writebehind.enabled():
+        # 其他进程写后入队、尚未落库的题目
+        out.update({i: _view_of(row) for i, row in (await writebehind.remote_pending_questions(missing)).items()})
+    return out
+
+async def get_grading_view(session: AsyncSession, q_id: int) -> GradingView | None:
+    return (await get_grading_views(session, [q_id])).get(q_id)
+
+_HASHED = ("question_type", "difficulty", "title", "material", "answer_content", "scoring_criteria")
+
+async def update_question(session: AsyncSession, q_id: int, **fields) -> bool:
+    """修改题目并清理评分缓存；改动参与内容哈希的字段时同时重算 content_hash。"""
+    if any(k in fields for k in _HASHED):
+        row = (await session.execute(select(*(getattr(m.Question, k) for k in _HASHED))
+                                     .where(m.Question.id == q_id).with_for_update())).first()
+        if row is None:
+            return False
+        merged = {**row._asdict(), **{k: v for k, v in fields.items() if k in _HASHED}}
+        fields["content_hash"] = content_hash(*(merged[k] for k in _HASHED))
+    n = (await session.execute(update(m.Question).where(m.Question.id == q_id).values(**fields))).rowcount
+    await session.commit()
+    await question_cache.invalidate(q_id)
+    return n > 0
+
+async def delete_question(session: AsyncSession, q_id: int) -> bool:
+    """删除题目及其维度关系并清理评分缓存；已有作答记录的题目由外键拒绝（IntegrityError）。"""
+    await session.execute(delete(m.QuestionKdRelation).where(m.QuestionKdRelation.q_id == q_id))
+    n = (await session.execute(delete(m.Question).where(m.Question.id == q_id))).rowcount
+    await session.commit()
+    await question_cache.invalidate(q_id)
+    return n > 0
+
+def _answer_row(*, user_id:int|None, q_id:int, original_answer:str, grading:dict) -> dict:
+    return dict(
         user_id=user_id, q_id=q_id, answer_type=1,
         original_answer=original_answer,
         total_score=grading["total_score"],
@@ -42,6 +208,56 @@ async def insert_answer_record(session: AsyncSession, *, user_id:int|None, q_id:
         comments=grading.get("comments"),
         hit_score_points=grading.get("hit_score_points"),
     )
+
+def _mastery_rows(records: list[dict]) -> list[dict]:
+    # 匿名作答不计入掌握度
+    return [dict(user_id=r["user_id"], q_id=r["q_id"], total_score=r["grading"]["total_score"])
+            for r in records if r["user_id"] is not None]
+
+async def _update_mastery(session: AsyncSession, rows: list[dict]) -> None:
+    dialect = session.get_bind().dialect.name
+    for row in rows:
+        await session.execute(mastery_upsert(dialect, **row))
+
+async def insert_answer_record(session: AsyncSession, *, user_id:int|None, q_id:int,
+                               original_answer:str, grading:dict) -> int:
+    mastery = _mastery_rows([dict(user_id=user_id, q_id=q_id, grading=grading)])
+    if writebehind.enabled():
+        rec_id = await writebehind.allocate_id("answer_record")
+        await writebehind.put([("answer_record", {"id": rec_id, **_answer_row(
+            user_id=user_id, q_id=q_id, original_answer=original_answer, grading=grading)})]
+            + [("user_dim_mastery", r) for r in mastery])
+        return rec_id
+    row = m.AnswerRecord(**_answer_row(user_id=user_id, q_id=q_id, original_answer=original_answer, grading=grading))
     session.add(row)
+    await session.flush()
+    # 与作答记录同一事务更新掌握度汇总
+    await _update_mastery(session, mastery)
     await session.commit()
     return row.id
+
+async def insert_answer_records(session: AsyncSession, records: list[dict]) -> list[int]:
+    """批量写入作答记录：一条多行 INSERT ... RETURNING，一次提交。records 的键同 insert_answer_record 参数。"""
+    if not records:
+        return []
+    mastery = _mastery_rows(records)
+    if writebehind.enabled():
+        ids = [await writebehind.allocate_id("answer_record") for _ in records]
+        await writebehind.put([("answer_record", {"id": i, **_answer_row(**r)}) for i, r in zip(ids, records)]
+                              + [("user_dim_mastery", r) for r in mastery])
+        return ids
+    ids = (await session.execute(
+        insert(m.AnswerRecord).returning(m.AnswerRecord.id, sort_by_parameter_order=True),
+        [_answer_row(**r) for r in records],
+    )).scalars().all()
+    await _update_mastery(session, mastery)
+    await session.commit()
+    return list(ids)
+
+async def get_mastery(session: AsyncSession, user_id: int) -> dict[int, m.UserDimMastery]:
+    """读取用户在各维度上的掌握度汇总（主键前缀扫描，行数 ≤ 维度数）。"""
+    rows = (await session.execute(
+        select(m.UserDimMastery).where(m.UserDimMastery.user_id == user_id),
+        bind_arguments=READ,
+    )).scalars().all()
+    return {r.kd_id: r for r in rows}
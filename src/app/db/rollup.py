@@ -0,0 +1,31 @@
+from sqlalchemy import Float, func, literal, select
+from sqlalchemy.dialects import postgresql, sqlite
+from app import config
+from app.db import models as m
+
+# 作答记录写入时同步更新 user_dim_mastery：一条 INSERT ... SELECT ... ON CONFLICT DO UPDATE，
+# 维度取自 question_kd_relation，归一化得分 = total_score / question.score。
+
+_COLUMNS = ["user_id", "kd_id", "attempts", "score_sum", "ewma_score", "last_attempt"]
+
+def mastery_upsert(dialect: str, *, user_id: int, q_id: int, total_score: float):
+    rel, q = m.QuestionKdRelation, m.Question
+    ratio = literal(float(total_score), Float) / func.coalesce(func.nullif(q.score, 0), 10)
+    src = (
+        select(literal(user_id), rel.kd_id, literal(1), ratio, ratio, func.now())
+        .join(q, q.id == rel.q_id)
+        .where(rel.q_id == q_id)
+    )
+    # 与 app 其他部分一致只面向 Postgres；SQLite 仅供 bench 夹具使用
+    ins = sqlite.insert if dialect == "sqlite" else postgresql.insert
+    stmt = ins(m.UserDimMastery).from_select(_COLUMNS, src)
+    t, new, a = m.UserDimMastery.__table__.c, stmt.excluded, config.MASTERY_EWMA_ALPHA
+    return stmt.on_conflict_do_update(
+        index_elements=["user_id", "kd_id"],
+        set_={
+            "attempts": t.attempts + 1,
+            "score_sum": t.score_sum + new.score_sum,
+            "ewma_score": func.coalesce(t.ewma_score * (1 - a) + new.ewma_score * a, new.ewma_score),
+            "last_attempt": new.last_attempt,
+        },
+    )
@@ -0,0 +1,341 @@
+import asyncio, json, logging, os, socket, time
+from collections import defaultdict, deque
+from typing import Deque, Dict, Iterable, List, Optional, Tuple
+from sqlalchemy import insert, text
+from sqlalchemy.exc import IntegrityError
+from app import config
+from app.db import models as m
+from app.db.base import AsyncSessionLocal
+from app.db.rollup import mastery_upsert
+from app.deps import get_redis
+
+logger = logging.getLogger("db.writebehind")
+
+# 写后持久化（write-behind）：请求内只分配 ID 并入队，后台 flusher 每 WRITE_BEHIND_FLUSH_MS 毫秒
+# 或攒够 WRITE_BEHIND_BATCH_ROWS 行时，用多行 INSERT 一次事务写入。
+# WRITE_BEHIND_MODE: off=同步写（默认）；memory=进程内队列；redis=Redis Stream（进程崩溃不丢数据）
+# 写入失败的组稍后重试（外键依赖的题目可能还在其他消费者的批次里），重试 WRITE_BEHIND_MAX_ATTEMPTS 次
+# 仍失败的转入死信 wb:dead。
+
+Row = Tuple[str, dict]
+
+_TABLES = {
+    "question": m.Question,
+    "question_kd_relation": m.QuestionKdRelation,
+    "answer_record": m.AnswerRecord,
+}
+# 按外键依赖顺序写入
+_ORDER = ("question", "question_kd_relation", "answer_record")
+# 不是表行而是掌握度增量（user_id, q_id, total_score），在作答记录之后逐条 upsert
+_MASTERY = "user_dim_mastery"
+
+_STREAM = "wb:rows"
+_DEAD = "wb:dead"
+_GROUP = "wb"
+_CONSUMER = f"{socket.gethostname()}-{os.getpid()}"
+# 已入队未落库的题目行，供其他进程在落库前读到（wb:pq:<id>）
+_PENDING_PREFIX = "wb:pq:"
+
+# memory 模式的队列元素为 (已失败次数, 一组行)
+_queue: Optional[asyncio.Queue] = None
+# memory 模式中等待重试的组：定时器到点后重新入队，退出时由 drain 一并处理
+_retrying: Dict[int, Tuple[asyncio.TimerHandle, Tuple[int, List[Row]]]] = {}
+_ids: Dict[str, Deque[int]] = defaultdict(deque)
+_id_lock = asyncio.Lock()
+# 本进程已入队但尚未落库的题目，供 repo.get_grading_views 读到自己刚写的数据；
+# 其他进程通过 Redis 中的 wb:pq:<id> 读取；超过 WRITE_BEHIND_PENDING_TTL 秒的条目直接清理
+_pending_questions: Dict[int, Tuple[float, dict]] = {}
+_stats = {"enqueued": 0, "flushed": 0, "batches": 0, "retried": 0, "reclaimed": 0, "dead": 0}
+
+def enabled() -> bool:
+    return config.WRITE_BEHIND_MODE in ("memory", "redis")
+
+async def allocate_id(table: str) -> int:
+    """预先从序列批量取号，请求内即可返回 question_id / answer_record_id。"""
+    pool = _ids[table]
+    if not pool:
+        async with _id_lock:
+            if not pool:
+                async with AsyncSessionLocal() as session:
+                    rows = (await session.execute(
+                        text("SELECT nextval(pg_get_serial_sequence(:t, 'id')) FROM generate_series(1, :n)"),
+                        {"t": table, "n": config.WRITE_BEHIND_ID_BLOCK},
+                    )).scalars().all()
+                pool.extend(rows)
+    return pool.popleft()
+
+def pending_question(q_id: int) -> Optional[dict]:
+    """本进程入队的题目（不访问 Redis）。"""
+    hit = _pending_questions.get(q_id)
+    return hit[1] if hit else None
+
+async def remote_pending_questions(q_ids: Iterable[int]) -> Dict[int, dict]:
+    """其他进程入队、尚未落库的题目；数据库查不到时再调用。Redis 异常按未找到处理。"""
+    ids = list(q_ids)
+    if not ids or not enabled():
+        return {}
+    try:
+        r = await get_redis()
+        raws = await r.mget([f"{_PENDING_PREFIX}{i}" for i in ids])
+    except Exception as e:
+        logger.warning(f"读取待落库题目失败: {e}")
+        return {}
+    return {i: json.loads(raw) for i, raw in zip(ids, raws) if raw}
+
+async def put(rows: List[Row]) -> None:
+    """一组行（同一业务对象）整体入队，保证落库时顺序与原子性。"""
+    now = time.monotonic()
+    questions = [row for t, row in rows if t == "question"]
+    for row in questions:
+        _pending_questions[row["id"]] = (now, row)
+    if len(_pending_questions) > 1000:
+        for qid in [k for k, (ts, _) in _pending_questions.items() if now - ts > config.WRITE_BEHIND_PENDING_TTL]:
+            _pending_questions.pop(qid, None)
+    _stats["enqueued"] += len(rows)
+    if config.WRITE_BEHIND_MODE == "redis":
+        r = await get_redis()
+        pipe = r.pipeline()
+        _publish_pending(pipe, questions)
+        pipe.xadd(_STREAM, {"rows": json.dumps(rows, ensure_ascii=False, default=str)})
+        await pipe.execute()
+        return
+    _get_queue().put_nowait((0, rows))
+    if questions:
+        try:
+            r = await get_redis()
+            pipe = r.pipeline()
+            _publish_pending(pipe, questions)
+            await pipe.execute()
+        except Exception as e:
+            logger.warning(f"发布待落库题目失败，其他进程落库前读不到: {e}")
+
+def _publish_pending(pipe, questions: List[dict]) -> None:
+    for row in questions:
+        pipe.set(f"{_PENDING_PREFIX}{row['id']}", json.dumps(row, ensure_ascii=False, default=str),
+                 ex=config.WRITE_BEHIND_PENDING_TTL)
+
+def _get_queue() -> asyncio.Queue:
+    global _queue
+    if _queue is None:
+        _queue = asyncio.Queue()
+    return _queue
+
+async def _write(rows: List[Row]) -> None:
+    by_table: Dict[str, List[dict]] = defaultdict(list)
+    for t, row in rows:
+        by_table[t].append(row)
+    async with AsyncSessionLocal() as session:
+        for t in _ORDER:
+            if by_table[t]:
+                await session.execute(insert(_TABLES[t]), by_table[t])
+        dialect = session.get_bind().dialect.name
+        for row in by_table[_MASTERY]:
+            await session.execute(mastery_upsert(dialect, **row))
+        await session.commit()
+
+async def _flush(groups: List[List[Row]]) -> List[int]:
+    """写入一批；整批失败时逐组重试以隔离坏数据。返回写入失败的组下标，由调用方安排重试或转入死信。"""
+    if not groups:
+        return []
+    t0 = time.perf_counter()
+    failed: List[int] = []
+    try:
+        await _write([row for g in groups for row in g])
+    except Exception as e:
+        logger.exception(f"写后批量落库失败，逐组重试 groups={len(groups)}: {e}")
+        for i, g in enumerate(groups):
+            try:
+                await _write(g)
+            except IntegrityError as e2:
+                # 多为外键：依赖的题目还在其他消费者的批次里，稍后重试即可
+                logger.warning(f"写后落库违反约束，稍后重试: {e2.orig}")
+                failed.append(i)
+            except Exception as e2:
+                logger.error(f"写后落库失败，稍后重试: {e2}")
+                failed.append(i)
+    failed_set = set(failed)
+    ok = [g for i, g in enumerate(groups) if i not in failed_set]
+    ok_rows = sum(len(g) for g in ok)
+    _stats["flushed"] += ok_rows
+    _stats["batches"] += 1
+    done = [row["id"] for g in ok for t, row in g if t == "question"]
+    for qid in done:
+        _pending_questions.pop(qid, None)
+    if done:
+        try:
+            r = await get_redis()
+            await r.delete(*(f"{_PENDING_PREFIX}{qid}" for qid in done))
+        except Exception as e:
+            logger.warning(f"清理待落库题目失败（到期自动清理）: {e}")
+    logger.info(f"写后落库 rows={ok_rows} groups={len(groups)} failed={len(failed)} "
+                f"用时 {(time.perf_counter() - t0) * 1000:.0f}ms")
+    return failed
+
+async def _dead_letter(groups: List[List[Row]]) -> None:
+    _stats["dead"] += len(groups)
+    for g in groups:
+        logger.error(f"写后落库多次失败，转入死信 rows={json.dumps(g, ensure_ascii=False, default=str)[:2000]}")
+    try:
+        r = await get_redis()
+        pipe = r.pipeline()
+        for g in groups:
+            pipe.xadd(_DEAD, {"rows": json.dumps(g, ensure_ascii=False, default=str)})
+        await pipe.execute()
+    except Exception as e:
+        # 死信也写不进去时，完整内容只剩日志
+        logger.critical(f"死信写入失败，数据仅保留在日志中: {e} "
+                        f"rows={json.dumps(groups, ensure_ascii=False, default=str)}")
+
+# ---- memory 模式 ----
+
+async def _collect_memory() -> List[Tuple[int, List[Row]]]:
+    q = _get_queue()
+    items = [await q.get()]
+    n = len(items[0][1])
+    deadline = time.monotonic() + config.WRITE_BEHIND_FLUSH_MS / 1000
+    while n < config.WRITE_BEHIND_BATCH_ROWS:
+        timeout = deadline - time.monotonic()
+        if timeout <= 0:
+            break
+        try:
+            item = await asyncio.wait_for(q.get(), timeout)
+        except asyncio.TimeoutError:
+            break
+        items.append(item)
+        n += len(item[1])
+    return items
+
+def _requeue(key: int) -> None:
+    _, item = _retrying.pop(key)
+    _get_queue().put_nowait(item)
+
+async def _retry_later(items: List[Tuple[int, List[Row]]]) -> None:
+    """失败的组按指数退避重新入队（不阻塞 flusher）；达到重试上限的转入死信。"""
+    dead = []
+    for attempts, rows in items:
+        attempts += 1
+        if attempts >= config.WRITE_BEHIND_MAX_ATTEMPTS:
+            dead.append(rows)
+            continue
+        _stats["retried"] += 1
+        key = id(rows)
+        handle = asyncio.get_running_loop().call_later(min(2 ** attempts, 30), _requeue, key)
+        _retrying[key] = (handle, (attempts, rows))
+    if dead:
+        await _dead_letter(dead)
+
+async def _run_memory() -> None:
+    while True:
+        items = await _collect_memory()
+        failed = await _flush([rows for _, rows in items])
+        if failed:
+            await _retry_later([items[i] for i in failed])
+
+# ---- redis 模式 ----
+
+async def _ensure_group(r) -> None:
+    try:
+        await r.xgroup_create(_STREAM, _GROUP, id="0", mkstream=True)
+    except Exception as e:
+        if "BUSYGROUP" not in str(e):
+            raise
+
+async def _handle(r, entries) -> None:
+    # 已被删除的待确认消息 fields 为空，直接确认掉
+    stale = [eid for eid, fields in entries if not fields]
+    if stale:
+        await r.xack(_STREAM, _GROUP, *stale)
+    entries = [(eid, fields) for eid, fields in entries if fields]
+    if not entries:
+        return
+    groups = [json.loads(fields["rows"]) for _, fields in entries]
+    failed = set(await _flush(groups))
+    # 失败的消息不确认，留在 PEL 中空闲超时后由 _reclaim 重新投递；投递次数达到上限的转入死信
+    done = [eid for i, (eid, _) in enumerate(entries) if i not in failed]
+    dead = []
+    for i in failed:
+        eid = entries[i][0]
+        info = await r.xpending_range(_STREAM, _GROUP, min=eid, max=eid, count=1)
+        if info and info[0]["times_delivered"] >= config.WRITE_BEHIND_MAX_ATTEMPTS:
+            dead.append(groups[i])
+            done.append(eid)
+        else:
+            _stats["retried"] += 1
+    if dead:
+        await _dead_letter(dead)
+    if done:
+        await r.xack(_STREAM, _GROUP, *done)
+        await r.xdel(_STREAM, *done)
+
+async def _reclaim(r) -> None:
+    # 接管空闲超时的待确认消息：已退出的消费者（进程重启/迁移后消费者名变了）遗留的，以及本进程失败待重试的
+    start = "0-0"
+    while True:
+        resp = await r.xautoclaim(_STREAM, _GROUP, _CONSUMER, min_idle_time=config.WRITE_BEHIND_CLAIM_IDLE_MS,
+                                  start_id=start, count=config.WRITE_BEHIND_BATCH_ROWS)
+        start, entries = resp[0], resp[1]
+        if entries:
+            _stats["reclaimed"] += len(entries)
+            logger.warning(f"接管空闲超时的写后消息 n={len(entries)}")
+            await _handle(r, entries)
+        if start in ("0-0", b"0-0"):
+            return
+
+async def _run_redis() -> None:
+    r = await get_redis()
+    await _ensure_group(r)
+    # 先处理本消费者名下未确认的消息，再读新消息；其他消费者遗留的消息由 _reclaim 定期接管
+    cursor = "0"
+    next_claim = 0.0
+    while True:
+        if time.monotonic() >= next_claim:
+            await _reclaim(r)
+            next_claim = time.monotonic() + max(1.0, config.WRITE_BEHIND_CLAIM_IDLE_MS / 2000)
+        resp = await r.xreadgroup(_GROUP, _CONSUMER, {_STREAM: cursor},
+                                  count=config.WRITE_BEHIND_BATCH_ROWS, block=max(1, config.WRITE_BEHIND_FLUSH_MS))
+        entries = resp[0][1] if resp else []
+        if cursor != ">":
+            if not entries:
+                cursor = ">"
+                continue
+            # 失败的消息仍留在 PEL，游标前移避免反复读到
+            cursor = entries[-1][0]
+        await _handle(r, entries)
+
+async def flusher() -> None:
+    """后台落库任务，在 app lifespan 中启动；被取消时尽量把进程内队列刷完。"""
+    logger.info(f"写后持久化启动 mode={config.WRITE_BEHIND_MODE} consumer={_CONSUMER} "
+                f"flush={config.WRITE_BEHIND_FLUSH_MS}ms batch={config.WRITE_BEHIND_BATCH_ROWS}")
+    run = _run_redis if config.WRITE_BEHIND_MODE == "redis" else _run_memory
+    while True:
+        try:
+            await run()
+        except asyncio.CancelledError:
+            await drain()
+            raise
+        except Exception as e:
+            logger.exception(f"写后持久化任务异常，1s 后重启: {e}")
+            await asyncio.sleep(1)
+
+async def drain() -> None:
+    """退出前把进程内队列与等待重试的组刷完，仍失败的转入死信。"""
+    items = []
+    for handle, item in _retrying.values():
+        handle.cancel()
+        items.append(item)
+    _retrying.clear()
+    while _queue is not None and not _queue.empty():
+        items.append(_queue.get_nowait())
+    if items:
+        failed = await _flush([rows for _, rows in items])
+        if failed:
+            await _dead_letter([items[i][1] for i in failed])
+
+def stats() -> dict:
+    return {
+        "mode": config.WRITE_BEHIND_MODE,
+        **_stats,
+        "queued": _queue.qsize() if _queue is not None else 0,
+        "retrying": len(_retrying),
+        "pending_questions": len(_pending_questions),
+    }
@@ -1,24 +1,48 @@
-import os, asyncio
 import redis.asyncio as redis
+from app import config
 from app.db.base import AsyncSessionLocal
+# deps 与 ratelimit 互相导入：双方都只导入模块、调用时再取属性，任一方先被导入都不会取到未初始化的名字
+from app.utils import ratelimit
 
+# 每个进程一个 Redis 连接池：lifespan / worker 启动时 init_redis()，退出时 close_redis()。
+# 连接用满时排队等待（BlockingConnectionPool），而不是直接报 Too many connections
 _redis: redis.Redis | None = None
 
 async def get_db():
     async with AsyncSessionLocal() as s:
         yield s
 
+def _new_redis() -> redis.Redis:
+    pool = redis.BlockingConnectionPool.from_url(
+        config.REDIS_URL,
+        decode_responses=True,
+        max_connections=config.REDIS_MAX_CONNECTIONS,
+        timeout=config.REDIS_POOL_TIMEOUT,
+        health_check_interval=config.REDIS_HEALTH_CHECK_INTERVAL,
+        socket_keepalive=True,
+    )
+    return redis.Redis(connection_pool=pool)
+
+async def init_redis() -> None:
+    global _redis
+    if _redis is None:
+        _redis = _new_redis()
+
+async def close_redis() -> None:
+    global _redis
+    if _redis is not None:
+        r, _redis = _redis, None
+        await r.aclose()
+
 async def get_redis() -> redis.Redis:
+    # 脚本等未经 lifespan 的调用方按需创建
     global _redis
     if _redis is None:
-        _redis = redis.from_url(os.getenv("REDIS_URL", "redis://localhost:6379/0"), decode_responses=True)
+        _redis = _new_redis()
     return _redis
 
-# 简单令牌桶
+# 令牌桶（Redis Lua 原子实现，见 app.utils.ratelimit）
 async def rate_limit(r: redis.Redis, key: str, limit:int=10, window:int=60) -> bool:
-    # 60s 内最多 10 次
-    pipe = r.pipeline()
-    pipe.incr(key)
-    pipe.expire(key, window)
-    cnt, _ = await pipe.execute()
-    return int(cnt) <= limit
+    # 容量 10，每 60s 补满
+    granted, _ = await ratelimit.take(r, [(key, limit)], window)
+    return granted > 0
@@ -0,0 +1,163 @@
+import asyncio, logging, os, re, time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Awaitable, Callable, Deque, List, Optional, TypeVar
+from app import config
+from .resilience import is_failure
+
+logger = logging.getLogger("llm.backends")
+
+T = TypeVar("T")
+
+def _sanitize_base_url(raw: str) -> str:
+    raw = (raw or "").strip()
+    raw = re.sub(r"\s+", "", raw)
+    if not raw:
+        raise RuntimeError("缺少 LLM_BASE_URL（例如 http://10.110.3.61:9997/v1）")
+    if not raw.startswith(("http://","https://")):
+        raw = "http://" + raw
+    return raw[:-1] if raw.endswith("/") else raw
+
+class Backend:
+    """一个 OpenAI 兼容推理副本：记录在途请求数、时延 EWMA / 近期样本与连续失败（被动健康检查）。"""
+
+    def __init__(self, url: str):
+        self.url = url
+        self.inflight = 0
+        self.ewma: Optional[float] = None
+        self.failures = 0
+        self.down_until = 0.0
+        self.requests = 0
+        self.errors = 0
+        self._samples: Deque[float] = deque(maxlen=200)
+
+    def healthy(self, now: float) -> bool:
+        return now >= self.down_until
+
+    def p95(self) -> Optional[float]:
+        if len(self._samples) < 20:
+            return None
+        xs = sorted(self._samples)
+        return xs[int(len(xs) * 0.95) - 1]
+
+    def cost(self, prior: float) -> float:
+        if config.LLM_LB_POLICY == "least_loaded":
+            return float(self.inflight)
+        # 预计完成时间：(在途+1) × 时延 EWMA；没有样本时用 prior 估算，
+        # 否则新副本成本恒为 0，所有请求都会压到它身上
+        return (self.inflight + 1) * (self.ewma if self.ewma is not None else prior)
+
+    def observe(self, latency: Optional[float], ok: bool) -> None:
+        self.requests += 1
+        if ok:
+            self.failures = 0
+            if latency is not None:
+                self._samples.append(latency)
+                self.ewma = latency if self.ewma is None else self.ewma * 0.8 + latency * 0.2
+            return
+        self.errors += 1
+        self.failures += 1
+        if self.failures >= config.LLM_BACKEND_MAX_FAILS:
+            self.down_until = time.monotonic() + config.LLM_BACKEND_COOLDOWN
+            logger.error(f"LLM副本标记为不可用 {self.url}，连续失败 {self.failures} 次，冷却 {config.LLM_BACKEND_COOLDOWN}s")
+
+    def snapshot(self) -> dict:
+        p95 = self.p95()
+        return {
+            "url": self.url,
+            "healthy": self.healthy(time.monotonic()),
+            "inflight": self.inflight,
+            "ewma_latency_s": round(self.ewma, 3) if self.ewma is not None else None,
+            "p95_latency_s": round(p95, 3) if p95 is not None else None,
+            "consecutive_failures": self.failures,
+            "requests": self.requests,
+            "errors": self.errors,
+        }
+
+_backends: List[Backend] = []
+_stats = {"hedged": 0, "hedge_wins": 0}
+
+def all_backends() -> List[Backend]:
+    if not _backends:
+        raw = os.getenv("LLM_BASE_URLS") or os.getenv("LLM_BASE_URL", "http://10.110.3.61:9997/v1")
+        urls = [_sanitize_base_url(u) for u in raw.split(",") if u.strip()]
+        _backends.extend(Backend(u) for u in dict.fromkeys(urls))
+        if os.getenv("LLM_DEBUG") == "1":
+            for b in _backends:
+                # 调试：打印每个字符和 Unicode 码位，抓全角冒号/零宽字符等
+                chars = " ".join([f"{repr(ch)}(U+{ord(ch):04X})" for ch in b.url])
+                print(f"[LLM DEBUG] base_url={repr(b.url)} chars={chars}")
+    return _backends
+
+def pick(exclude: tuple = ()) -> Backend:
+    now = time.monotonic()
+    pool = [b for b in all_backends() if b not in exclude]
+    healthy = [b for b in pool if b.healthy(now)]
+    # 全部不可用时仍然挑一个，交给熔断器判断是否整体兜底
+    candidates = healthy or pool or all_backends()
+    prior = _prior_latency()
+    # 成本相同（如都未采样）时按在途数、再按列表顺序
+    return min(candidates, key=lambda b: (b.cost(prior), b.inflight))
+
+def _prior_latency() -> float:
+    sampled = [b.ewma for b in all_backends() if b.ewma is not None]
+    return sum(sampled) / len(sampled) if sampled else config.LLM_BACKEND_PRIOR_LATENCY
+
+@asynccontextmanager
+async def track(backend: Backend) -> AsyncIterator[None]:
+    backend.inflight += 1
+    t0 = time.perf_counter()
+    try:
+        yield
+    except Exception as e:
+        if is_failure(e):
+            backend.observe(None, ok=False)
+        raise
+    else:
+        backend.observe(time.perf_counter() - t0, ok=True)
+    finally:
+        backend.inflight -= 1
+
+async def _run(backend: Backend, fn: Callable[[str], Awaitable[T]]) -> T:
+    async with track(backend):
+        return await fn(backend.url)
+
+async def call(fn: Callable[[str], Awaitable[T]]) -> T:
+    """按负载/时延选择副本执行 fn(base_url)。
+
+    开启 LLM_HEDGE_ENABLED 且有多个副本时：首个请求超过该副本 p95 仍未返回，
+    向另一个副本发对冲请求，先成功者胜出，另一个取消。
+    """
+    primary = pick()
+    if not config.LLM_HEDGE_ENABLED or len(all_backends()) < 2:
+        return await _run(primary, fn)
+
+    first = asyncio.ensure_future(_run(primary, fn))
+    second: Optional[asyncio.Future] = None
+    delay = max(config.LLM_HEDGE_MIN_DELAY, primary.p95() or config.LLM_TIMEOUT)
+    try:
+        done, _ = await asyncio.wait({first}, timeout=delay)
+        if done:
+            return first.result()
+        second_backend = pick(exclude=(primary,))
+        _stats["hedged"] += 1
+        logger.info(f"对冲请求：{primary.url} 超过 {delay:.1f}s，追加 {second_backend.url}")
+        second = asyncio.ensure_future(_run(second_backend, fn))
+        pending = {first, second}
+        error: Optional[BaseException] = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for t in done:
+                if t.exception() is None:
+                    if t is second:
+                        _stats["hedge_wins"] += 1
+                    return t.result()
+                error = t.exception()
+        raise error
+    finally:
+        for t in (first, second):
+            if t is not None and not t.done():
+                t.cancel()
+
+def snapshot() -> dict:
+    return {"policy": config.LLM_LB_POLICY, **_stats, "backends": [b.snapshot() for b in all_backends()]}
@@ -1,45 +1,81 @@
-from typing import Dict, Any, List
-from langchain_core.runnables import RunnableLambda
-from langchain_core.prompts import ChatPromptTemplate
-from .client import chat_completion_json
+from typing import Dict, Any, List, AsyncIterator, Awaitable, Callable
+from app.schemas.practice import PracticeItem, PracticeItemBatch, GradeResult, PointGrade
+from . import templates
+from .client import chat_completion_json, chat_completion_stream
+
+# 约束 LLM 输出的 JSON Schema（后端支持 response_format 时发送）
+_ITEM_SCHEMA = PracticeItem.model_json_schema()
+_BATCH_SCHEMA = PracticeItemBatch.model_json_schema()
+_GRADE_SCHEMA = GradeResult.model_json_schema()
+_POINT_SCHEMA = PointGrade.model_json_schema()
+
+# 出题模板按题型选择（llm/prompts/*.txt）
+_GEN_TEMPLATES = {1: "short_answer", 2: "teach_design"}
+_GEN_BATCH_TEMPLATES = {1: "short_answer_batch", 2: "teach_design_batch"}
+
+class Chain:
+    """轻量链：只提供与 LangChain Runnable 相同的 ainvoke；需要接入 LangChain 时用 as_runnable。"""
+    __slots__ = ("_fn",)
+
+    def __init__(self, fn: Callable[[Dict[str, Any]], Awaitable[Dict[str, Any]]]):
+        self._fn = fn
+
+    async def ainvoke(self, inputs: Dict[str, Any]) -> Dict[str, Any]:
+        return await self._fn(inputs)
+
+    def as_runnable(self):
+        from langchain_core.runnables import RunnableLambda  # 按需导入，不拖慢启动
+        return RunnableLambda(self._fn)
 
 # 生成链：inputs -> JSON
-_generate_prompt = ChatPromptTemplate.from_messages([
-    ("system",
-     "你是国际教师资格教研专家。基于【维度ID】与【难度】生成一题【简答题】。\n"
-     "严格以 JSON 输出（不要任何多余文字）。字段：材料(≥150字)、题目、参考答案、评分标准、维度(维度ID数组)、核心知识点(2-4个短语)、难度(1/2/3)、题型(1)、满分、建议用时、字数上限。"),
-    ("user", "维度ID: {kd_ids}\n难度: {difficulty}\n题型: 1\n仅输出JSON。")
-])
+def _gen_messages(inputs: Dict[str, Any]) -> List[Dict[str, str]]:
+    # 直接构造 OpenAI 兼容的 messages（与测试脚本同）
+    return templates.render(_GEN_TEMPLATES[inputs.get("qtype", 1)], inputs)
 
 async def _gen_call(inputs: Dict[str, Any]) -> Dict[str, Any]:
-    # 直接构造 OpenAI 兼容的 messages（与测试脚本同）
-    sys_msg = _generate_prompt.messages[0].prompt.format()
-    user_msg = _generate_prompt.messages[1].prompt.format(**inputs)
-    messages = [
-        {"role": "system", "content": sys_msg},
-        {"role": "user", "content": user_msg},
-    ]
-    return await chat_completion_json(messages, temperature=0.2)
+    return await chat_completion_json(_gen_messages(inputs), temperature=0.2,
+                                      schema=_ITEM_SCHEMA, schema_name="practice_item")
+
+def gen_stream(inputs: Dict[str, Any]) -> AsyncIterator[str]:
+    return chat_completion_stream(_gen_messages(inputs), temperature=0.2)
+
+_gen_chain = Chain(_gen_call)
 
-def gen_chain():
-    return RunnableLambda(_gen_call)
+def gen_chain() -> Chain:
+    return _gen_chain
+
+# 批量生成链：inputs（含 count）-> {"items": [...]}
+async def _gen_batch_call(inputs: Dict[str, Any]) -> Dict[str, Any]:
+    messages = templates.render(_GEN_BATCH_TEMPLATES[inputs.get("qtype", 1)], inputs)
+    return await chat_completion_json(messages, temperature=0.2, schema=_BATCH_SCHEMA, schema_name="practice_batch")
+
+_gen_batch_chain = Chain(_gen_batch_call)
+
+def gen_batch_chain() -> Chain:
+    return _gen_batch_chain
 
 # 评分链：inputs -> JSON
-_grade_prompt = ChatPromptTemplate.from_messages([
-    ("system",
-     "你是严格的阅卷老师。根据【评分标准】与【核心要点】对【作答】评分。\n"
-     "只输出 JSON：total_score(0-满分)、subitem_scores(要点->分)、comments、hit_score_points(数组)。"),
-    ("user", "满分: {full_score}\n核心要点: {score_points}\n评分标准: {rubric}\n作答: {answer}")
-])
+def _grade_messages(inputs: Dict[str, Any]) -> List[Dict[str, str]]:
+    return templates.render("grade", inputs)
 
 async def _grade_call(inputs: Dict[str, Any]) -> Dict[str, Any]:
-    sys_msg = _grade_prompt.messages[0].prompt.format()
-    user_msg = _grade_prompt.messages[1].prompt.format(**inputs)
-    messages = [
-        {"role": "system", "content": sys_msg},
-        {"role": "user", "content": user_msg},
-    ]
-    return await chat_completion_json(messages, temperature=0.0)
-
-def grade_chain():
-    return RunnableLambda(_grade_call)
+    return await chat_completion_json(_grade_messages(inputs), temperature=0.0,
+                                      schema=_GRADE_SCHEMA, schema_name="grade_result")
+
+def grade_stream(inputs: Dict[str, Any]) -> AsyncIterator[str]:
+    return chat_completion_stream(_grade_messages(inputs), temperature=0.0)
+
+_grade_chain = Chain(_grade_call)
+
+def grade_chain() -> Chain:
+    return _grade_chain
+
+# 分项评分链：单个要点 -> JSON（score/hit/comment）
+async def _grade_point_call(inputs: Dict[str, Any]) -> Dict[str, Any]:
+    return await chat_completion_json(templates.render("grade_point", inputs), temperature=0.0,
+                                      schema=_POINT_SCHEMA, schema_name="point_grade")
+
+_grade_point_chain = Chain(_grade_point_call)
+
+def grade_point_chain() -> Chain:
+    return _grade_point_chain
@@ -1,71 +1,199 @@
-import os, re, json
+import os, json, logging, time
 import httpx
-from typing import List, Dict, Any
-
-def _sanitize_base_url(raw: str) -> str:
-    raw = (raw or "").strip()
-    raw = re.sub(r"\s+", "", raw)
-    if not raw:
-        raise RuntimeError("缺少 LLM_BASE_URL（例如 http://10.110.3.61:9997/v1）")
-    if not raw.startswith(("http://","https://")):
-        raw = "http://" + raw
-    return raw[:-1] if raw.endswith("/") else raw
-
-# 单例 AsyncClient：明确 proxies=None，且 trust_env=False（不继承系统代理）
+from typing import List, Dict, Any, AsyncIterator, Optional
+from app import config
+from app.utils import metrics
+from . import backends, resilience, singleflight
+from .json_repair import loads_tolerant, strip_code_fences
+
+logger = logging.getLogger("llm.client")
+
+# 每个进程一个 AsyncClient（连接池），在 FastAPI lifespan / worker 启动时 startup()，退出时 shutdown()。
+# trust_env=False：不读系统代理（内网 LLM 直连）；超时按请求传入，不修改共享客户端的状态
 _http_client: httpx.AsyncClient | None = None
-def _client(timeout: int) -> httpx.AsyncClient:
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+def _new_client(transport: Optional[httpx.AsyncBaseTransport] = None) -> httpx.AsyncClient:
+    http2 = config.LLM_HTTP2 and transport is None and _http2_available()
+    if config.LLM_HTTP2 and not http2 and transport is None:
+        logger.warning("LLM_HTTP2=true 但未安装 h2，使用 HTTP/1.1")
+    return httpx.AsyncClient(
+        timeout=config.LLM_TIMEOUT,
+        trust_env=False,
+        http2=http2,
+        transport=transport,
+        limits=httpx.Limits(
+            max_connections=config.LLM_MAX_CONNECTIONS,
+            max_keepalive_connections=config.LLM_MAX_KEEPALIVE,
+            keepalive_expiry=config.LLM_KEEPALIVE_EXPIRY,
+        ),
+    )
+
+async def startup(transport: Optional[httpx.AsyncBaseTransport] = None) -> None:
+    """创建连接池；transport 供压测/测试接入进程内 mock。已创建时不重复创建。"""
+    global _http_client
+    if _http_client is None:
+        _http_client = _new_client(transport)
+
+async def shutdown() -> None:
+    global _http_client
+    if _http_client is not None:
+        client, _http_client = _http_client, None
+        await client.aclose()
+
+def _client() -> httpx.AsyncClient:
+    # 脚本等未经 lifespan 的调用方按需创建
     global _http_client
     if _http_client is None:
-        _http_client = httpx.AsyncClient(
-            proxies=None,
-            timeout=timeout,
-            trust_env=False,      # 关键：彻底不读系统代理
-        )
-    else:
-        # 更新超时时间（可选）
-        _http_client.timeout = timeout
+        _http_client = _new_client()
     return _http_client
 
+def _timeout(total: float) -> httpx.Timeout:
+    return httpx.Timeout(total, connect=min(config.LLM_CONNECT_TIMEOUT, total))
+
 
 def _cfg():
-    base_url = _sanitize_base_url(os.getenv("LLM_BASE_URL", "http://10.110.3.61:9997/v1"))
+    # base_url 由 backends 按负载/时延在多个副本间选择
     api_key  = os.getenv("LLM_API_KEY", "sk-local")
     model    = os.getenv("LLM_MODEL", "qwen3")
     timeout  = int(os.getenv("LLM_TIMEOUT", "45"))
 
-    # 调试：打印每个字符和 Unicode 码位，抓全角冒号/零宽字符等
     if os.getenv("LLM_DEBUG") == "1":
-        chars = " ".join([f"{repr(ch)}(U+{ord(ch):04X})" for ch in base_url])
-        print(f"[LLM DEBUG] base_url={repr(base_url)} chars={chars} model={model} timeout={timeout}")
+        print(f"[LLM DEBUG] backends={[b.url for b in backends.all_backends()]} model={model} timeout={timeout}")
 
-    return base_url, api_key, model, timeout
+    return api_key, model, timeout
 
 def _strip_code_fences(s: str) -> str:
-    s = s.strip()
-    if s.startswith("```"):
-        s = s.split("```", 2)[1] if "```" in s[3:] else s[3:]
-    return s.strip()
-
-async def chat_completion(messages, temperature: float = 0.2) -> str:
-    base_url, api_key, model, timeout = _cfg()
-    url = f"{base_url}/chat/completions"
+    return strip_code_fences(s)
+
+# JSON 输出统计：direct=直接可解析，repaired=经容错修复，retried=只能重发请求，failed=重试后仍失败
+_json_stats = {"direct": 0, "repaired": 0, "retried": 0, "failed": 0}
+# 后端以 4xx 明确拒绝 response_format 后，本进程在 LLM_JSON_MODE_RETRY 秒内不再发送
+_response_format_off_until = 0.0
+
+def _response_format_supported() -> bool:
+    return time.monotonic() >= _response_format_off_until
+
+def _rejects_response_format(e: httpx.HTTPStatusError) -> bool:
+    """4xx 且错误信息提到 response_format / json_schema 才认为是后端不支持，其它 4xx（鉴权、超长等）照常抛出。"""
+    code = e.response.status_code
+    if not (400 <= code < 500) or code == 429:
+        return False
+    try:
+        text = e.response.text.lower()
+    except Exception:
+        return False
+    return any(k in text for k in ("response_format", "response format", "json_schema", "json_object"))
+
+def json_stats() -> dict:
+    total = _json_stats["direct"] + _json_stats["repaired"] + _json_stats["retried"]
+    return {
+        **_json_stats,
+        "retry_rate": round(_json_stats["retried"] / total, 4) if total else 0.0,
+        "response_format": config.LLM_JSON_MODE if _response_format_supported() else "unsupported",
+    }
+
+def _response_format(schema: Optional[Dict[str, Any]], name: str) -> Optional[Dict[str, Any]]:
+    if not _response_format_supported() or config.LLM_JSON_MODE == "off":
+        return None
+    if config.LLM_JSON_MODE == "json_schema" and schema:
+        return {"type": "json_schema", "json_schema": {"name": name, "schema": schema, "strict": False}}
+    return {"type": "json_object"}
+
+async def chat_completion(messages, temperature: float = 0.2,
+                          response_format: Optional[Dict[str, Any]] = None, kind: str = "default") -> str:
+    """kind 为调用类型（一般取 schema 名），自适应并发按类型分别维护时延基准。"""
+    global _response_format_off_until
+    try:
+        return await _chat_completion(messages, temperature, response_format, kind)
+    except httpx.HTTPStatusError as e:
+        if response_format is None or not _rejects_response_format(e):
+            raise
+        # 兼容不支持 response_format 的后端：去掉后重发，并暂时关闭
+        logger.warning(f"后端不支持 response_format，关闭 {config.LLM_JSON_MODE_RETRY:.0f}s: {e.response.status_code}")
+        _response_format_off_until = time.monotonic() + config.LLM_JSON_MODE_RETRY
+        return await _chat_completion(messages, temperature, None, kind)
+
+async def _chat_completion(messages, temperature: float, response_format: Optional[Dict[str, Any]],
+                           kind: str) -> str:
+    api_key, model, timeout = _cfg()
     headers = {"Authorization": f"Bearer {api_key}"}
     payload = {"model": model, "messages": messages, "temperature": temperature}
+    if response_format:
+        payload["response_format"] = response_format
 
-    if os.getenv("LLM_DEBUG") == "1":
-        print(f"[LLM DEBUG] POST {url} (msgs={len(messages)}) trust_env=False proxies=None")
+    async def call(base_url: str) -> str:
+        url = f"{base_url}/chat/completions"
+        if os.getenv("LLM_DEBUG") == "1":
+            print(f"[LLM DEBUG] POST {url} (msgs={len(messages)}) trust_env=False proxies=None")
+        r = await _client().post(url, headers=headers, json=payload, timeout=_timeout(timeout))
+        r.raise_for_status()
+        data = r.json()
+        metrics.tokens(data.get("usage"), model)
+        return data["choices"][0]["message"]["content"]
+
+    with metrics.stage("llm_call"):
+        async with resilience.guard(kind):
+            return await backends.call(call)
 
-    r = await _client(timeout).post(url, headers=headers, json=payload)
-    r.raise_for_status()
-    data = r.json()
-    return data["choices"][0]["message"]["content"]
+async def chat_completion_json(messages: List[Dict[str, Any]], temperature: float = 0.2,
+                               schema: Optional[Dict[str, Any]] = None, schema_name: str = "output") -> Any:
+    # 相同 (模型, 温度, messages) 的并发请求合并为一次上游调用
+    model = os.getenv("LLM_MODEL", "qwen3")
+    key = singleflight.key_of(model, temperature, messages)
+    return await singleflight.do(key, lambda: _chat_completion_json(messages, temperature, schema, schema_name))
 
-async def chat_completion_json(messages: List[Dict[str, Any]], temperature: float = 0.2) -> Any:
-    text = await chat_completion(messages, temperature)
+async def _chat_completion_json(messages: List[Dict[str, Any]], temperature: float,
+                                schema: Optional[Dict[str, Any]], schema_name: str) -> Any:
+    text = await chat_completion(messages, temperature, _response_format(schema, schema_name), kind=schema_name)
     try:
-        return json.loads(_strip_code_fences(text))
+        with metrics.stage("json_parse"):
+            data, repaired = loads_tolerant(text)
+        _json_stats["repaired" if repaired else "direct"] += 1
+        return data
     except json.JSONDecodeError:
-        # 再提醒只输出 JSON，重试一次
+        pass
+    # 容错修复也无法解析：最后手段，提醒只输出 JSON 重试一次
+    _json_stats["retried"] += 1
+    with metrics.stage("json_retry"):
         messages2 = messages + [{"role":"system","content":"仅输出严格 JSON，不要解释文字。"}]
-        text2 = await chat_completion(messages2, temperature)
-        return json.loads(_strip_code_fences(text2))
+        text2 = await chat_completion(messages2, temperature, _response_format(schema, schema_name), kind=schema_name)
+        try:
+            return loads_tolerant(text2)[0]
+        except json.JSONDecodeError:
+            _json_stats["failed"] += 1
+            raise
+
+async def chat_completion_stream(messages: List[Dict[str, Any]], temperature: float = 0.2) -> AsyncIterator[str]:
+    # OpenAI 兼容的 stream 模式：逐段产出 delta.content
+    api_key, model, timeout = _cfg()
+    backend = backends.pick()
+    url = f"{backend.url}/chat/completions"
+    headers = {"Authorization": f"Bearer {api_key}"}
+    payload = {"model": model, "messages": messages, "temperature": temperature, "stream": True}
+
+    if os.getenv("LLM_DEBUG") == "1":
+        print(f"[LLM DEBUG] POST {url} (msgs={len(messages)}) stream=True")
+
+    request = _client().stream("POST", url, headers=headers, json=payload, timeout=_timeout(timeout))
+    async with resilience.guard("stream"), backends.track(backend), request as r:
+        r.raise_for_status()
+        async for line in r.aiter_lines():
+            if not line.startswith("data:"):
+                continue
+            data = line[5:].strip()
+            if data == "[DONE]":
+                break
+            chunk = json.loads(data)
+            # 部分后端在最后一个分片里带 usage
+            metrics.tokens(chunk.get("usage"), model)
+            choices = chunk.get("choices") or [{}]
+            piece = (choices[0].get("delta") or {}).get("content")
+            if piece:
+                yield piece
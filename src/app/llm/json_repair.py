@@ -0,0 +1,123 @@
+import json, re
+from typing import Any, Optional, Tuple
+
+# 容错 JSON 解析：去掉 qwen3 的 <think> 段与代码围栏，截取第一个完整的 JSON 对象/数组，
+# 修复尾随逗号与未加引号的键。仍然无法解析时抛出 json.JSONDecodeError。
+
+_THINK = re.compile(r"<think>.*?</think>", re.S)
+_FENCE = re.compile(r"```[a-zA-Z]*\s*\n?(.*?)```", re.S)
+_KEY_CHARS = re.compile(r"[A-Za-z0-9_一-鿿]")
+
+def strip_think(s: str) -> str:
+    s = _THINK.sub("", s)
+    # 未闭合的 <think>：丢弃到第一个 '{' 之前的内容
+    i = s.find("<think>")
+    if i >= 0:
+        j = s.find("{", i)
+        s = s[:i] + (s[j:] if j >= 0 else "")
+    return s
+
+def strip_code_fences(s: str) -> str:
+    s = s.strip()
+    m = _FENCE.search(s)
+    if m:
+        return m.group(1).strip()
+    if s.startswith("```"):
+        # 只有开头围栏（输出被截断）
+        s = s[3:]
+        nl = s.find("\n")
+        if nl >= 0 and not s[:nl].strip().startswith(("{", "[")):
+            s = s[nl + 1:]
+    return s.strip()
+
+def first_balanced(s: str) -> Optional[str]:
+    """返回第一个括号配平的 {...} 或 [...] 片段（忽略字符串内的括号），找不到返回 None。"""
+    start = -1
+    for i, ch in enumerate(s):
+        if ch in "{[":
+            start = i
+            break
+    if start < 0:
+        return None
+    depth, in_str, esc = 0, False, False
+    for i in range(start, len(s)):
+        ch = s[i]
+        if in_str:
+            if esc:
+                esc = False
+            elif ch == "\\":
+                esc = True
+            elif ch == '"':
+                in_str = False
+        elif ch == '"':
+            in_str = True
+        elif ch in "{[":
+            depth += 1
+        elif ch in "}]":
+            depth -= 1
+            if depth == 0:
+                return s[start:i + 1]
+    return None
+
+def fix_syntax(s: str) -> str:
+    """在字符串之外：删除 } ] 前的尾随逗号，给未加引号的键补上双引号。"""
+    out = []
+    i, n = 0, len(s)
+    in_str, esc = False, False
+    last = ""  # 上一个非空白、非字符串内的字符
+    while i < n:
+        ch = s[i]
+        if in_str:
+            out.append(ch)
+            if esc:
+                esc = False
+            elif ch == "\\":
+                esc = True
+            elif ch == '"':
+                in_str = False
+                last = '"'
+            i += 1
+            continue
+        if ch == '"':
+            in_str = True
+            out.append(ch)
+            i += 1
+            continue
+        if ch == ",":
+            j = i + 1
+            while j < n and s[j].isspace():
+                j += 1
+            if j < n and s[j] in "}]":
+                i += 1
+                continue
+        if last in "{," and _KEY_CHARS.match(ch):
+            j = i
+            while j < n and _KEY_CHARS.match(s[j]):
+                j += 1
+            k = j
+            while k < n and s[k].isspace():
+                k += 1
+            if k < n and s[k] == ":":
+                out.append(f'"{s[i:j]}"')
+                last = '"'
+                i = j
+                continue
+        out.append(ch)
+        if not ch.isspace():
+            last = ch
+        i += 1
+    return "".join(out)
+
+def loads_tolerant(text: str) -> Tuple[Any, bool]:
+    """先直接解析；失败后依次尝试：去 <think>/围栏、截取首个完整对象、修复语法。返回 (结果, 是否经过修复)。"""
+    try:
+        return json.loads(text), False
+    except json.JSONDecodeError:
+        pass
+    s = strip_code_fences(strip_think(text))
+    candidate = first_balanced(s) or s
+    try:
+        return json.loads(candidate), True
+    except json.JSONDecodeError:
+        pass
+    return json.loads(fix_syntax(candidate)), True
@@ -0,0 +1,79 @@
+import json
+from typing import Any, Dict, List, Tuple
+
+class JSONFieldStream:
+    """增量解析流式输出的 JSON 对象：顶层字段一旦完整即产出 (key, value)。
+
+    顶层对象之前的 <think> 段、代码围栏等前导文字会被跳过。
+    """
+
+    def __init__(self):
+        self.result: Dict[str, Any] = {}
+        self.done = False
+        self._buf = ""
+        self._pos = 0          # 已扫描到的位置
+        self._field = -1       # 当前顶层字段的起点，-1 表示尚未找到顶层 '{'
+        self._depth = 0
+        self._in_str = False
+        self._esc = False
+
+    def feed(self, chunk: str) -> List[Tuple[str, Any]]:
+        self._buf += chunk
+        out: List[Tuple[str, Any]] = []
+        if self._field < 0 and not self._find_start():
+            return out
+        buf, i = self._buf, self._pos
+        while i < len(buf) and not self.done:
+            ch = buf[i]
+            if self._in_str:
+                if self._esc:
+                    self._esc = False
+                elif ch == "\\":
+                    self._esc = True
+                elif ch == '"':
+                    self._in_str = False
+            elif ch == '"':
+                self._in_str = True
+            elif ch in "{[":
+                self._depth += 1
+            elif ch in "}]":
+                self._depth -= 1
+                if self._depth == 0:
+                    self._emit(buf[self._field:i], out)
+                    self.done = True
+            elif ch == "," and self._depth == 1:
+                self._emit(buf[self._field:i], out)
+                self._field = i + 1
+            i += 1
+        self._pos = i
+        return out
+
+    @property
+    def text(self) -> str:
+        return self._buf
+
+    def _find_start(self) -> bool:
+        buf = self._buf
+        offset = 0
+        if "<think>" in buf:
+            end = buf.find("</think>")
+            if end < 0:
+                return False
+            offset = end + len("</think>")
+        i = buf.find("{", offset)
+        if i < 0:
+            return False
+        self._field = self._pos = i + 1
+        self._depth = 1
+        return True
+
+    def _emit(self, seg: str, out: List[Tuple[str, Any]]) -> None:
+        seg = seg.strip()
+        if not seg:
+            return
+        try:
+            obj = json.loads("{" + seg + "}")
+        except json.JSONDecodeError:
+            return
+        self.result.update(obj)
+        out.extend(obj.items())
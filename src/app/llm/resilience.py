@@ -0,0 +1,177 @@
+import asyncio, logging, time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Deque, Dict, Optional
+import httpx
+from app import config
+
+logger = logging.getLogger("llm.resilience")
+
+class CircuitOpenError(RuntimeError):
+    """熔断打开：不再请求上游，调用方直接走兜底。"""
+
+class LimiterTimeout(RuntimeError):
+    """排队等待并发名额超时。"""
+
+class AdaptiveLimiter:
+    """AIMD 自适应并发上限。
+
+    以成功请求时延的慢速 EWMA 作为基准：时延超过 基准×容忍倍数 或请求失败时按 backoff 乘性下调
+    （每个基准时延窗口内至多下调一次），否则每完成一个请求加性上调 1/limit。
+    基准按调用类型（kind，如 grade_result / point_grade / practice_batch / stream）分别维护：
+    不同类型的输出长度相差数倍，共用一个基准会把长请求都误判为拥塞。
+    """
+
+    def __init__(self, initial: int, min_limit: int, max_limit: int, tolerance: float, backoff: float = 0.7):
+        self.limit = float(initial)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.tolerance = tolerance
+        self.backoff = backoff
+        self.inflight = 0
+        self.baselines: Dict[str, float] = {}
+        self.rejected = 0
+        self._last_drop = 0.0
+        self._waiters: Deque[asyncio.Future] = deque()
+
+    async def acquire(self, timeout: float) -> None:
+        if not self._waiters and self.inflight < int(self.limit):
+            self.inflight += 1
+            return
+        fut = asyncio.get_running_loop().create_future()
+        self._waiters.append(fut)
+        try:
+            await asyncio.wait_for(fut, timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if fut.done() and not fut.cancelled():
+                # 名额已分配但调用方放弃，归还
+                self.release()
+            if isinstance(e, asyncio.TimeoutError):
+                self.rejected += 1
+                raise LimiterTimeout(f"LLM并发已满（limit={int(self.limit)}），排队超时 {timeout}s") from e
+            raise
+
+    def release(self, latency: Optional[float] = None, ok: bool = True, kind: str = "default") -> None:
+        self.inflight -= 1
+        if latency is not None:
+            self._adjust(latency, ok, kind)
+        while self._waiters and self.inflight < int(self.limit):
+            fut = self._waiters.popleft()
+            if not fut.done():
+                self.inflight += 1
+                fut.set_result(None)
+
+    def _adjust(self, latency: float, ok: bool, kind: str) -> None:
+        baseline = self.baselines.get(kind)
+        if ok:
+            baseline = latency if baseline is None else baseline * 0.95 + latency * 0.05
+            self.baselines[kind] = baseline
+        if not ok or (baseline is not None and latency > baseline * self.tolerance):
+            now = time.monotonic()
+            if now - self._last_drop >= (baseline or 0.0):
+                self.limit = max(float(self.min_limit), self.limit * self.backoff)
+                self._last_drop = now
+                logger.warning(f"LLM并发上限下调 -> {self.limit:.1f} (kind={kind} latency={latency:.1f}s ok={ok})")
+        else:
+            self.limit = min(float(self.max_limit), self.limit + 1.0 / self.limit)
+
+    def snapshot(self) -> dict:
+        return {
+            "limit": round(self.limit, 2),
+            "inflight": self.inflight,
+            "queued": sum(1 for f in self._waiters if not f.done()),
+            "baseline_latency_s": {k: round(v, 3) for k, v in self.baselines.items()},
+            "rejected": self.rejected,
+        }
+
+class CircuitBreaker:
+    """连续失败达到阈值后打开，冷却期内直接拒绝；冷却结束后放行一个探测请求（半开）。"""
+
+    def __init__(self, threshold: int, cooldown: float):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.short_circuited = 0
+        self._probing = False
+
+    def check(self) -> None:
+        if self.state == "open":
+            if time.monotonic() - self.opened_at < self.cooldown:
+                self.short_circuited += 1
+                raise CircuitOpenError("LLM熔断中，直接兜底")
+            self.state = "half_open"
+            self._probing = False
+        if self.state == "half_open":
+            if self._probing:
+                self.short_circuited += 1
+                raise CircuitOpenError("LLM熔断半开探测中，直接兜底")
+            self._probing = True
+
+    def record(self, ok: bool) -> None:
+        if ok:
+            if self.state != "closed":
+                logger.info("LLM熔断恢复")
+            self.state, self.failures, self._probing = "closed", 0, False
+            return
+        self.failures += 1
+        if self.state == "half_open" or self.failures >= self.threshold:
+            if self.state != "open":
+                logger.error(f"LLM熔断打开，连续失败 {self.failures} 次，冷却 {self.cooldown}s")
+            self.state, self.opened_at, self._probing = "open", time.monotonic(), False
+
+    def abandon(self) -> None:
+        # 探测请求被取消，不计成败，允许下一个请求继续探测
+        self._probing = False
+
+    def snapshot(self) -> dict:
+        remaining = self.cooldown - (time.monotonic() - self.opened_at) if self.state == "open" else 0.0
+        return {
+            "state": self.state,
+            "consecutive_failures": self.failures,
+            "open_remaining_s": round(max(0.0, remaining), 1),
+            "short_circuited": self.short_circuited,
+        }
+
+limiter = AdaptiveLimiter(
+    initial=config.LLM_CONCURRENCY_INITIAL,
+    min_limit=config.LLM_CONCURRENCY_MIN,
+    max_limit=config.LLM_CONCURRENCY_MAX,
+    tolerance=config.LLM_LATENCY_TOLERANCE,
+)
+breaker = CircuitBreaker(threshold=config.LLM_BREAKER_THRESHOLD, cooldown=config.LLM_BREAKER_COOLDOWN)
+
+def is_failure(e: BaseException) -> bool:
+    # 4xx（除 429）是请求本身的问题，不算上游故障
+    if isinstance(e, httpx.HTTPStatusError):
+        code = e.response.status_code
+        return code >= 500 or code == 429
+    return isinstance(e, Exception)
+
+@asynccontextmanager
+async def guard(kind: str = "default") -> AsyncIterator[None]:
+    """包住一次上游请求：熔断检查 + 并发名额 + 记录时延与成败；kind 区分时延基准。"""
+    breaker.check()
+    try:
+        await limiter.acquire(config.LLM_QUEUE_TIMEOUT)
+    except BaseException:
+        breaker.abandon()
+        raise
+    t0 = time.perf_counter()
+    try:
+        yield
+    except BaseException as e:
+        if is_failure(e):
+            limiter.release(time.perf_counter() - t0, ok=False, kind=kind)
+            breaker.record(False)
+        else:
+            limiter.release()
+            breaker.abandon()
+        raise
+    else:
+        limiter.release(time.perf_counter() - t0, ok=True, kind=kind)
+        breaker.record(True)
+
+def snapshot() -> dict:
+    return {"limiter": limiter.snapshot(), "breaker": breaker.snapshot()}
@@ -0,0 +1,78 @@
+import asyncio, copy, hashlib, json, logging
+from typing import Any, Awaitable, Callable, Dict
+from app import config
+from app.deps import get_redis
+
+logger = logging.getLogger("llm.singleflight")
+
+# 跨进程合并：sf:lock:<key> 标记有进程正在请求上游，sf:res:<key> 暂存结果供其他进程读取
+_LOCK_PREFIX = "sf:lock:"
+_RESULT_PREFIX = "sf:res:"
+_POLL_INTERVAL = 0.1
+
+_inflight: Dict[str, asyncio.Task] = {}
+_stats = {"leader": 0, "coalesced": 0, "remote_coalesced": 0}
+
+def key_of(model: str, temperature: float, messages: list) -> str:
+    raw = json.dumps([model, temperature, messages], ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+def stats() -> dict:
+    return {**_stats, "inflight": len(_inflight)}
+
+async def do(key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+    """相同 key 的并发调用共享同一个上游请求。
+
+    上游请求跑在独立 task 中，发起者被取消不会影响其他等待者。
+    结果对每个调用方深拷贝一份，调用方可以放心修改。
+    """
+    if not config.SINGLEFLIGHT_ENABLED:
+        return await fn()
+    task = _inflight.get(key)
+    if task is not None:
+        _stats["coalesced"] += 1
+        logger.info(f"合并进行中的相同 LLM 请求 key={key[:12]}")
+    else:
+        _stats["leader"] += 1
+        task = asyncio.ensure_future(_remote(key, fn) if config.SINGLEFLIGHT_REDIS else fn())
+        _inflight[key] = task
+        task.add_done_callback(lambda t: _inflight.pop(key, None))
+    return copy.deepcopy(await asyncio.shield(task))
+
+async def _remote(key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+    # 跨 worker：抢到锁的进程请求上游并写回结果，其余进程轮询结果；Redis 不可用时直接请求
+    try:
+        r = await get_redis()
+        lock_ttl = max(1, config.LLM_TIMEOUT * 2)
+        while True:
+            raw = await r.get(_RESULT_PREFIX + key)
+            if raw is not None:
+                _stats["remote_coalesced"] += 1
+                logger.info(f"复用其他进程的 LLM 结果 key={key[:12]}")
+                return json.loads(raw)
+            if await r.set(_LOCK_PREFIX + key, "1", nx=True, ex=lock_ttl):
+                break
+            await asyncio.sleep(_POLL_INTERVAL)
+    except Exception as e:
+        logger.warning(f"跨进程合并不可用，直接请求上游: {e}")
+        return await fn()
+
+    try:
+        result = await fn()
+    except BaseException:
+        await _release(r, key)
+        raise
+    try:
+        pipe = r.pipeline()
+        pipe.set(_RESULT_PREFIX + key, json.dumps(result, ensure_ascii=False), ex=config.SINGLEFLIGHT_RESULT_TTL)
+        pipe.delete(_LOCK_PREFIX + key)
+        await pipe.execute()
+    except Exception as e:
+        logger.warning(f"写回合并结果失败 key={key[:12]}: {e}")
+    return result
+
+async def _release(r, key: str) -> None:
+    try:
+        await r.delete(_LOCK_PREFIX + key)
+    except Exception as e:
+        logger.warning(f"释放合并锁失败 key={key[:12]}: {e}")
@@ -0,0 +1,85 @@
+import string
+from pathlib import Path
+from typing import Any, Dict, FrozenSet, List, Mapping, Optional, Tuple
+
+# 提示词模板注册表：导入时读取 prompts/*.txt 并预编译为 (字面量, 占位符) 片段，渲染只做字符串拼接，
+# 不依赖 LangChain。占位符语法同 str.format（{name}，{{ }} 转义），不支持格式说明符。
+# 文件格式：以 "## system" / "## user" / "## assistant" 行分段，第一个分段之前的内容为说明，不参与渲染。
+
+_DIR = Path(__file__).with_name("prompts")
+_ROLES = ("system", "user", "assistant")
+
+_Parts = Tuple[Tuple[str, Optional[str]], ...]
+
+def _compile(name: str, text: str) -> _Parts:
+    parts = []
+    for literal, field, spec, conv in string.Formatter().parse(text):
+        if spec or conv:
+            raise ValueError(f"模板 {name} 的占位符 {{{field}}} 不支持格式说明符")
+        if field is not None and not field.isidentifier():
+            raise ValueError(f"模板 {name} 的占位符 {{{field}}} 不是合法变量名")
+        parts.append((literal, field))
+    return tuple(parts)
+
+class Template:
+    """预编译的对话模板，render 产出 OpenAI 兼容的 messages。"""
+    __slots__ = ("name", "sources", "variables", "_compiled")
+
+    def __init__(self, name: str, sources: List[Tuple[str, str]]):
+        self.name = name
+        self.sources = tuple(sources)
+        self._compiled = tuple((role, _compile(name, text)) for role, text in sources)
+        self.variables: FrozenSet[str] = frozenset(f for _, parts in self._compiled for _, f in parts if f)
+
+    def render(self, inputs: Mapping[str, Any]) -> List[Dict[str, str]]:
+        messages = []
+        for role, parts in self._compiled:
+            buf = []
+            for literal, field in parts:
+                buf.append(literal)
+                if field is not None:
+                    try:
+                        buf.append(str(inputs[field]))
+                    except KeyError:
+                        raise KeyError(f"模板 {self.name} 缺少变量 {field}") from None
+            messages.append({"role": role, "content": "".join(buf)})
+        return messages
+
+    def to_langchain(self):
+        """需要 LangChain 链路时再转换（按需导入 langchain_core）。"""
+        from langchain_core.prompts import ChatPromptTemplate
+        return ChatPromptTemplate.from_messages(list(self.sources))
+
+def parse(name: str, text: str) -> Template:
+    sources: List[Tuple[str, str]] = []
+    role, lines = None, []
+    for line in text.splitlines():
+        head = line[3:].strip() if line.startswith("## ") else None
+        if head in _ROLES:
+            if role:
+                sources.append((role, "\n".join(lines).strip("\n")))
+            role, lines = head, []
+        elif role:
+            lines.append(line)
+    if role:
+        sources.append((role, "\n".join(lines).strip("\n")))
+    if not sources:
+        raise ValueError(f"模板 {name} 没有任何消息分段")
+    return Template(name, sources)
+
+def _load_all() -> Dict[str, Template]:
+    return {p.stem: parse(p.stem, p.read_text(encoding="utf-8")) for p in sorted(_DIR.glob("*.txt"))}
+
+_REGISTRY: Dict[str, Template] = _load_all()
+
+def get(name: str) -> Template:
+    try:
+        return _REGISTRY[name]
+    except KeyError:
+        raise KeyError(f"未知的提示词模板: {name}（可用：{', '.join(sorted(_REGISTRY))}）") from None
+
+def render(name: str, inputs: Mapping[str, Any]) -> List[Dict[str, str]]:
+    return get(name).render(inputs)
+
+def names() -> List[str]:
+    return sorted(_REGISTRY)
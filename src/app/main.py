@@ -1,9 +1,52 @@
+import asyncio, logging
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
-from .routes.practice import router as practice_router
+from app import config
+from app.api.routes_admin import router as admin_router
+from app.api.routes_health import router as health_router
+from app.api.routes_practice import router as practice_router
+from app.cache import question as question_cache
+from app.db import writebehind
+from app.deps import close_redis, init_redis
+from app.llm import client as llm_client
+from app.services import dimension, inventory, jobs
+from app.services.generator import llm_generate_items
+from app.utils.logging import request_id_middleware
+from app.utils.ratelimit import rate_limit_middleware
 
-app = FastAPI(title="Practice Service", version="1.0.0")
+logger = logging.getLogger("app.main")
 
-app.include_router(practice_router, prefix="/practice", tags=["practice"])
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await init_redis()
+    await llm_client.startup()
+    try:
+        await dimension.load()
+    except Exception as e:
+        logger.exception(f"启动时加载知识维度目录失败，将在首次使用时重试: {e}")
+    tasks = [asyncio.create_task(question_cache.listen_invalidations())]
+    if writebehind.enabled():
+        tasks.append(asyncio.create_task(writebehind.flusher()))
+    if config.INVENTORY_ENABLED:
+        tasks.append(asyncio.create_task(inventory.refill_loop(llm_generate_items)))
+    if config.JOB_WORKER_INPROCESS:
+        tasks.append(asyncio.create_task(jobs.run_worker()))
+    yield
+    for t in tasks:
+        t.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    await llm_client.shutdown()
+    await close_redis()
+
+app = FastAPI(title="Practice Service", version="1.0.0", lifespan=lifespan)
+
+# 后注册的中间件在外层：先分配 request_id，再做限流
+app.middleware("http")(rate_limit_middleware)
+app.middleware("http")(request_id_middleware)
+
+app.include_router(health_router)
+app.include_router(practice_router)
+app.include_router(admin_router)
 
 @app.get("/")
 def root():
@@ -55,10 +55,35 @@ class PracticeItem(BaseModel):
         }
     }
 
+class GradeResult(BaseModel):
+    """评分链的 LLM 输出结构（用于约束输出的 JSON Schema）。"""
+    total_score: float = Field(..., ge=0, description="总分（0-满分）")
+    subitem_scores: dict = Field(default_factory=dict, description="要点->分")
+    comments: str = Field("", description="评语")
+    hit_score_points: List[str] = Field(default_factory=list, description="命中要点")
+
+class PracticeItemBatch(BaseModel):
+    """批量出题链的 LLM 输出结构：多道题包在 items 数组里（json_object 模式要求顶层为对象）。"""
+    items: List[PracticeItem] = Field(..., description="生成的题目")
+
+class PointGrade(BaseModel):
+    """分项评分时单个要点的 LLM 输出结构。"""
+    score: float = Field(..., ge=0, description="该要点得分（0-该要点分值）")
+    hit: bool = Field(False, description="是否命中该要点")
+    comment: str = Field("", description="针对该要点的评语")
+    dim: str = Field("", description="该要点所属的知识维度（取自题目维度之一）")
+
 class GenerateResponse(BaseModel):
     question_id: int = Field(..., example=50001)
     item: PracticeItem
 
+class BatchGenerateRequest(PracticeRequest):
+    数量: int = Field(5, ge=1, le=20, description="生成题数，最多20；同一批题使用相同维度、难度与题型")
+
+class BatchGenerateResponse(BaseModel):
+    items: List[GenerateResponse]
+    shortfall: int = Field(0, description="未能生成的题数（数量 - 实际返回的题数）")
+
 class AnswerRequest(BaseModel):
     question_id: int = Field(..., description="题目ID")
     original_answer: str = Field(..., min_length=1, description="用户作答文本")
@@ -83,7 +108,47 @@ class AnswerResponse(BaseModel):
     dimension_scores: Optional[dict] = Field(None, description="按维度得分（可选）")
     comments: Optional[str] = Field(None, description="机评评语")
     hit_score_points: Optional[list] = Field(None, description="命中要点列表")
+    cached: bool = Field(False, description="是否命中评分缓存")
+
+class BatchAnswerRequest(BaseModel):
+    items: List[AnswerRequest] = Field(..., min_length=1, max_length=200, description="批量作答，最多200条")
+
+class BatchAnswerItem(BaseModel):
+    index: int = Field(..., description="对应请求 items 中的下标")
+    question_id: int
+    ok: bool = Field(..., description="是否评分并入库成功")
+    result: Optional[AnswerResponse] = None
+    error: Optional[str] = Field(None, description="失败原因")
+
+class BatchAnswerResponse(BaseModel):
+    items: List[BatchAnswerItem]
+
+JobStatusName = Literal["queued", "running", "done", "failed"]
+
+class JobAccepted(BaseModel):
+    job_id: str = Field(..., description="任务ID，用于 GET /practice/jobs/{job_id} 查询结果")
+    status: JobStatusName = "queued"
+
+class JobStatus(BaseModel):
+    job_id: str
+    kind: Literal["generate", "answer"]
+    status: JobStatusName
+    attempts: int = Field(0, description="已执行次数")
+    result: Optional[dict] = Field(None, description="完成后的结果：generate 同 GenerateResponse，answer 同 AnswerResponse")
+    error: Optional[str] = Field(None, description="最近一次失败原因")
 
 class ErrorResponse(BaseModel):
     code: int = Field(..., example=40001)
     message: str = Field(..., example="参数校验失败")
+
+class QuestionUpdate(BaseModel):
+    """管理接口修改题目：只改传入的字段，字段名与导出格式一致。"""
+    title: Optional[str] = Field(None, min_length=1)
+    material: Optional[str] = None
+    requirements: Optional[str] = Field(None, max_length=500)
+    score: Optional[int] = Field(None, ge=1, le=100)
+    suggest_time: Optional[int] = Field(None, ge=1)
+    word_limit: Optional[int] = Field(None, ge=1)
+    score_points: Optional[List[str]] = None
+    answer_content: Optional[str] = None
+    scoring_criteria: Optional[str] = None
@@ -0,0 +1,62 @@
+import asyncio, logging, random, time
+from typing import Dict, Iterable, List
+from app import config
+from app.db.base import AsyncSessionLocal
+from app.db.repo import list_dimensions
+
+logger = logging.getLogger("svc.dimension")
+
+# 进程级知识维度目录：id -> name。启动时加载，TTL 到期或显式失效后在下次访问时重新加载
+_names: Dict[int, str] = {}
+_ids: List[int] = []
+_loaded_at = 0.0
+_lock = asyncio.Lock()
+_RETRY_AFTER = 10.0
+
+async def load() -> None:
+    global _names, _ids, _loaded_at
+    async with AsyncSessionLocal() as session:
+        rows = await list_dimensions(session)
+    # 整体替换，读者不会看到半更新的状态
+    _names = {kd_id: name for kd_id, name in rows}
+    _ids = list(_names)
+    _loaded_at = time.monotonic()
+    logger.info(f"知识维度目录已加载: {len(_ids)} 个")
+
+def invalidate() -> None:
+    global _loaded_at
+    _loaded_at = 0.0
+
+def _fresh() -> bool:
+    return bool(_loaded_at) and time.monotonic() - _loaded_at < config.DIMENSION_CATALOG_TTL
+
+async def _ensure_fresh() -> None:
+    global _loaded_at
+    if _fresh():
+        return
+    async with _lock:
+        if _fresh():
+            return
+        try:
+            await load()
+        except Exception as e:
+            # 刷新失败时继续使用旧目录，避免数据库抖动影响出题；稍后再试
+            logger.exception(f"知识维度目录加载失败，沿用旧数据({len(_ids)}个): {e}")
+            _loaded_at = time.monotonic() - config.DIMENSION_CATALOG_TTL + _RETRY_AFTER
+
+async def known(ids: Iterable[int]) -> List[int]:
+    """过滤出目录中存在的维度 ID，保持传入顺序并去重。"""
+    await _ensure_fresh()
+    return [i for i in dict.fromkeys(ids) if i in _names]
+
+async def sample(k: int) -> List[int]:
+    await _ensure_fresh()
+    return random.sample(_ids, min(k, len(_ids)))
+
+async def names(ids: Iterable[int]) -> Dict[int, str]:
+    await _ensure_fresh()
+    return {i: _names[i] for i in ids if i in _names}
+
+async def catalog() -> Dict[int, str]:
+    await _ensure_fresh()
+    return dict(_names)
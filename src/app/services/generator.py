@@ -1,11 +1,15 @@
-import logging, random, time
-from typing import Tuple, List
+import asyncio, logging, random
+from typing import Any, AsyncIterator, Optional, Tuple, List
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, func
-from app.schemas.practice import PracticeRequest, PracticeItem
-from app.db import models as m
-from app.db.repo import insert_question
-from app.llm.chains import gen_chain
+from app.schemas.practice import PracticeRequest, PracticeItem, GenerateResponse, BatchGenerateRequest
+from app.db.base import AsyncSessionLocal
+from app.db.models import Question
+from app.db.repo import find_reusable_question, insert_question, insert_questions
+from app.llm.chains import gen_batch_chain, gen_chain, gen_stream
+from app.llm.json_stream import JSONFieldStream
+from app.services import dimension, inventory, mastery
+from app import config
+from app.utils import metrics
 import json
 
 logger = logging.getLogger("svc.generator")
@@ -17,24 +21,20 @@ def _ensure_min_len(text: str, n: int = 150) -> str:
     while len(text) < n: text += pad
     return text
 
-async def _resolve_dimensions(session: AsyncSession, req: PracticeRequest) -> List[int]:
+async def _resolve_dimensions(req: PracticeRequest) -> List[int]:
+    # 维度校验与随机抽取都在进程内目录上完成；有 user_id 时按掌握度汇总优先选薄弱维度
+    adaptive = config.MASTERY_ADAPTIVE and req.user_id is not None
     if req.得分 is not None and req.得分 >= SCORE_THRESHOLD:
         k = random.randint(2, 4)
-        rows = (await session.execute(
-            select(m.KnowledgeDimension.id).order_by(func.random()).limit(k)
-        )).scalars().all()
-        logger.info(f"维度策略: 高分≥{SCORE_THRESHOLD} 抽{len(rows)}个 -> {rows}")
+        rows = await (mastery.weakest(req.user_id, k) if adaptive else dimension.sample(k))
+        logger.info(f"维度策略: 高分≥{SCORE_THRESHOLD} {'薄弱' if adaptive else '随机'}{len(rows)}个 -> {rows}")
         if rows: return rows
     if req.维度:
-        rows = (await session.execute(
-            select(m.KnowledgeDimension.id).where(m.KnowledgeDimension.id.in_(req.维度))
-        )).scalars().all()
+        rows = await dimension.known(req.维度)
         logger.info(f"维度策略: 使用传入维度过滤 -> {json.dumps(rows, ensure_ascii=False)}")
         if rows: return rows
-    rows = (await session.execute(
-        select(m.KnowledgeDimension.id).order_by(func.random()).limit(2)
-    )).scalars().all()
-    logger.warning(f"维度策略: 兜底随机 -> {rows}")
+    rows = await (mastery.weakest(req.user_id, 2) if adaptive else dimension.sample(2))
+    logger.warning(f"维度策略: 兜底{'薄弱' if adaptive else '随机'} -> {rows}")
     return rows or [1]
 
 def _fallback_item(req: PracticeRequest, dims: List[int]) -> PracticeItem:
@@ -60,27 +60,196 @@ def _fallback_item(req: PracticeRequest, dims: List[int]) -> PracticeItem:
         字数上限=200
     )
 
+async def _gen_inputs(dims: List[int], difficulty: int, qtype: int) -> dict:
+    names = await dimension.names(dims)
+    return {
+        "kd_ids": dims,
+        "kd_names": "、".join(f"{i}={names[i]}" for i in dims if i in names) or "（无）",
+        "difficulty": difficulty,
+        "qtype": qtype,
+    }
+
+def _to_item(raw: dict, dims: List[int], difficulty: int, qtype: int) -> PracticeItem:
+    raw.setdefault("维度", dims)
+    raw.setdefault("难度", difficulty)
+    raw.setdefault("题型", qtype)
+    raw.setdefault("满分", 10)
+    raw.setdefault("建议用时", 10)
+    with metrics.stage("validate"):
+        item = PracticeItem(**raw)
+    if len(item.材料) < 120 or not (2 <= len(item.核心知识点) <= 4):
+        raise ValueError("LLM输出不达标")
+    return item
+
+async def llm_generate_item(dims: List[int], difficulty: int, qtype: int) -> PracticeItem:
+    chain = gen_chain()
+    inputs = await _gen_inputs(dims, difficulty, qtype)
+    with metrics.stage("llm_generate") as t:
+        raw = await chain.ainvoke(inputs)
+    logger.info(f"LLM生成完成，用时 {t.ms:.0f}ms，dims={dims} diff={difficulty}")
+    return _to_item(raw, dims, difficulty, qtype)
+
+async def _gen_some(inputs: dict, count: int) -> List[PracticeItem]:
+    """一次 LLM 调用生成 count 题，逐题校验，丢弃不合格的。"""
+    raw = await gen_batch_chain().ainvoke({**inputs, "count": count})
+    raws = raw.get("items") if isinstance(raw, dict) else raw
+    if not isinstance(raws, list):
+        raise ValueError("LLM批量输出缺少 items 数组")
+    items = []
+    for r in raws[:count]:
+        try:
+            items.append(_to_item(r, inputs["kd_ids"], inputs["difficulty"], inputs["qtype"]))
+        except Exception as e:
+            logger.warning(f"批量生成丢弃不合格题目: {e}")
+    return items
+
+async def llm_generate_items(dims: List[int], difficulty: int, qtype: int, n: int) -> List[PracticeItem]:
+    """批量生成 n 题：每次调用最多 GEN_BATCH_PER_CALL 题，多次调用并发；只为不合格或缺少的题重新请求，
+    最多 GEN_BATCH_RETRIES 轮。返回的题数可能少于 n。"""
+    inputs = await _gen_inputs(dims, difficulty, qtype)
+    per = max(1, config.GEN_BATCH_PER_CALL)
+    items: List[PracticeItem] = []
+    for attempt in range(1 + max(0, config.GEN_BATCH_RETRIES)):
+        need = n - len(items)
+        if need <= 0:
+            break
+        sizes = [min(per, need - i) for i in range(0, need, per)]
+        with metrics.stage("llm_generate") as t:
+            results = await asyncio.gather(*(_gen_some(inputs, k) for k in sizes), return_exceptions=True)
+        got = 0
+        for res in results:
+            if isinstance(res, Exception):
+                logger.warning(f"LLM批量生成调用失败: {res!r}")
+                continue
+            items.extend(res)
+            got += len(res)
+        logger.info(f"LLM批量生成第{attempt + 1}轮，用时 {t.ms:.0f}ms，calls={len(sizes)} 需要{need} 合格{got}，"
+                    f"dims={dims} diff={difficulty}")
+    return items[:n]
+
+def _item_of(q: Question, dims: List[int]) -> PracticeItem:
+    return PracticeItem(
+        材料=q.material or "",
+        题目=q.title,
+        参考答案=q.answer_content or "",
+        评分标准=q.scoring_criteria or "",
+        维度=dims,
+        核心知识点=q.score_points or [],
+        难度=q.difficulty,
+        题型=q.question_type,
+        满分=q.score or 10,
+        建议用时=q.suggest_time or 10,
+        字数上限=q.word_limit,
+    )
+
+async def _from_bank(req: PracticeRequest, dims: List[int]) -> Optional[Tuple[int, PracticeItem]]:
+    """题库复用：按 REUSE_FRESH_RATIO 的概率跳过（新出题），否则取一道该用户没做过的同类题。"""
+    if not config.REUSE_ENABLED or random.random() < config.REUSE_FRESH_RATIO:
+        return None
+    try:
+        with metrics.stage("bank_lookup"):
+            async with AsyncSessionLocal() as session:
+                q = await find_reusable_question(session, dims=dims, difficulty=req.难度, question_type=req.题型,
+                                                 user_id=req.user_id, candidates=config.REUSE_CANDIDATES)
+        if q is None:
+            logger.info(f"题库未命中 dims={dims} diff={req.难度} type={req.题型}")
+            return None
+        logger.info(f"题库复用 qid={q.id} dims={dims} user={req.user_id}")
+        return q.id, _item_of(q, dims)
+    except Exception as e:
+        logger.warning(f"题库复用失败，改为新出题: {e}")
+        return None
+
+async def _reuse(req: PracticeRequest, dims: List[int]) -> Optional[Tuple[int, PracticeItem]]:
+    # 先取预生成库存，再查题库
+    return await inventory.pop(dims, req.难度, req.题型) or await _from_bank(req, dims)
+
+def _fallback(req: PracticeRequest, dims: List[int]) -> PracticeItem:
+    metrics.fallback("generate")
+    with metrics.stage("fallback"):
+        return _fallback_item(req, dims)
+
 async def generate_practice_item(req: PracticeRequest, session: AsyncSession) -> Tuple[PracticeItem, int]:
-    dims = await _resolve_dimensions(session, req)
+    with metrics.stage("dimension_resolve"):
+        dims = await _resolve_dimensions(req)
+    hit = await _reuse(req, dims)
+    if hit:
+        qid, item = hit
+        return item, qid
+
     item: PracticeItem
+    reusable = True
     try:
-        chain = gen_chain()
-        t0 = time.perf_counter()
-        raw = await chain.ainvoke({"kd_ids": dims, "difficulty": req.难度})
-        ms = (time.perf_counter() - t0) * 1000
-        logger.info(f"LLM生成完成，用时 {ms:.0f}ms，dims={dims} diff={req.难度}")
-        raw.setdefault("维度", dims)
-        raw.setdefault("难度", req.难度)
-        raw.setdefault("题型", req.题型)
-        raw.setdefault("满分", 10)
-        raw.setdefault("建议用时", 10)
-        item = PracticeItem(**raw)
-        if len(item.材料) < 120 or not (2 <= len(item.核心知识点) <= 4):
-            raise ValueError("LLM输出不达标")
+        item = await llm_generate_item(dims, req.难度, req.题型)
     except Exception as e:
         logger.exception(f"LLM生成异常: {e}")
-        item = _fallback_item(req, dims)
+        item, reusable = _fallback(req, dims), False
 
-    qid = await insert_question(session, item_json=item.model_dump())
+    with metrics.stage("db_insert"):
+        qid = await insert_question(session, item_json=item.model_dump(), reusable=reusable)
     logger.info(f"入库: question_id={qid} points={json.dumps(item.核心知识点, ensure_ascii=False)}")
     return item, qid
+
+async def generate_practice_batch(req: BatchGenerateRequest,
+                                  session: AsyncSession) -> Tuple[List[Tuple[int, PracticeItem]], int]:
+    """批量出题：同一批使用相同维度/难度/题型，不走库存与题库复用，全部题目与维度关联一个事务入库。
+    LLM 未能补齐时不用兜底模板凑数，只返回合格的题并报告缺口；一道都没有时抛出。
+    返回 ([(question_id, item)], 缺少的题数)。"""
+    with metrics.stage("dimension_resolve"):
+        dims = await _resolve_dimensions(req)
+    items = await llm_generate_items(dims, req.难度, req.题型, req.数量)
+    if not items:
+        raise RuntimeError("LLM 未生成合格的题目")
+
+    with metrics.stage("db_insert"):
+        qids = await insert_questions(session, [it.model_dump() for it in items])
+    # 内容重复的题（同批重复或与题库已有题相同）入库时合并为同一个 ID，只返回一次
+    pairs, seen = [], set()
+    for qid, item in zip(qids, items):
+        if qid not in seen:
+            seen.add(qid)
+            pairs.append((qid, item))
+    shortfall = req.数量 - len(pairs)
+    if shortfall:
+        logger.warning(f"批量生成未补齐：要求 {req.数量} 道，缺 {shortfall} 道 dims={dims}")
+    logger.info(f"批量入库: n={len(pairs)} shortfall={shortfall} dims={dims}")
+    return pairs, shortfall
+
+async def stream_practice_item(req: PracticeRequest) -> AsyncIterator[Tuple[str, Any]]:
+    """流式生成：LLM 每完成一个顶层字段即产出 ("field", {k: v})，入库后产出 ("done", GenerateResponse)。
+
+    会话只在入库时短暂打开，不在 LLM 流式输出期间占用连接。
+    """
+    with metrics.stage("dimension_resolve"):
+        dims = await _resolve_dimensions(req)
+    yield "dims", dims
+
+    hit = await _reuse(req, dims)
+    if hit:
+        qid, item = hit
+        for k, v in item.model_dump().items():
+            yield "field", {k: v}
+        yield "done", GenerateResponse(question_id=qid, item=item).model_dump()
+        return
+
+    parser = JSONFieldStream()
+    reusable = True
+    try:
+        with metrics.stage("llm_generate") as t:
+            async for piece in gen_stream(await _gen_inputs(dims, req.难度, req.题型)):
+                for k, v in parser.feed(piece):
+                    yield "field", {k: v}
+        if not parser.done:
+            raise ValueError("LLM流式输出不完整")
+        logger.info(f"LLM流式生成完成，用时 {t.ms:.0f}ms，dims={dims} diff={req.难度}")
+        item = _to_item(parser.result, dims, req.难度, req.题型)
+    except Exception as e:
+        logger.exception(f"LLM流式生成异常: {e}")
+        item, reusable = _fallback(req, dims), False
+        yield "fallback", item.model_dump()
+
+    with metrics.stage("db_insert"):
+        async with AsyncSessionLocal() as session:
+            qid = await insert_question(session, item_json=item.model_dump(), reusable=reusable)
+    logger.info(f"入库: question_id={qid} points={json.dumps(item.核心知识点, ensure_ascii=False)}")
+    yield "done", GenerateResponse(question_id=qid, item=item).model_dump()
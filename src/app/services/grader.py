@@ -1,8 +1,16 @@
-import logging, time
-from app.schemas.practice import AnswerRequest, AnswerResponse
+import asyncio, logging, time
+from typing import Any, AsyncIterator, List, Optional, Tuple
+from app.schemas.practice import AnswerRequest, AnswerResponse, BatchAnswerItem, GradeResult
 from sqlalchemy.ext.asyncio import AsyncSession
-from app.db.repo import get_question, insert_answer_record
-from app.llm.chains import grade_chain
+from app.db.base import AsyncSessionLocal
+from app.db.repo import get_grading_view, get_grading_views, insert_answer_record, insert_answer_records
+from app.cache import question as question_cache
+from app.llm.chains import grade_chain, grade_point_chain, grade_stream
+from app.llm.json_stream import JSONFieldStream
+from app.cache.redis import grade_key, rubric_hash, get_grading, set_grading, normalize_answer
+from app.services.pregrade import PreGrade, pregrade
+from app import config
+from app.utils import metrics
 
 logger = logging.getLogger("svc.grader")
 
@@ -19,36 +27,40 @@ def _fallback_grade(answer: str, full: int = 10) -> dict:
         "hit_score_points": ["长度","关键词"]
     }
 
-async def submit_answer(body: AnswerRequest, session: AsyncSession) -> AnswerResponse:
-    q = await get_question(session, body.question_id)
-    if not q:
-        logger.error(f"评分失败：题目不存在 q_id={body.question_id}")
-        raise ValueError("题目不存在或已删除")
+def _grade_inputs(q, answer: str, pre: Optional[PreGrade] = None) -> dict:
+    return {
+        "full_score": int(q.score or 10),
+        "score_points": q.score_points or [],
+        "rubric": q.scoring_criteria or "",
+        "hints": pre.hints() if pre else "无",
+        "answer": answer,
+    }
+
+def _pregrade(q, answer: str) -> Optional[PreGrade]:
+    """本地预评分；返回的 PreGrade.grading 非空时直接采用，不再调用 LLM。"""
+    if not config.PREGRADE_ENABLED:
+        return None
+    with metrics.stage("pregrade"):
+        pre = pregrade(q, answer)
+    metrics.pregrade(pre.outcome)
+    if pre.grading is not None:
+        logger.info(f"本地预评分直接判定 q_id={q.id} outcome={pre.outcome}")
+    return pre
 
+def _cache_key(q, answer: str) -> str:
     full = int(q.score or 10)
-    try:
-        t0 = time.perf_counter()
-        grading = await grade_chain().ainvoke({
-            "full_score": full,
-            "score_points": q.score_points or [],
-            "rubric": q.scoring_criteria or "",
-            "answer": body.original_answer
-        })
-        ms = (time.perf_counter() - t0) * 1000
-        logger.info(f"LLM评分完成，用时 {ms:.0f}ms, q_id={body.question_id}, full={full}")
-        grading["total_score"] = float(min(max(0.0, grading.get("total_score", 0.0)), full))
-    except Exception as e:
-        logger.exception(f"LLM评分异常: {e}")
-        grading = _fallback_grade(body.original_answer, full)
-
-    rec_id = await insert_answer_record(
-        session,
-        user_id=body.user_id,
-        q_id=body.question_id,
-        original_answer=body.original_answer,
-        grading=grading
-    )
-    logger.info(f"评分入库: answer_record_id={rec_id}, total={grading['total_score']}")
+    return grade_key(q.id, rubric_hash(full, q.score_points, q.scoring_criteria), answer, config.LLM_MODEL)
+
+def _clamp_score(score: Any, full: int) -> float:
+    return float(min(max(0.0, float(score)), full))
+
+def _clamp(grading: dict, full: int) -> dict:
+    # 缺总分时不补 0，留给 GradeResult 校验失败后兜底
+    if "total_score" in grading:
+        grading["total_score"] = _clamp_score(grading["total_score"], full)
+    return grading
+
+def _to_response(rec_id: int, grading: dict, cached: bool) -> AnswerResponse:
     return AnswerResponse(
         answer_record_id=rec_id,
         total_score=grading["total_score"],
@@ -56,4 +68,248 @@ async def submit_answer(body: AnswerRequest, session: AsyncSession) -> AnswerRes
         dimension_scores=grading.get("dimension_scores"),
         comments=grading.get("comments"),
         hit_score_points=grading.get("hit_score_points"),
+        cached=cached,
     )
+
+def _parallel(q, answer: str) -> bool:
+    """教学设计题或长作答按要点分项评分（至少两个要点才拆分）。"""
+    if not config.GRADE_PARALLEL_ENABLED or len(q.score_points or []) < 2:
+        return False
+    if q.question_type in config.GRADE_PARALLEL_TYPES:
+        return True
+    return 0 < config.GRADE_PARALLEL_MIN_CHARS <= len(normalize_answer(answer))
+
+async def _grade_points(q, answer: str, pre: Optional[PreGrade]) -> Tuple[dict, bool]:
+    """分项评分：满分按要点均分，每个要点一个短请求并发评分后合并。
+    单个要点失败只对该要点按字面命中兜底（命中给一半分）；全部失败时抛出，由调用方整体兜底。
+    每个要点由 LLM 归到题目的一个知识维度，要点得分按维度累加为 dimension_scores。
+    返回 (grading, 是否全部由 LLM 评出)。"""
+    full = int(q.score or 10)
+    points = [str(p) for p in q.score_points]
+    share = full / len(points)
+    dims = list(q.dims or [])
+    base = {
+        "full_score": full,
+        "score_points": q.score_points,
+        "rubric": q.scoring_criteria or "",
+        "dims": "、".join(dims) or "无",
+        "answer": answer,
+        "point_score": f"{share:.3g}",
+    }
+    sem = asyncio.Semaphore(config.GRADE_PARALLEL_CONCURRENCY)
+
+    async def one(point: str) -> Optional[Tuple[float, bool, str, str]]:
+        hint = "无" if pre is None else ("字面命中" if point in pre.hit_points else "未字面命中")
+        async with sem:
+            try:
+                r = await grade_point_chain().ainvoke({**base, "point": point, "hint": hint})
+                return (min(max(0.0, float(r["score"])), share), bool(r.get("hit")),
+                        str(r.get("comment") or ""), str(r.get("dim") or "").strip())
+            except Exception as e:
+                logger.warning(f"要点评分异常，该要点兜底 q_id={q.id} point={point}: {e!r}")
+                return None
+
+    results = await asyncio.gather(*(one(p) for p in points))
+    failed = [p for p, r in zip(points, results) if r is None]
+    if len(failed) == len(points):
+        raise RuntimeError(f"全部 {len(points)} 个要点评分失败")
+
+    total, subitem, hits, comments = 0.0, {}, [], []
+    by_dim = dict.fromkeys(dims, 0.0)
+    for p, r in zip(points, results):
+        if r is None:
+            metrics.fallback("grade_point")
+            literal = pre is not None and p in pre.hit_points
+            r = (share / 2 if literal else 0.0, literal, "（兜底机评）该要点评分暂不可用，按字面匹配估分。", "")
+        score, hit, comment, dim = r
+        total += score
+        subitem[p] = round(score, 1)
+        if hit:
+            hits.append(p)
+        if comment:
+            comments.append(f"{p}：{comment}")
+        if dim in by_dim:
+            by_dim[dim] += score
+        elif dims:
+            # 兜底要点或 LLM 给出的维度不在题目维度内：得分均摊到题目各维度
+            for d in dims:
+                by_dim[d] += score / len(dims)
+    grading = {
+        "total_score": round(total, 1),
+        "subitem_scores": subitem,
+        "comments": "\n".join(comments),
+        "hit_score_points": hits,
+    }
+    if by_dim:
+        grading["dimension_scores"] = {d: round(v, 1) for d, v in by_dim.items()}
+    return grading, not failed
+
+async def _llm_grade(q, answer: str, pre: Optional[PreGrade]) -> Tuple[dict, bool]:
+    """LLM 评分并截断到满分，返回 (grading, 是否可缓存)；分项评分中有要点兜底时不缓存。
+    结构不符（缺总分、字段类型错误等）抛 ValidationError，由调用方兜底，不写入缓存。"""
+    full = int(q.score or 10)
+    if _parallel(q, answer):
+        with metrics.stage("llm_grade_points") as t:
+            grading, complete = await _grade_points(q, answer, pre)
+        logger.info(f"LLM分项评分完成，用时 {t.ms:.0f}ms, q_id={q.id}, full={full}, "
+                    f"points={len(grading['subitem_scores'])}, complete={complete}")
+    else:
+        with metrics.stage("llm_grade") as t:
+            grading = await grade_chain().ainvoke(_grade_inputs(q, answer, pre))
+        logger.info(f"LLM评分完成，用时 {t.ms:.0f}ms, q_id={q.id}, full={full}")
+        complete = True
+    grading = _clamp(grading, full)
+    GradeResult.model_validate(grading)
+    return grading, complete
+
+def _fallback(answer: str, full: int) -> dict:
+    metrics.fallback("grade")
+    with metrics.stage("fallback"):
+        return _fallback_grade(answer, full)
+
+async def _grade(q, answer: str) -> Tuple[dict, bool]:
+    """评分：本地预评分能确定的直接返回；否则先查缓存，未命中调用 LLM（教学设计题/长作答分项并发），
+    LLM 失败时兜底。
+    返回 (grading, 是否命中缓存)。"""
+    full = int(q.score or 10)
+    pre = _pregrade(q, answer)
+    if pre is not None and pre.grading is not None:
+        return pre.grading, False
+    key = _cache_key(q, answer)
+    grading = await get_grading(key)
+    if grading is not None:
+        logger.info(f"评分缓存命中 q_id={q.id}")
+        return grading, True
+    try:
+        grading, complete = await _llm_grade(q, answer, pre)
+        # 只缓存 LLM 的正常结果，兜底分不缓存
+        if complete:
+            await set_grading(key, grading)
+    except Exception as e:
+        logger.exception(f"LLM评分异常: {e}")
+        grading = _fallback(answer, full)
+    return grading, False
+
+async def submit_answer(body: AnswerRequest, session: AsyncSession) -> AnswerResponse:
+    with metrics.stage("question_load"):
+        q = await question_cache.get(body.question_id, lambda: get_grading_view(session, body.question_id))
+    if not q:
+        logger.error(f"评分失败：题目不存在 q_id={body.question_id}")
+        raise ValueError("题目不存在或已删除")
+
+    grading, cached = await _grade(q, body.original_answer)
+    with metrics.stage("db_insert"):
+        rec_id = await insert_answer_record(
+            session,
+            user_id=body.user_id,
+            q_id=body.question_id,
+            original_answer=body.original_answer,
+            grading=grading
+        )
+    logger.info(f"评分入库: answer_record_id={rec_id}, total={grading['total_score']}")
+    return _to_response(rec_id, grading, cached)
+
+async def submit_answers_batch(items: List[AnswerRequest], session: AsyncSession) -> List[BatchAnswerItem]:
+    """批量评分：每道题只查一次，评分并发受 GRADE_BATCH_CONCURRENCY 限制，作答记录一次批量入库。"""
+    with metrics.stage("question_load"):
+        qs = await question_cache.get_many((it.question_id for it in items),
+                                           lambda ids: get_grading_views(session, ids))
+    sem = asyncio.Semaphore(config.GRADE_BATCH_CONCURRENCY)
+
+    async def one(it: AnswerRequest):
+        q = qs.get(it.question_id)
+        if not q:
+            return None
+        async with sem:
+            return await _grade(q, it.original_answer)
+
+    t0 = time.perf_counter()
+    graded = await asyncio.gather(*(one(it) for it in items))
+    ms = (time.perf_counter() - t0) * 1000
+    logger.info(f"批量评分完成，用时 {ms:.0f}ms, n={len(items)}, questions={len(qs)}")
+
+    ok = [(i, it, g) for i, (it, g) in enumerate(zip(items, graded)) if g is not None]
+    with metrics.stage("db_insert"):
+        rec_ids = await insert_answer_records(session, [
+            dict(user_id=it.user_id, q_id=it.question_id, original_answer=it.original_answer, grading=g[0])
+            for _, it, g in ok
+        ])
+    logger.info(f"批量评分入库: n={len(rec_ids)}")
+
+    out = [BatchAnswerItem(index=i, question_id=it.question_id, ok=False, error="题目不存在或已删除")
+           for i, it in enumerate(items)]
+    for rec_id, (i, it, (grading, cached)) in zip(rec_ids, ok):
+        out[i] = BatchAnswerItem(index=i, question_id=it.question_id, ok=True,
+                                 result=_to_response(rec_id, grading, cached))
+    return out
+
+async def _load_view(q_id: int):
+    async with AsyncSessionLocal() as session:
+        return await get_grading_view(session, q_id)
+
+async def stream_submit_answer(body: AnswerRequest) -> AsyncIterator[Tuple[str, Any]]:
+    """流式评分：LLM 每完成一个顶层字段即产出 ("field", {k: v})，入库后产出 ("done", AnswerResponse)。
+
+    会话只在题目缓存未命中与入库时短暂打开，不在 LLM 流式输出期间占用连接。
+    """
+    with metrics.stage("question_load"):
+        q = await question_cache.get(body.question_id, lambda: _load_view(body.question_id))
+    if not q:
+        logger.error(f"评分失败：题目不存在 q_id={body.question_id}")
+        raise ValueError("题目不存在或已删除")
+
+    full = int(q.score or 10)
+    pre = _pregrade(q, body.original_answer)
+    key = _cache_key(q, body.original_answer)
+    decided = pre is not None and pre.grading is not None
+    grading = pre.grading if decided else await get_grading(key)
+    cached = not decided and grading is not None
+    if grading is not None:
+        if cached:
+            logger.info(f"评分缓存命中 q_id={body.question_id}")
+        for k, v in grading.items():
+            yield "field", {k: v}
+    elif _parallel(q, body.original_answer):
+        # 分项评分各要点并发进行，合并后一次产出全部字段
+        try:
+            grading, complete = await _llm_grade(q, body.original_answer, pre)
+            if complete:
+                await set_grading(key, grading)
+        except Exception as e:
+            logger.exception(f"LLM分项评分异常: {e}")
+            grading = _fallback(body.original_answer, full)
+            yield "fallback", grading
+        else:
+            for k, v in grading.items():
+                yield "field", {k: v}
+    else:
+        parser = JSONFieldStream()
+        try:
+            with metrics.stage("llm_grade") as t:
+                async for piece in grade_stream(_grade_inputs(q, body.original_answer, pre)):
+                    for k, v in parser.feed(piece):
+                        # 总分在产出前就截断到满分，客户端不会先看到越界的分数
+                        yield "field", {k: _clamp_score(v, full) if k == "total_score" else v}
+            if not parser.done:
+                raise ValueError("LLM流式输出不完整")
+            logger.info(f"LLM流式评分完成，用时 {t.ms:.0f}ms, q_id={body.question_id}, full={full}")
+            grading = _clamp(parser.result, full)
+            # 结构不符（缺总分、字段类型错误等）按异常兜底，不写入缓存
+            GradeResult.model_validate(grading)
+            await set_grading(key, grading)
+        except Exception as e:
+            logger.exception(f"LLM流式评分异常: {e}")
+            grading = _fallback(body.original_answer, full)
+            yield "fallback", grading
+
+    with metrics.stage("db_insert"):
+        async with AsyncSessionLocal() as session:
+            rec_id = await insert_answer_record(
+                session,
+                user_id=body.user_id,
+                q_id=body.question_id,
+                original_answer=body.original_answer,
+                grading=grading
+            )
+    logger.info(f"评分入库: answer_record_id={rec_id}, total={grading['total_score']}")
+    yield "done", _to_response(rec_id, grading, cached).model_dump()
@@ -0,0 +1,161 @@
+import asyncio, json, logging, time
+from typing import Awaitable, Callable, Iterable, List, Optional, Tuple
+from app import config
+from app.deps import get_redis
+from app.db.base import AsyncSessionLocal
+from app.db.repo import dim_key, insert_questions
+from app.schemas.practice import PracticeItem
+
+logger = logging.getLogger("svc.inventory")
+
+# Redis 键：inv:q:<桶> 为待发放题目列表，inv:stats 为命中计数；
+# inv:hot 为自动登记的热门桶（ZSET，分值为最近一次命中/未命中时间），inv:miss:<桶> 为窗口内未命中计数
+_QUEUE_PREFIX = "inv:q:"
+_LOCK_PREFIX = "inv:lock:"
+_HOT_KEY = "inv:hot"
+_MISS_PREFIX = "inv:miss:"
+_STATS_KEY = "inv:stats"
+
+# (dims, 难度, 题型, 题数) -> 合格的题目（可能少于题数）
+Producer = Callable[[List[int], int, int, int], Awaitable[List[PracticeItem]]]
+
+def bucket_of(dims: Iterable[int], difficulty: int, qtype: int) -> str:
+    return f"{dim_key(dims)}:{difficulty}:{qtype}"
+
+def _parse_bucket(bucket: str) -> Tuple[List[int], int, int]:
+    dims, difficulty, qtype = bucket.split(":")
+    return [int(d) for d in dims.split(",") if d], int(difficulty), int(qtype)
+
+def target_depth(bucket: str) -> int:
+    return int(config.INVENTORY_BUCKET_DEPTHS.get(bucket, config.INVENTORY_TARGET_DEPTH))
+
+async def pop(dims: List[int], difficulty: int, qtype: int) -> Optional[Tuple[int, PracticeItem]]:
+    """从库存取一题；窗口内多次未命中的桶才登记为热门桶交给后台补货。Redis 异常按未命中处理。"""
+    if not config.INVENTORY_ENABLED:
+        return None
+    bucket = bucket_of(dims, difficulty, qtype)
+    try:
+        r = await get_redis()
+        raw = await r.lpop(_QUEUE_PREFIX + bucket)
+        now = time.time()
+        pipe = r.pipeline()
+        pipe.hincrby(_STATS_KEY, "hit" if raw else "miss", 1)
+        pipe.hincrby(_STATS_KEY, f"{'hit' if raw else 'miss'}:{bucket}", 1)
+        if raw:
+            # 只刷新已登记桶的活跃时间，不新增
+            pipe.zadd(_HOT_KEY, {bucket: now}, xx=True)
+        else:
+            pipe.incr(_MISS_PREFIX + bucket)
+        res = await pipe.execute()
+        if not raw:
+            await _note_miss(r, bucket, int(res[-1]), now)
+    except Exception as e:
+        logger.warning(f"库存读取失败，按未命中处理: {e}")
+        return None
+    if not raw:
+        logger.info(f"库存未命中 bucket={bucket}")
+        return None
+    data = json.loads(raw)
+    logger.info(f"库存命中 bucket={bucket} qid={data['question_id']}")
+    return data["question_id"], PracticeItem(**data["item"])
+
+async def push(bucket: str, entries: List[Tuple[int, PracticeItem]]) -> None:
+    if not entries:
+        return
+    r = await get_redis()
+    await r.rpush(_QUEUE_PREFIX + bucket, *(json.dumps({"question_id": qid, "item": item.model_dump()}, ensure_ascii=False)
+                                           for qid, item in entries))
+
+async def stats() -> dict:
+    r = await get_redis()
+    counters = {k: int(v) for k, v in (await r.hgetall(_STATS_KEY)).items()}
+    buckets = await _known_buckets(r)
+    depths = {}
+    for b in buckets:
+        depths[b] = {"depth": await r.llen(_QUEUE_PREFIX + b), "target": target_depth(b)}
+    hit, miss = counters.get("hit", 0), counters.get("miss", 0)
+    return {
+        "hit": hit,
+        "miss": miss,
+        "hit_rate": round(hit / (hit + miss), 4) if hit + miss else 0.0,
+        "buckets": depths,
+    }
+
+async def _note_miss(r, bucket: str, misses: int, now: float) -> None:
+    if misses == 1:
+        await r.expire(_MISS_PREFIX + bucket, config.INVENTORY_AUTO_WINDOW)
+    if bucket in config.INVENTORY_BUCKET_DEPTHS:
+        return
+    # 未开启自动登记时只补配置中的桶；任意组合偶发一次未命中不值得为它持续调用 LLM
+    if config.INVENTORY_AUTO_MIN_MISSES > 0 and misses >= config.INVENTORY_AUTO_MIN_MISSES:
+        if await r.zadd(_HOT_KEY, {bucket: now}):
+            logger.info(f"库存登记热门桶 bucket={bucket} misses={misses}")
+
+async def _prune_hot(r) -> None:
+    """清理长时间无人访问的热门桶及其库存，并限制热门桶总数。"""
+    cutoff = time.time() - config.INVENTORY_BUCKET_IDLE
+    idle = await r.zrangebyscore(_HOT_KEY, "-inf", cutoff)
+    total = await r.zcard(_HOT_KEY)
+    over = total - len(idle) - config.INVENTORY_MAX_BUCKETS
+    if over > 0:
+        # 超出上限时淘汰最久未访问的
+        idle += await r.zrange(_HOT_KEY, len(idle), len(idle) + over - 1)
+    if not idle:
+        return
+    pipe = r.pipeline()
+    pipe.zrem(_HOT_KEY, *idle)
+    # 库存中的题已入题库，丢弃队列不会丢题
+    pipe.delete(*(_QUEUE_PREFIX + b for b in idle if b not in config.INVENTORY_BUCKET_DEPTHS))
+    await pipe.execute()
+    logger.info(f"库存清理闲置桶 count={len(idle)}")
+
+async def _known_buckets(r) -> List[str]:
+    return sorted(set(await r.zrange(_HOT_KEY, 0, -1)) | set(config.INVENTORY_BUCKET_DEPTHS))
+
+async def _refill_bucket(r, bucket: str, produce: Producer, sem: asyncio.Semaphore) -> None:
+    depth = await r.llen(_QUEUE_PREFIX + bucket)
+    if depth >= config.INVENTORY_LOW_WATER:
+        return
+    # 多个 worker 进程同时运行时，同一个桶只允许一个进程补货
+    if not await r.set(_LOCK_PREFIX + bucket, "1", nx=True, ex=300):
+        return
+    try:
+        need = target_depth(bucket) - depth
+        dims, difficulty, qtype = _parse_bucket(bucket)
+        logger.info(f"库存补货 bucket={bucket} depth={depth} need={need}")
+
+        if need <= 0:
+            return
+        # 一次批量生成补齐缺口，整批一个事务入库；生成失败或不足的部分（兜底题不入库存）等下一轮再补
+        async with sem:
+            try:
+                items = await produce(dims, difficulty, qtype, need)
+            except Exception as e:
+                logger.warning(f"库存补货生成失败 bucket={bucket}: {e}")
+                return
+        if not items:
+            return
+        async with AsyncSessionLocal() as session:
+            qids = await insert_questions(session, [it.model_dump() for it in items])
+        # 内容重复的题入库时合并为同一个 ID，只入库存一次
+        pairs = list({qid: item for qid, item in reversed(list(zip(qids, items)))}.items())
+        await push(bucket, pairs)
+        logger.info(f"库存补货完成 bucket={bucket} added={len(pairs)}/{need}")
+    finally:
+        await r.delete(_LOCK_PREFIX + bucket)
+
+async def refill_loop(produce: Producer) -> None:
+    """后台补货：定期扫描配置桶与热门桶，低于低水位则补到目标深度。"""
+    sem = asyncio.Semaphore(config.INVENTORY_REFILL_CONCURRENCY)
+    logger.info(f"库存补货任务启动 low={config.INVENTORY_LOW_WATER} target={config.INVENTORY_TARGET_DEPTH}")
+    while True:
+        try:
+            r = await get_redis()
+            await _prune_hot(r)
+            buckets = await _known_buckets(r)
+            await asyncio.gather(*(_refill_bucket(r, b, produce, sem) for b in buckets))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.exception(f"库存补货异常: {e}")
+        await asyncio.sleep(config.INVENTORY_REFILL_INTERVAL)
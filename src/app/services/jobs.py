@@ -0,0 +1,211 @@
+import asyncio, json, logging, os, socket, time, uuid
+from typing import Any, Awaitable, Callable, Dict, Optional
+from app import config
+from app.db.base import AsyncSessionLocal
+from app.deps import get_redis
+from app.schemas.practice import AnswerRequest, GenerateResponse, PracticeRequest
+from app.services.generator import generate_practice_item
+from app.services.grader import submit_answer
+
+logger = logging.getLogger("svc.jobs")
+
+# 异步任务：API 只登记任务并写入 Redis Stream，立即返回 job_id；worker 进程（python -m app.worker）
+# 以消费者组消费，调用与同步接口相同的服务函数。任务状态与结果存放在 job:<id> 哈希中。
+# 失败按 JOB_MAX_ATTEMPTS 重试（参数错误等不可重试的异常直接失败），最终失败的任务写入 jobs:dead。
+# 重试不占用消费协程：任务按到期时间写入 jobs:delayed（ZSET），到期后由搬运协程重新写入 Stream。
+
+_STREAM = "jobs:stream"
+_DEAD = "jobs:dead"
+_DELAYED = "jobs:delayed"
+_GROUP = "jobs"
+_JOB_PREFIX = "job:"
+_CONSUMER = f"{socket.gethostname()}-{os.getpid()}"
+
+TERMINAL = ("done", "failed")
+
+# 原子地把到期的重试任务从 ZSET 搬回 Stream，多个 worker 同时搬运也不会重复投递
+PROMOTE_LUA = """
+local due = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, tonumber(ARGV[2]))
+for _, id in ipairs(due) do
+  redis.call('ZREM', KEYS[1], id)
+  redis.call('XADD', KEYS[2], '*', 'job_id', id)
+end
+return #due
+"""
+_PROMOTE_INTERVAL = 1.0
+
+async def _run_generate(payload: dict) -> dict:
+    req = PracticeRequest(**payload)
+    async with AsyncSessionLocal() as session:
+        item, qid = await generate_practice_item(req, session)
+    return GenerateResponse(question_id=qid, item=item).model_dump()
+
+async def _run_answer(payload: dict) -> dict:
+    body = AnswerRequest(**payload)
+    async with AsyncSessionLocal() as session:
+        resp = await submit_answer(body, session)
+    return resp.model_dump()
+
+_HANDLERS: Dict[str, Callable[[dict], Awaitable[dict]]] = {
+    "generate": _run_generate,
+    "answer": _run_answer,
+}
+
+async def enqueue(kind: str, payload: dict) -> str:
+    job_id = uuid.uuid4().hex
+    now = time.time()
+    r = await get_redis()
+    pipe = r.pipeline()
+    pipe.hset(_JOB_PREFIX + job_id, mapping={
+        "kind": kind,
+        "status": "queued",
+        "payload": json.dumps(payload, ensure_ascii=False),
+        "attempts": 0,
+        "created": now,
+        "updated": now,
+    })
+    pipe.expire(_JOB_PREFIX + job_id, config.JOB_RESULT_TTL)
+    pipe.xadd(_STREAM, {"job_id": job_id})
+    await pipe.execute()
+    logger.info(f"任务入队 job_id={job_id} kind={kind}")
+    return job_id
+
+async def get(job_id: str) -> Optional[dict]:
+    r = await get_redis()
+    job = await r.hgetall(_JOB_PREFIX + job_id)
+    if not job:
+        return None
+    return {
+        "job_id": job_id,
+        "kind": job["kind"],
+        "status": job["status"],
+        "attempts": int(job.get("attempts", 0)),
+        "result": json.loads(job["result"]) if job.get("result") else None,
+        "error": job.get("error") or None,
+    }
+
+async def wait(job_id: str, timeout: float) -> Optional[dict]:
+    """长轮询：任务结束或超时后返回当前状态。"""
+    deadline = time.monotonic() + min(timeout, config.JOB_WAIT_MAX)
+    delay = 0.1
+    while True:
+        job = await get(job_id)
+        remaining = deadline - time.monotonic()
+        if job is None or job["status"] in TERMINAL or remaining <= 0:
+            return job
+        await asyncio.sleep(min(delay, remaining))
+        delay = min(delay * 1.5, 1.0)
+
+async def _finish(r, eid: str, key: str, fields: dict, retry_at: Optional[float] = None) -> None:
+    """更新任务状态并确认消息；retry_at 非空时在同一事务内登记延迟重试。"""
+    pipe = r.pipeline()
+    pipe.hset(key, mapping={**fields, "updated": time.time()})
+    pipe.expire(key, config.JOB_RESULT_TTL)
+    if retry_at is not None:
+        pipe.zadd(_DELAYED, {key[len(_JOB_PREFIX):]: retry_at})
+    pipe.xack(_STREAM, _GROUP, eid)
+    pipe.xdel(_STREAM, eid)
+    await pipe.execute()
+
+async def _process(r, eid: str, fields: dict) -> None:
+    job_id = fields.get("job_id", "")
+    key = _JOB_PREFIX + job_id
+    job = await r.hgetall(key)
+    if not job or job.get("status") in TERMINAL:
+        # 结果已过期或重复投递
+        await r.xack(_STREAM, _GROUP, eid)
+        await r.xdel(_STREAM, eid)
+        return
+    attempts = await r.hincrby(key, "attempts", 1)
+    await r.hset(key, mapping={"status": "running", "updated": time.time()})
+    t0 = time.perf_counter()
+    try:
+        result = await _HANDLERS[job["kind"]](json.loads(job["payload"]))
+    except Exception as e:
+        # 参数校验失败、题目不存在等（ValueError，含 pydantic.ValidationError）重试也不会成功
+        permanent = isinstance(e, (ValueError, KeyError))
+        if permanent or attempts >= config.JOB_MAX_ATTEMPTS:
+            logger.exception(f"任务失败 job_id={job_id} kind={job.get('kind')} attempts={attempts}: {e}")
+            await r.xadd(_DEAD, {"job_id": job_id, "kind": job.get("kind", ""), "error": str(e)[:500]})
+            await _finish(r, eid, key, {"status": "failed", "error": str(e)[:500]})
+            return
+        delay = min(2 ** attempts, 30)
+        logger.warning(f"任务异常，{delay}s 后重试 job_id={job_id} attempts={attempts}: {e}")
+        await _finish(r, eid, key, {"status": "queued", "error": str(e)[:500]}, retry_at=time.time() + delay)
+        return
+    await _finish(r, eid, key, {"status": "done", "result": json.dumps(result, ensure_ascii=False), "error": ""})
+    logger.info(f"任务完成 job_id={job_id} kind={job['kind']} 用时 {(time.perf_counter() - t0) * 1000:.0f}ms")
+
+async def _ensure_group(r) -> None:
+    try:
+        await r.xgroup_create(_STREAM, _GROUP, id="0", mkstream=True)
+    except Exception as e:
+        if "BUSYGROUP" not in str(e):
+            raise
+
+async def _consume(r) -> None:
+    while True:
+        resp = await r.xreadgroup(_GROUP, _CONSUMER, {_STREAM: ">"}, count=1, block=5000)
+        for _, entries in resp or []:
+            for eid, fields in entries:
+                await _process(r, eid, fields)
+
+async def _reclaim(r) -> None:
+    # 接管崩溃消费者遗留的待确认消息
+    while True:
+        await asyncio.sleep(max(1.0, config.JOB_CLAIM_IDLE_MS / 2000))
+        resp = await r.xautoclaim(_STREAM, _GROUP, _CONSUMER, min_idle_time=config.JOB_CLAIM_IDLE_MS,
+                                  start_id="0-0", count=config.JOB_WORKER_CONCURRENCY)
+        for eid, fields in resp[1]:
+            if fields:
+                logger.warning(f"接管超时未确认的任务 entry={eid} job_id={fields.get('job_id')}")
+                await _process(r, eid, fields)
+            else:
+                await r.xack(_STREAM, _GROUP, eid)
+
+async def _promote(r) -> None:
+    # 到期的延迟重试任务重新入队
+    while True:
+        n = await r.eval(PROMOTE_LUA, 2, _DELAYED, _STREAM, time.time(), 100)
+        if n:
+            logger.info(f"延迟重试任务重新入队 {n} 个")
+        else:
+            await asyncio.sleep(_PROMOTE_INTERVAL)
+
+async def run_worker(concurrency: Optional[int] = None) -> None:
+    """worker 主循环：concurrency 个消费协程 + 接管协程 + 延迟重试搬运协程，异常后 1s 重启。"""
+    n = concurrency or config.JOB_WORKER_CONCURRENCY
+    logger.info(f"任务 worker 启动 consumer={_CONSUMER} concurrency={n}")
+    while True:
+        tasks = []
+        try:
+            r = await get_redis()
+            await _ensure_group(r)
+            tasks = ([asyncio.create_task(_reclaim(r)), asyncio.create_task(_promote(r))]
+                     + [asyncio.create_task(_consume(r)) for _ in range(n)])
+            done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+            for t in done:
+                t.result()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.exception(f"任务 worker 异常，1s 后重启: {e}")
+        finally:
+            # 任一协程异常时整体重启；被取消时未确认的消息留在 PEL，由接管协程重新投递
+            for t in tasks:
+                t.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+        await asyncio.sleep(1)
+
+async def stats() -> Dict[str, Any]:
+    r = await get_redis()
+    await _ensure_group(r)
+    groups = {g["name"]: g for g in await r.xinfo_groups(_STREAM)}
+    group = groups.get(_GROUP, {})
+    return {
+        "backlog": await r.xlen(_STREAM),
+        "pending": int(group.get("pending", 0)),
+        "consumers": int(group.get("consumers", 0)),
+        "delayed": await r.zcard(_DELAYED),
+        "dead": await r.xlen(_DEAD),
+    }
@@ -0,0 +1,43 @@
+import logging, random
+from typing import List
+from app import config
+from app.db.base import AsyncSessionLocal
+from app.db.repo import get_mastery
+from app.services import dimension
+
+logger = logging.getLogger("svc.mastery")
+
+# 基于 user_dim_mastery 汇总表的自适应选维度：每次只读该用户的 ≤维度数 行，不扫描作答历史。
+
+async def weakest(user_id: int, k: int) -> List[int]:
+    """返回该用户掌握度最低的 k 个维度；未练习的维度按 MASTERY_PRIOR 计，同分时练得少的优先、再随机。"""
+    cat = await dimension.catalog()
+    try:
+        async with AsyncSessionLocal() as session:
+            rows = await get_mastery(session, user_id)
+    except Exception as e:
+        logger.warning(f"读取掌握度失败，改为随机抽取 user={user_id}: {e}")
+        return await dimension.sample(k)
+
+    def rank(kd: int):
+        r = rows.get(kd)
+        level = r.ewma_score if r is not None and r.ewma_score is not None else config.MASTERY_PRIOR
+        return level, r.attempts if r is not None else 0, random.random()
+
+    return sorted(cat, key=rank)[:k]
+
+async def profile(user_id: int) -> List[dict]:
+    cat = await dimension.catalog()
+    async with AsyncSessionLocal() as session:
+        rows = await get_mastery(session, user_id)
+    return [
+        {
+            "kd_id": kd,
+            "name": cat.get(kd),
+            "attempts": r.attempts,
+            "avg_score": round(r.score_sum / r.attempts, 4) if r.attempts else None,
+            "ewma_score": round(r.ewma_score, 4) if r.ewma_score is not None else None,
+            "last_attempt": r.last_attempt.isoformat() if r.last_attempt else None,
+        }
+        for kd, r in sorted(rows.items(), key=lambda x: (x[1].ewma_score or 0.0))
+    ]
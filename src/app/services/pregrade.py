@@ -0,0 +1,157 @@
+import re
+from collections import deque
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Dict, FrozenSet, List, Optional, Sequence, Set, Tuple
+from app import config
+from app.cache.redis import normalize_answer
+
+# 本地预评分：在调用 LLM 之前用确定性规则处理明显的作答（过短、严重超字数、照抄题目/参考答案、
+# 完全未涉及要点），直接给出结果；其余作答把要点命中情况作为提示交给 LLM。
+# 要点与关键词用 Aho-Corasick 自动机一次扫描匹配，自动机按题目缓存；与参考答案的相似度用字符 3-gram。
+
+_N = 3
+# 拆分核心要点的连接词，"问题识别与聚焦" -> 问题识别 / 聚焦
+_POINT_SPLIT = re.compile(r"[与和及、/或]")
+# 从评分标准与参考答案中切关键词：按标点、序号与评分套话切开，保留 2-8 字的片段
+_KW_SPLIT = re.compile(r"[0-9０-９.]+分|要点|满分|不得分|得分|部分|[\s，。、；;：:,.!?！？（）()【】\[\]“”\"'0-9０-９]+")
+
+class Automaton:
+    """Aho-Corasick 多模式匹配，find 返回文本中出现过的模式下标。"""
+    __slots__ = ("_goto", "_fail", "_out")
+
+    def __init__(self, patterns: Sequence[str]):
+        goto: List[Dict[str, int]] = [{}]
+        out: List[Set[int]] = [set()]
+        for i, p in enumerate(patterns):
+            s = 0
+            for ch in p:
+                nxt = goto[s].get(ch)
+                if nxt is None:
+                    nxt = len(goto)
+                    goto[s][ch] = nxt
+                    goto.append({})
+                    out.append(set())
+                s = nxt
+            out[s].add(i)
+        fail = [0] * len(goto)
+        queue = deque(goto[0].values())
+        while queue:
+            s = queue.popleft()
+            for ch, t in goto[s].items():
+                queue.append(t)
+                f = fail[s]
+                while f and ch not in goto[f]:
+                    f = fail[f]
+                fail[t] = goto[f].get(ch, 0)
+                out[t] |= out[fail[t]]
+        self._goto = goto
+        self._fail = fail
+        self._out: List[FrozenSet[int]] = [frozenset(o) for o in out]
+
+    def find(self, text: str) -> Set[int]:
+        goto, fail, out = self._goto, self._fail, self._out
+        hits: Set[int] = set()
+        s = 0
+        for ch in text:
+            while s and ch not in goto[s]:
+                s = fail[s]
+            s = goto[s].get(ch, 0)
+            if out[s]:
+                hits |= out[s]
+        return hits
+
+def _grams(text: str) -> FrozenSet[str]:
+    if len(text) < _N:
+        return frozenset([text]) if text else frozenset()
+    return frozenset(text[i:i + _N] for i in range(len(text) - _N + 1))
+
+def _containment(a: FrozenSet[str], b: FrozenSet[str]) -> float:
+    """a 中有多大比例的 n-gram 出现在 b 中。"""
+    return len(a & b) / len(a) if a else 0.0
+
+def _keywords(text: str) -> List[str]:
+    out = []
+    for seg in _KW_SPLIT.split(text or ""):
+        seg = normalize_answer(seg)
+        if 2 <= len(seg) <= 8:
+            out.append(seg)
+    return out
+
+@dataclass(frozen=True)
+class _Matcher:
+    automaton: Automaton
+    owners: Tuple[int, ...]        # 模式下标 -> 要点下标；-1 表示评分标准/参考答案关键词
+    title_grams: FrozenSet[str]
+    ref_grams: FrozenSet[str]
+
+@lru_cache(maxsize=2048)
+def _matcher(points: Tuple[str, ...], rubric: str, reference: str, title: str) -> _Matcher:
+    patterns: Dict[str, int] = {}
+    for i, p in enumerate(points):
+        for term in [p, *_POINT_SPLIT.split(p)]:
+            term = normalize_answer(term)
+            if len(term) >= 2:
+                patterns.setdefault(term, i)
+    for kw in _keywords(rubric) + _keywords(reference):
+        patterns.setdefault(kw, -1)
+    return _Matcher(
+        automaton=Automaton(list(patterns)),
+        owners=tuple(patterns.values()),
+        title_grams=_grams(normalize_answer(title)),
+        ref_grams=_grams(normalize_answer(reference)),
+    )
+
+@dataclass
+class PreGrade:
+    outcome: str                      # too_short / over_limit / copy_question / copy_reference / no_points / llm
+    grading: Optional[dict] = None    # 确定性结果；为 None 时需要 LLM 评分
+    hit_points: List[str] = field(default_factory=list)
+    missed_points: List[str] = field(default_factory=list)
+    ref_overlap: float = 0.0
+
+    def hints(self) -> str:
+        """交给 LLM 的提示：本地匹配到的要点与参考答案重合度。"""
+        return (f"字面命中要点: {'、'.join(self.hit_points) or '无'}；"
+                f"未字面命中: {'、'.join(self.missed_points) or '无'}；"
+                f"与参考答案字面重合度: {self.ref_overlap:.2f}")
+
+def _decided(outcome: str, points: Sequence[str], comments: str, **kw) -> PreGrade:
+    grading = {
+        "total_score": 0.0,
+        "subitem_scores": {p: 0.0 for p in points},
+        "comments": f"（自动判定）{comments}",
+        "hit_score_points": [],
+    }
+    return PreGrade(outcome=outcome, grading=grading, missed_points=list(points), **kw)
+
+def pregrade(q, answer: str) -> PreGrade:
+    """对作答做确定性预判。q 需要 score_points / scoring_criteria / word_limit，
+    answer_content / title 缺失时跳过照抄检测。"""
+    points = [str(p) for p in (q.score_points or [])]
+    norm = normalize_answer(answer)
+    if len(norm) < config.PREGRADE_MIN_CHARS:
+        return _decided("too_short", points, "作答内容过少，无法评分，请完整作答后再提交。")
+    limit = q.word_limit or 0
+    if limit and config.PREGRADE_OVER_LIMIT_FACTOR > 0 and len(norm) > limit * config.PREGRADE_OVER_LIMIT_FACTOR:
+        return _decided("over_limit", points,
+                        f"作答约 {len(norm)} 字，远超字数上限 {limit} 字，按无效作答处理。")
+
+    reference = getattr(q, "answer_content", None) or ""
+    m = _matcher(tuple(points), q.scoring_criteria or "", reference, getattr(q, "title", None) or "")
+    grams = _grams(norm)
+    if m.title_grams and _containment(grams, m.title_grams) >= config.PREGRADE_COPY_THRESHOLD:
+        return _decided("copy_question", points, "作答基本照抄题目，未给出自己的分析。")
+    if m.ref_grams and _containment(grams, m.ref_grams) >= config.PREGRADE_COPY_THRESHOLD:
+        return _decided("copy_reference", points, "作答与参考答案高度雷同，请用自己的语言作答。")
+
+    owners = m.owners
+    found = m.automaton.find(norm)
+    hit_idx = {owners[i] for i in found}
+    hit = [p for i, p in enumerate(points) if i in hit_idx]
+    missed = [p for i, p in enumerate(points) if i not in hit_idx]
+    overlap = _containment(m.ref_grams, grams)
+    if owners and not found and overlap < config.PREGRADE_MIN_OVERLAP:
+        return _decided("no_points", points, "作答未涉及任何核心要点与评分关键词，建议对照题目要求重新作答。",
+                        ref_overlap=overlap)
+    return PreGrade(outcome="llm", hit_points=hit, missed_points=missed, ref_overlap=overlap)
@@ -0,0 +1,301 @@
+import csv, io, json, logging, time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from decimal import Decimal
+from typing import Any, AsyncIterator, Dict, List, Optional, Sequence
+from sqlalchemy import insert, or_, select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from app import config
+from app.db import models as m
+from app.db.base import AsyncSessionLocal, READ
+from app.db.repo import content_hash, dim_key, question_insert
+
+logger = logging.getLogger("svc.transfer")
+
+# 题库（question + question_kd_relation）与作答记录的导入导出。
+# 导出：服务端游标按 EXPORT_BATCH_ROWS 分批读取（只读副本），逐批编码为 NDJSON/CSV 输出，内存占用与总行数无关。
+# 导入：NDJSON 按 IMPORT_BATCH_ROWS 分批，每批一个事务：按内容哈希去重、批量解析维度，
+# Postgres 上用 asyncpg COPY 进临时表再 INSERT ... SELECT，其他数据库（压测用 SQLite）退化为多行 INSERT；
+# 两条路径都以 ON CONFLICT (content_hash) DO NOTHING 写入，与并发导入/出题撞车时跳过而不是整批失败。
+
+_Q_FIELDS = ("id", "question_type", "difficulty", "title", "material", "requirements", "score", "suggest_time",
+             "word_limit", "score_points", "answer_content", "scoring_criteria", "create_time", "content_hash")
+_A_FIELDS = ("id", "user_id", "q_id", "answer_type", "original_answer", "submit_time", "total_score",
+             "subitem_scores", "dimension_scores", "comments", "hit_score_points")
+# 导出题目时附加的维度列
+_Q_EXTRA = ("dims", "dim_names")
+# 导入时写入的题目列（id 由 question 表的序列默认值生成，维度关系单独写入）
+_Q_COPY = ("question_type", "difficulty", "title", "material", "requirements", "score", "suggest_time",
+           "word_limit", "score_points", "answer_content", "scoring_criteria", "create_time", "dim_key",
+           "content_hash")
+
+KINDS = ("questions", "answers")
+FORMATS = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+@dataclass
+class Filters:
+    dims: Optional[List[int]] = None
+    difficulty: Optional[int] = None
+    since: Optional[datetime] = None
+    until: Optional[datetime] = None
+
+def _aware(t: datetime) -> datetime:
+    # 不带时区的时间按 UTC 理解（列为 TIMESTAMPTZ）
+    return t if t.tzinfo else t.replace(tzinfo=timezone.utc)
+
+def _question_stmt(f: Filters):
+    q, rel = m.Question, m.QuestionKdRelation
+    stmt = select(*(getattr(q, c) for c in _Q_FIELDS))
+    if f.dims:
+        stmt = stmt.where(select(rel.q_id).where(rel.q_id == q.id, rel.kd_id.in_(f.dims)).exists())
+    if f.difficulty is not None:
+        stmt = stmt.where(q.difficulty == f.difficulty)
+    if f.since is not None:
+        stmt = stmt.where(q.create_time >= _aware(f.since))
+    if f.until is not None:
+        stmt = stmt.where(q.create_time < _aware(f.until))
+    return stmt.order_by(q.id)
+
+def _answer_stmt(f: Filters):
+    a, q, rel = m.AnswerRecord, m.Question, m.QuestionKdRelation
+    stmt = select(*(getattr(a, c) for c in _A_FIELDS))
+    if f.dims:
+        stmt = stmt.where(select(rel.q_id).where(rel.q_id == a.q_id, rel.kd_id.in_(f.dims)).exists())
+    if f.difficulty is not None:
+        stmt = stmt.where(a.q_id.in_(select(q.id).where(q.difficulty == f.difficulty)))
+    if f.since is not None:
+        stmt = stmt.where(a.submit_time >= _aware(f.since))
+    if f.until is not None:
+        stmt = stmt.where(a.submit_time < _aware(f.until))
+    return stmt.order_by(a.id)
+
+async def _attach_dims(session: AsyncSession, rows: List[dict]) -> None:
+    """一批题目一次查询维度关系与名称。"""
+    rel, kd = m.QuestionKdRelation, m.KnowledgeDimension
+    res = await session.execute(
+        select(rel.q_id, rel.kd_id, kd.name).join(kd, kd.id == rel.kd_id)
+        .where(rel.q_id.in_([r["id"] for r in rows])).order_by(rel.q_id, rel.kd_id),
+        bind_arguments=READ,
+    )
+    by_q: Dict[int, List[tuple]] = {}
+    for q_id, kd_id, name in res.all():
+        by_q.setdefault(q_id, []).append((kd_id, name))
+    for r in rows:
+        pairs = by_q.get(r["id"], [])
+        r["dims"] = [d for d, _ in pairs]
+        r["dim_names"] = [n for _, n in pairs]
+
+async def _batches(kind: str, f: Filters) -> AsyncIterator[List[dict]]:
+    stmt = (_question_stmt(f) if kind == "questions" else _answer_stmt(f))
+    stmt = stmt.execution_options(yield_per=config.EXPORT_BATCH_ROWS)
+    # 两个会话：一个持有服务端游标，另一个按批查维度关系
+    async with AsyncSessionLocal() as session, AsyncSessionLocal() as side:
+        result = await session.stream(stmt, bind_arguments=READ)
+        async for part in result.mappings().partitions():
+            rows = [dict(r) for r in part]
+            if kind == "questions":
+                await _attach_dims(side, rows)
+            yield rows
+
+def _plain(v: Any) -> Any:
+    if isinstance(v, datetime):
+        return v.isoformat()
+    if isinstance(v, Decimal):
+        return float(v)
+    return v
+
+def _ndjson(rows: List[dict]) -> str:
+    return "".join(json.dumps({k: _plain(v) for k, v in r.items()}, ensure_ascii=False) + "\n" for r in rows)
+
+def _csv(rows: List[dict], header: Sequence[str], with_header: bool) -> str:
+    buf = io.StringIO()
+    w = csv.writer(buf)
+    if with_header:
+        w.writerow(header)
+    for r in rows:
+        # 数组/对象列以 JSON 文本写入单元格
+        w.writerow([json.dumps(v, ensure_ascii=False) if isinstance(v, (list, dict)) else _plain(v)
+                    for v in (r.get(c) for c in header)])
+    return buf.getvalue()
+
+async def export(kind: str, fmt: str, f: Filters) -> AsyncIterator[str]:
+    """按批产出编码后的文本块；kind 为 questions / answers，fmt 为 ndjson / csv。"""
+    if kind not in KINDS or fmt not in FORMATS:
+        raise ValueError(f"不支持的导出：kind={kind} format={fmt}")
+    header = (_Q_FIELDS + _Q_EXTRA) if kind == "questions" else _A_FIELDS
+    t0, n = time.perf_counter(), 0
+    if fmt == "csv":
+        yield _csv([], header, True)
+    async for rows in _batches(kind, f):
+        n += len(rows)
+        yield _ndjson(rows) if fmt == "ndjson" else _csv(rows, header, False)
+    logger.info(f"导出完成 kind={kind} format={fmt} rows={n} 用时 {(time.perf_counter() - t0) * 1000:.0f}ms")
+
+async def _lines(chunks: AsyncIterator[Any]) -> AsyncIterator[str]:
+    """把任意切分的字节/文本块还原为行。"""
+    tail = ""
+    async for chunk in chunks:
+        tail += chunk.decode("utf-8") if isinstance(chunk, (bytes, bytearray)) else chunk
+        *lines, tail = tail.split("\n")
+        for line in lines:
+            yield line
+    if tail:
+        yield tail
+
+def _parse_time(v: Any) -> datetime:
+    if not v:
+        return datetime.now(timezone.utc)
+    return _aware(datetime.fromisoformat(v) if isinstance(v, str) else v)
+
+def _int_or_none(v: Any) -> Optional[int]:
+    return int(v) if v is not None and v != "" else None
+
+def _question_of(obj: dict) -> dict:
+    """校验并规范化一行导入数据；缺少必填字段时抛 KeyError/ValueError。"""
+    qtype, diff, title = int(obj["question_type"]), int(obj["difficulty"]), obj["title"]
+    if qtype not in (1, 2) or diff not in (1, 2, 3) or not title:
+        raise ValueError("题型/难度/题目不合法")
+    return {
+        "question_type": qtype,
+        "difficulty": diff,
+        "title": title,
+        "material": obj.get("material"),
+        "requirements": obj.get("requirements"),
+        "score": int(obj.get("score") or 10),
+        "suggest_time": _int_or_none(obj.get("suggest_time")),
+        "word_limit": _int_or_none(obj.get("word_limit")),
+        "score_points": obj.get("score_points"),
+        "answer_content": obj.get("answer_content"),
+        "scoring_criteria": obj.get("scoring_criteria"),
+        "create_time": _parse_time(obj.get("create_time")),
+        "content_hash": content_hash(qtype, diff, title, obj.get("material"), obj.get("answer_content"),
+                                     obj.get("scoring_criteria")),
+    }
+
+async def _resolve_dims(session: AsyncSession, items: List[dict]) -> None:
+    """一批题目一次查询维度目录：有维度名称时按名称匹配，没有名称才直接使用维度 ID。
+
+    两个库的自增 ID 可能撞号，源 ID 在目标库存在但名称不同（名称对不上）的不使用该 ID，计为 dim_mismatch。
+    """
+    ids = {d for it in items for d in it["_dims"]}
+    names = {n for it in items for n in it["_dim_names"] if n}
+    kd = m.KnowledgeDimension
+    rows = (await session.execute(select(kd.id, kd.name).where(or_(kd.id.in_(ids), kd.name.in_(names))))).all()
+    name_of = {r.id: r.name for r in rows}
+    by_name = {r.name: r.id for r in rows}
+    reported = set()
+    for it in items:
+        resolved, mismatch = [], 0
+        for i, d in enumerate(it["_dims"]):
+            name = it["_dim_names"][i] if i < len(it["_dim_names"]) else None
+            if not name:
+                kd_id = d if d in name_of else None
+            else:
+                kd_id = by_name.get(name)
+                if d in name_of and name_of[d] != name:
+                    mismatch += 1
+                    if (d, name) not in reported:
+                        # 同一批内相同的不一致只记一次
+                        reported.add((d, name))
+                        logger.warning(f"导入维度不一致 源ID={d} 名称={name}，目标库该ID为「{name_of[d]}」，"
+                                       f"{f'按名称改用 {kd_id}' if kd_id is not None else '按名称未找到，不关联'}")
+            if kd_id is not None and kd_id not in resolved:
+                resolved.append(kd_id)
+        it["_resolved"] = resolved
+        it["_dim_mismatch"] = mismatch
+        it["dim_key"] = dim_key(resolved) if resolved else None
+
+async def _copy_insert(session: AsyncSession, items: List[dict]) -> List[dict]:
+    # COPY 进会话级临时表，再一条 INSERT ... SELECT ... ON CONFLICT (content_hash) DO NOTHING 写入题目，
+    # 并发导入同一份数据时不会因唯一索引整批失败；维度关系只为新写入的题目 COPY
+    cols = list(_Q_COPY)
+    col_list = ", ".join(cols)
+    await session.execute(text(
+        f"CREATE TEMP TABLE IF NOT EXISTS question_import ON COMMIT DELETE ROWS "
+        f"AS SELECT {col_list} FROM question WITH NO DATA"
+    ))
+    conn = await (await session.connection()).get_raw_connection()
+    pg = conn.driver_connection
+    await pg.copy_records_to_table("question_import", columns=cols, records=[
+        tuple(json.dumps(it[c], ensure_ascii=False) if c == "score_points" and it[c] is not None else it[c]
+              for c in cols)
+        for it in items
+    ])
+    inserted = dict((await session.execute(text(
+        f"INSERT INTO question ({col_list}) SELECT {col_list} FROM question_import "
+        f"ON CONFLICT (content_hash) DO NOTHING RETURNING content_hash, id"
+    ))).all())
+    new = [it for it in items if it["content_hash"] in inserted]
+    for it in new:
+        it["id"] = inserted[it["content_hash"]]
+    await pg.copy_records_to_table("question_kd_relation", columns=["q_id", "kd_id"],
+                                   records=[(it["id"], kd) for it in new for kd in it["_resolved"]])
+    return new
+
+async def _plain_insert(session: AsyncSession, items: List[dict]) -> List[dict]:
+    cols = list(_Q_COPY)
+    stmt = question_insert(session.get_bind().dialect.name).returning(m.Question.content_hash, m.Question.id)
+    inserted = dict((await session.execute(stmt, [{c: it[c] for c in cols} for it in items])).all())
+    new = [it for it in items if it["content_hash"] in inserted]
+    rels = [{"q_id": inserted[it["content_hash"]], "kd_id": kd} for it in new for kd in it["_resolved"]]
+    if rels:
+        await session.execute(insert(m.QuestionKdRelation), rels)
+    return new
+
+async def _import_batch(session: AsyncSession, batch: List[dict], stats: Dict[str, int]) -> None:
+    items: Dict[str, dict] = {}
+    for obj in batch:
+        try:
+            it = _question_of(obj)
+            it["_dims"] = [int(d) for d in obj.get("dims") or []]
+            it["_dim_names"] = [str(n) for n in obj.get("dim_names") or []]
+        except (KeyError, TypeError, ValueError):
+            stats["invalid"] += 1
+            continue
+        if it["content_hash"] in items:
+            stats["duplicate"] += 1
+            continue
+        items[it["content_hash"]] = it
+    if not items:
+        return
+    existing = set((await session.execute(
+        select(m.Question.content_hash).where(m.Question.content_hash.in_(list(items)))
+    )).scalars().all())
+    new = [it for h, it in items.items() if h not in existing]
+    if new:
+        await _resolve_dims(session, new)
+        if session.get_bind().dialect.driver == "asyncpg":
+            written = await _copy_insert(session, new)
+        else:
+            written = await _plain_insert(session, new)
+        await session.commit()
+    else:
+        written = []
+    # 预查之后被并发写入的，由 ON CONFLICT 跳过，同样计为重复
+    stats["duplicate"] += len(items) - len(written)
+    stats["unresolved_dims"] += sum(len(it["_dims"]) - len(it["_resolved"]) for it in written)
+    stats["dim_mismatch"] += sum(it["_dim_mismatch"] for it in written)
+    stats["inserted"] += len(written)
+
+async def import_questions(chunks: AsyncIterator[Any]) -> Dict[str, int]:
+    """导入 NDJSON 题目（导出格式）；返回 read / inserted / duplicate / invalid / unresolved_dims / dim_mismatch 计数。"""
+    stats = {"read": 0, "inserted": 0, "duplicate": 0, "invalid": 0, "unresolved_dims": 0, "dim_mismatch": 0}
+    t0 = time.perf_counter()
+    batch: List[dict] = []
+    async with AsyncSessionLocal() as session:
+        async for line in _lines(chunks):
+            if not line.strip():
+                continue
+            stats["read"] += 1
+            try:
+                batch.append(json.loads(line))
+            except json.JSONDecodeError:
+                stats["invalid"] += 1
+                continue
+            if len(batch) >= config.IMPORT_BATCH_ROWS:
+                await _import_batch(session, batch, stats)
+                batch = []
+        if batch:
+            await _import_batch(session, batch, stats)
+    logger.info(f"导入完成 {stats} 用时 {(time.perf_counter() - t0) * 1000:.0f}ms")
+    return stats
@@ -0,0 +1,68 @@
+import argparse, asyncio, json, logging, os, sys
+from datetime import datetime
+from typing import AsyncIterator
+from app.db.base import engine
+from app.services import transfer
+from app.utils.logging import setup_logging
+
+logger = logging.getLogger("app.transfer")
+
+# 题库/作答记录导入导出命令行（工作目录 src），直接连数据库，不经过 HTTP：
+#   python -m app.transfer export questions --format csv --dims 101,103 --since 2025-01-01 -o bank.csv
+#   python -m app.transfer export answers --until 2025-07-01 > answers.ndjson
+#   python -m app.transfer import questions bank.ndjson
+
+_CHUNK = 1 << 20
+
+async def _read(path: str) -> AsyncIterator[bytes]:
+    f = sys.stdin.buffer if path == "-" else open(path, "rb")
+    try:
+        while chunk := f.read(_CHUNK):
+            yield chunk
+    finally:
+        if f is not sys.stdin.buffer:
+            f.close()
+
+async def _export(a: argparse.Namespace) -> None:
+    f = transfer.Filters(
+        dims=[int(d) for d in a.dims.split(",")] if a.dims else None,
+        difficulty=a.difficulty,
+        since=datetime.fromisoformat(a.since) if a.since else None,
+        until=datetime.fromisoformat(a.until) if a.until else None,
+    )
+    out = sys.stdout if a.output == "-" else open(a.output, "w", encoding="utf-8", newline="")
+    try:
+        async for chunk in transfer.export(a.kind, a.format, f):
+            out.write(chunk)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+async def _import(a: argparse.Namespace) -> None:
+    stats = await transfer.import_questions(_read(a.input))
+    print(json.dumps(stats, ensure_ascii=False))
+
+async def main(a: argparse.Namespace) -> None:
+    try:
+        await (_export(a) if a.cmd == "export" else _import(a))
+    finally:
+        await engine.dispose()
+
+if __name__ == "__main__":
+    p = argparse.ArgumentParser(prog="python -m app.transfer", description="题库与作答记录导入导出")
+    sub = p.add_subparsers(dest="cmd", required=True)
+    e = sub.add_parser("export", help="导出为 NDJSON / CSV")
+    e.add_argument("kind", choices=transfer.KINDS)
+    e.add_argument("--format", choices=list(transfer.FORMATS), default="ndjson")
+    e.add_argument("--dims", default=None, help="逗号分隔的维度ID")
+    e.add_argument("--difficulty", type=int, choices=(1, 2, 3), default=None)
+    e.add_argument("--since", default=None, help="起始时间（含），ISO 格式")
+    e.add_argument("--until", default=None, help="截止时间（不含），ISO 格式")
+    e.add_argument("-o", "--output", default="-", help="输出文件，默认标准输出")
+    i = sub.add_parser("import", help="从 NDJSON 导入题目（按内容哈希去重）")
+    i.add_argument("kind", choices=("questions",))
+    i.add_argument("input", help="NDJSON 文件，- 表示标准输入")
+    args = p.parse_args()
+    # 日志走 stderr，避免混入导出到标准输出的数据
+    setup_logging(os.getenv("LOG_LEVEL", "INFO"), stream=sys.stderr)
+    asyncio.run(main(args))
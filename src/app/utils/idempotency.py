@@ -0,0 +1,91 @@
+import asyncio, hashlib, json, logging, time
+from typing import Any, Awaitable, Callable, Optional
+from fastapi import HTTPException, Request, Response
+from app import config
+from app.deps import get_redis
+from app.utils import metrics
+from app.utils.ratelimit import caller_identity
+
+logger = logging.getLogger("utils.idempotency")
+
+# Idempotency-Key：idem:<接口>:<调用方>:<key> 存 {"state": "running"|"done", "fp": 请求指纹, "body": 响应}。
+# 调用方取可信网关注入的用户 ID，没有时取客户端 IP，不同调用方用到同一个 key 也互不影响。
+# 首个请求以 SET NX 占位后执行；并发的重复请求轮询等待其结果，完成后的结果在 IDEMPOTENCY_TTL 内原样重放。
+# 执行失败时删除占位，客户端可以用同一个 key 重试；Redis 不可用时不做幂等，直接执行。
+_PREFIX = "idem:"
+_MAX_KEY_LEN = 200
+REPLAY_HEADER = "Idempotent-Replayed"
+
+def fingerprint(payload: Any) -> str:
+    raw = json.dumps(payload, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+async def handle(scope: str, request: Request, key: Optional[str], payload: Any,
+                 fn: Callable[[], Awaitable[Any]], response: Response) -> Any:
+    """带 Idempotency-Key 时保证同一 key 只执行一次 fn；fn 返回可 JSON 序列化的响应体。
+    同一 key 搭配不同请求体返回 422，等待进行中的请求超时返回 409。"""
+    if not key or not config.IDEMPOTENCY_ENABLED:
+        return await fn()
+    if len(key) > _MAX_KEY_LEN:
+        raise HTTPException(status_code=400, detail=f"Idempotency-Key 过长（最多 {_MAX_KEY_LEN} 字符）")
+    rkey = f"{_PREFIX}{scope}:{caller_identity(request)}:{key}"
+    fp = fingerprint(payload)
+    try:
+        r = await get_redis()
+        hit = await _claim_or_wait(r, rkey, fp)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.warning(f"幂等存储不可用，直接执行 key={key}: {e}")
+        return await fn()
+    if hit is not None:
+        response.headers[REPLAY_HEADER] = "true"
+        return hit
+
+    metrics.idempotency("new")
+    try:
+        body = await fn()
+    except BaseException:
+        await _release(r, rkey)
+        raise
+    try:
+        await r.set(rkey, json.dumps({"state": "done", "fp": fp, "body": body}, ensure_ascii=False, default=str),
+                    ex=config.IDEMPOTENCY_TTL)
+    except Exception as e:
+        logger.warning(f"幂等结果写入失败 key={key}: {e}")
+    return body
+
+async def _claim_or_wait(r, rkey: str, fp: str) -> Optional[Any]:
+    """抢到占位返回 None；否则返回已完成请求的响应体。"""
+    deadline = time.monotonic() + config.IDEMPOTENCY_WAIT
+    delay = 0.05
+    waited = False
+    running = json.dumps({"state": "running", "fp": fp})
+    while True:
+        if await r.set(rkey, running, nx=True, ex=config.IDEMPOTENCY_LOCK_TTL):
+            return None
+        raw = await r.get(rkey)
+        if raw is None:
+            # 进行中的请求失败并释放了占位，重新抢
+            continue
+        rec = json.loads(raw)
+        if rec.get("fp") != fp:
+            metrics.idempotency("mismatch")
+            raise HTTPException(status_code=422, detail="Idempotency-Key 已用于内容不同的请求")
+        if rec.get("state") == "done":
+            metrics.idempotency("waited" if waited else "replayed")
+            logger.info(f"幂等重放 {rkey} waited={waited}")
+            return rec.get("body")
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            metrics.idempotency("conflict")
+            raise HTTPException(status_code=409, detail="相同 Idempotency-Key 的请求仍在处理中，请稍后重试")
+        waited = True
+        await asyncio.sleep(min(delay, remaining))
+        delay = min(delay * 1.5, 0.5)
+
+async def _release(r, rkey: str) -> None:
+    try:
+        await r.delete(rkey)
+    except Exception as e:
+        logger.warning(f"释放幂等占位失败 {rkey}: {e}")
@@ -1,12 +1,15 @@
 import logging, sys, uuid, time
 from typing import Callable
 from fastapi import Request
+from app.utils import metrics
 
-def setup_logging(level: str = "INFO"):
+logger = logging.getLogger("utils.request")
+
+def setup_logging(level: str = "INFO", stream=None):
     logging.basicConfig(
         level=getattr(logging, level.upper(), logging.INFO),
         format="%(asctime)s | %(levelname)s | %(name)s | %(message)s",
-        stream=sys.stdout,
+        stream=stream or sys.stdout,
     )
 
 def gen_request_id() -> str:
@@ -15,9 +18,17 @@ def gen_request_id() -> str:
 async def request_id_middleware(request: Request, call_next: Callable):
     req_id = request.headers.get("X-Request-ID") or gen_request_id()
     request.state.request_id = req_id
+    stages = metrics.bind_request(request.scope, req_id)
     start = time.perf_counter()
     response = await call_next(request)
-    cost = (time.perf_counter() - start) * 1000
+    elapsed = time.perf_counter() - start
+    cost = elapsed * 1000
     response.headers["X-Request-ID"] = req_id
     response.headers["X-Response-Time-ms"] = f"{cost:.1f}"
+    metrics.observe_request(request.scope, request.method, response.status_code, elapsed)
+    if stages:
+        # 流式响应的阶段在响应体发送期间才完成，这里只包含已结束的阶段
+        timings = " ".join(f"{k}={v:.0f}ms" for k, v in stages.items())
+        logger.info(f"[{req_id}] {request.method} {metrics.route_of(request.scope)} {response.status_code} "
+                    f"{cost:.0f}ms {timings}")
     return response
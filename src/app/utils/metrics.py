@@ -0,0 +1,109 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, Optional
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, Counter, Gauge, Histogram, generate_latest
+from prometheus_client.openmetrics.exposition import CONTENT_TYPE_LATEST as OPENMETRICS_TYPE
+from prometheus_client.openmetrics.exposition import generate_latest as generate_openmetrics
+
+# 分阶段计时与资源指标，/metrics 以 Prometheus 格式暴露。
+# 标签只用路由模板（有界）；request_id 作为 exemplar 附在直方图样本上（OpenMetrics 格式可见），
+# 同时每个请求结束时把各阶段耗时连同 request_id 记一行日志。
+
+_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60)
+
+HTTP_SECONDS = Histogram("http_request_duration_seconds", "HTTP 请求耗时", ["route", "method", "status"],
+                         buckets=_BUCKETS)
+STAGE_SECONDS = Histogram("stage_duration_seconds", "请求内各阶段耗时", ["stage", "route"], buckets=_BUCKETS)
+LLM_TOKENS = Counter("llm_tokens_total", "LLM token 用量（来自响应 usage）", ["kind", "model"])
+FALLBACK_TOTAL = Counter("fallback_total", "LLM 异常后使用兜底的次数", ["kind", "route"])
+PREGRADE_TOTAL = Counter("pregrade_total", "本地预评分结果（llm 表示仍需 LLM 评分）", ["outcome"])
+IDEMPOTENCY_TOTAL = Counter("idempotency_total", "带 Idempotency-Key 的请求（new/replayed/waited/mismatch/conflict）",
+                            ["outcome"])
+DB_POOL_CONNECTIONS = Gauge("db_pool_connections", "连接池连接数", ["engine", "state"])
+DB_POOL_WAIT = Histogram("db_pool_checkout_wait_seconds", "从连接池取连接的等待时间", ["engine"],
+                         buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5))
+
+# 当前请求的 ASGI scope、request_id 与各阶段累计耗时（ms），由 request_id_middleware 设置
+_scope: ContextVar[Optional[dict]] = ContextVar("metrics_scope", default=None)
+_request_id: ContextVar[str] = ContextVar("metrics_request_id", default="-")
+_stages: ContextVar[Optional[Dict[str, float]]] = ContextVar("metrics_stages", default=None)
+
+def route_of(scope: Optional[dict]) -> str:
+    if scope is None:
+        return "background"
+    # 路由匹配后 scope 中有路由模板（/practice/jobs/{job_id}）；未匹配的路径（404）不展开，避免标签爆炸
+    return getattr(scope.get("route"), "path", None) or "unmatched"
+
+def bind_request(scope: dict, request_id: str) -> Dict[str, float]:
+    """在中间件中调用：把后续的阶段计时归到这个请求，返回该请求的阶段耗时表。"""
+    stages: Dict[str, float] = {}
+    _scope.set(scope)
+    _request_id.set(request_id)
+    _stages.set(stages)
+    return stages
+
+def _exemplar() -> Optional[dict]:
+    # exemplar 标签总长不能超过 128 字符，外部传入的 X-Request-ID 需截断
+    rid = _request_id.get()
+    return {"request_id": rid[:64]} if rid != "-" else None
+
+class StageTimer:
+    ms: float = 0.0
+
+@contextmanager
+def stage(name: str) -> Iterator[StageTimer]:
+    """记录一个阶段的耗时；异常时同样记录。"""
+    t = StageTimer()
+    t0 = time.perf_counter()
+    try:
+        yield t
+    finally:
+        elapsed = time.perf_counter() - t0
+        t.ms = elapsed * 1000
+        STAGE_SECONDS.labels(stage=name, route=route_of(_scope.get())).observe(elapsed, exemplar=_exemplar())
+        stages = _stages.get()
+        if stages is not None:
+            stages[name] = stages.get(name, 0.0) + t.ms
+
+def fallback(kind: str) -> None:
+    FALLBACK_TOTAL.labels(kind=kind, route=route_of(_scope.get())).inc()
+
+def pregrade(outcome: str) -> None:
+    PREGRADE_TOTAL.labels(outcome=outcome).inc()
+
+def idempotency(outcome: str) -> None:
+    IDEMPOTENCY_TOTAL.labels(outcome=outcome).inc()
+
+def tokens(usage: Optional[dict], model: str) -> None:
+    if not usage:
+        return
+    LLM_TOKENS.labels(kind="prompt", model=model).inc(usage.get("prompt_tokens") or 0)
+    LLM_TOKENS.labels(kind="completion", model=model).inc(usage.get("completion_tokens") or 0)
+
+def observe_request(scope: dict, method: str, status: int, seconds: float) -> None:
+    HTTP_SECONDS.labels(route=route_of(scope), method=method, status=str(status)).observe(seconds,
+                                                                                         exemplar=_exemplar())
+
+def instrument_pool(pool, engine: str = "primary") -> None:
+    """包装连接池的 checkout，记录取连接的等待时间（池满时即排队时间），并导出池内连接数。"""
+    connect = pool.connect
+    wait = DB_POOL_WAIT.labels(engine=engine)
+
+    def timed_connect():
+        t0 = time.perf_counter()
+        try:
+            return connect()
+        finally:
+            wait.observe(time.perf_counter() - t0)
+
+    pool.connect = timed_connect
+    for state, fn in (("checked_out", "checkedout"), ("checked_in", "checkedin"), ("overflow", "overflow")):
+        if hasattr(pool, fn):
+            DB_POOL_CONNECTIONS.labels(engine=engine, state=state).set_function(getattr(pool, fn))
+
+def render(accept: str) -> tuple:
+    """返回 (body, content_type)；客户端接受 OpenMetrics 时输出带 exemplar 的格式。"""
+    if "application/openmetrics-text" in accept:
+        return generate_openmetrics(REGISTRY), OPENMETRICS_TYPE
+    return generate_latest(), CONTENT_TYPE_LATEST
@@ -0,0 +1,227 @@
+import ipaddress, logging, math, time
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+from fastapi import Request
+from fastapi.responses import JSONResponse
+from app import config, deps
+
+logger = logging.getLogger("utils.ratelimit")
+
+# 原子令牌桶：一次检查多个桶（用户 + IP），按 Redis 服务器时间补充令牌。所有桶都至少有 1 个令牌才发放，
+# 各桶按自己的 want 领取（不超过可用令牌数）；任一桶不足时不扣任何桶。
+# KEYS 为各桶，ARGV = [rate1, capacity1, want1, rate2, capacity2, want2, ...]。
+# 返回 [各桶发放数..., 各桶无令牌时需要等待的秒数...]；浮点数以字符串返回，避免被 Lua 截断为整数。
+TOKEN_BUCKET_LUA = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local n = #KEYS
+local tokens = {}
+local waits = {}
+local ok = true
+for i = 1, n do
+  local rate = tonumber(ARGV[3 * i - 2])
+  local capacity = tonumber(ARGV[3 * i - 1])
+  local b = redis.call('HMGET', KEYS[i], 'tokens', 'ts')
+  local tk = tonumber(b[1]) or capacity
+  local ts = tonumber(b[2]) or now
+  tk = math.min(capacity, tk + math.max(0, now - ts) * rate)
+  tokens[i] = tk
+  waits[i] = 0
+  if tk < 1 then
+    ok = false
+    waits[i] = (1 - tk) / rate
+  end
+end
+local out = {}
+for i = 1, n do
+  local rate = tonumber(ARGV[3 * i - 2])
+  local capacity = tonumber(ARGV[3 * i - 1])
+  local granted = 0
+  if ok then granted = math.min(tonumber(ARGV[3 * i]), math.floor(tokens[i])) end
+  redis.call('HSET', KEYS[i], 'tokens', tostring(tokens[i] - granted), 'ts', tostring(now))
+  redis.call('EXPIRE', KEYS[i], math.ceil(capacity / rate) + 1)
+  out[i] = granted
+  out[n + i] = tostring(waits[i])
+end
+return out
+"""
+
+Bucket = Tuple[str, int]   # (Redis 键, 容量)
+
+async def take_each(r, buckets: Sequence[Bucket], window: float, wants: Sequence[int]) -> Tuple[List[int], List[float]]:
+    """从一组令牌桶（容量各自为 limit，每 window 秒补满）同时领取令牌，各桶至多领 wants[i] 个。
+
+    返回 (各桶发放数, 各桶需等待秒数)；任一桶没有令牌时发放数全为 0。
+    """
+    args: List[float] = []
+    for (_, limit), want in zip(buckets, wants):
+        args += [limit / window, limit, want]
+    res = await r.eval(TOKEN_BUCKET_LUA, len(buckets), *(k for k, _ in buckets), *args)
+    n = len(buckets)
+    return [int(g) for g in res[:n]], [float(w) for w in res[n:]]
+
+async def take(r, buckets: Sequence[Bucket], window: float, want: int = 1) -> Tuple[int, float]:
+    """从一组令牌桶同时领取至多 want 个令牌，返回 (发放数, 需等待秒数)。"""
+    granted, waits = await take_each(r, buckets, window, [want] * len(buckets))
+    return min(granted), max(waits)
+
+@dataclass
+class _Lease:
+    tokens: int = 0
+    expires: float = 0.0
+    denied_until: float = 0.0
+
+class LocalPrefilter:
+    """进程内预过滤：按桶从 Redis 预领一批令牌在本地消费；被拒后在 Retry-After 内本地直接拒绝。
+
+    租约按各桶自己的容量决定大小：大桶（IP）一次预领多个，大部分请求不需要访问 Redis；
+    小桶（单个用户）预领 1 个，仍逐次访问 Redis，但只领缺令牌的桶。租约短期过期，未用完的令牌作废，
+    全局速率不会超过 Redis 桶的速率。
+    """
+
+    def __init__(self, lease_size: int, lease_ttl: float):
+        self.lease_size = lease_size
+        self.lease_ttl = lease_ttl
+        self.local_hits = 0
+        self.remote_calls = 0
+        self._leases: Dict[str, _Lease] = {}
+
+    def _want(self, limit: int) -> int:
+        # 租约不超过桶容量的 1/20：过期作废的令牌最多损失 5% 额度
+        return max(1, min(self.lease_size, limit // 20))
+
+    async def check(self, r, buckets: Sequence[Bucket], window: float) -> float:
+        """所有桶都有令牌才允许（返回 0），否则返回需等待的秒数。"""
+        now = time.monotonic()
+        leases = [self._leases.setdefault(k, _Lease()) for k, _ in buckets]
+        denied = max(l.denied_until for l in leases)
+        if now < denied:
+            self.local_hits += 1
+            return denied - now
+        missing = [i for i, l in enumerate(leases) if l.tokens <= 0 or now >= l.expires]
+        if missing:
+            self.remote_calls += 1
+            sub = [buckets[i] for i in missing]
+            granted, waits = await take_each(r, sub, window, [self._want(n) for _, n in sub])
+            if granted[0] == 0:
+                # 只有确实没令牌的桶进入本地拒绝期，其余桶的本地租约不受影响
+                for i, wait in zip(missing, waits):
+                    if wait > 0:
+                        leases[i].tokens, leases[i].denied_until = 0, now + wait
+                return max(waits)
+            for i, g in zip(missing, granted):
+                leases[i].tokens, leases[i].expires = g, now + self.lease_ttl
+        else:
+            self.local_hits += 1
+        for l in leases:
+            l.tokens -= 1
+        if len(self._leases) > 10000:
+            self._prune(now)
+        return 0.0
+
+    def _prune(self, now: float) -> None:
+        for k in [k for k, v in self._leases.items() if v.expires < now and v.denied_until < now]:
+            self._leases.pop(k, None)
+
+def _parse(spec: str) -> Tuple[int, float]:
+    # "10/60" => 60 秒内 10 次
+    n, _, w = spec.partition("/")
+    return int(n), float(w or 60)
+
+def endpoint_class(path: str) -> Optional[str]:
+    # 只限制调用 LLM 的昂贵接口，生成与评分分开计额；批量接口单独计额
+    if path.startswith("/practice/generate/batch"):
+        return "generate_batch"
+    if path.startswith("/practice/answer/batch"):
+        return "answer_batch"
+    if path.startswith(("/practice/generate", "/practice/jobs/generate")):
+        return "generate"
+    if path.startswith(("/practice/answer", "/practice/jobs/answer")):
+        return "answer"
+    return None
+
+@lru_cache(maxsize=1)
+def _trusted_networks(spec: str) -> Tuple[ipaddress.IPv4Network | ipaddress.IPv6Network, ...]:
+    return tuple(ipaddress.ip_network(x.strip(), strict=False) for x in spec.split(",") if x.strip())
+
+def _is_trusted(host: str) -> bool:
+    nets = _trusted_networks(config.RATE_LIMIT_TRUSTED_PROXIES)
+    if not nets:
+        return False
+    try:
+        ip = ipaddress.ip_address(host)
+    except ValueError:
+        return False
+    return any(ip in n for n in nets)
+
+def _from_proxy(request: Request) -> bool:
+    return request.client is not None and _is_trusted(request.client.host)
+
+def _client_ip(request: Request) -> str:
+    # 直连方不是可信代理时 X-Forwarded-For 可被客户端伪造，直接用直连地址；
+    # 否则从右往左跳过可信代理，第一个不可信的地址即客户端
+    peer = request.client.host if request.client else "-"
+    if not _is_trusted(peer):
+        return peer
+    hops = [h.strip() for h in request.headers.get("X-Forwarded-For", "").split(",") if h.strip()]
+    for h in reversed(hops):
+        if not _is_trusted(h):
+            return h
+    return hops[0] if hops else peer
+
+_BUDGETS = {
+    "generate": lambda: config.RATE_LIMIT_GENERATE,
+    "answer": lambda: config.RATE_LIMIT_ANSWER,
+    "generate_batch": lambda: config.RATE_LIMIT_GENERATE_BATCH,
+    "answer_batch": lambda: config.RATE_LIMIT_ANSWER_BATCH,
+}
+
+def user_identity(request: Request) -> Optional[str]:
+    """可信网关注入的 X-User-ID；客户端直接带的请求头不作为身份。"""
+    return request.headers.get("X-User-ID") if _from_proxy(request) else None
+
+def caller_identity(request: Request) -> str:
+    """调用方标识：有可信用户身份时按用户，否则按客户端 IP。"""
+    user = user_identity(request)
+    return f"user:{user}" if user else f"ip:{_client_ip(request)}"
+
+def _budgets(cls: str) -> Tuple[int, float]:
+    return _parse(_BUDGETS[cls]())
+
+def _checks(request: Request, cls: str) -> Tuple[List[Bucket], float]:
+    limit, window = _budgets(cls)
+    # IP 维度始终计额（同一 IP 下可能有整班学生，额度按倍数放大）；用户维度只认可信网关注入的 X-User-ID，
+    # 客户端直接带的请求头不作为身份。两个桶在一次 Lua 调用中同时检查、同时扣除
+    checks: List[Bucket] = [(f"rl:{cls}:ip:{_client_ip(request)}", limit * config.RATE_LIMIT_IP_FACTOR)]
+    user = user_identity(request)
+    if user:
+        checks.insert(0, (f"rl:{cls}:user:{user}", limit))
+    return checks, window
+
+prefilter = LocalPrefilter(config.RATE_LIMIT_LEASE_SIZE, config.RATE_LIMIT_LEASE_TTL)
+
+async def rate_limit_middleware(request: Request, call_next: Callable):
+    cls = endpoint_class(request.url.path) if config.RATE_LIMIT_ENABLED and request.method == "POST" else None
+    if cls is None:
+        return await call_next(request)
+
+    checks, window = _checks(request, cls)
+    try:
+        r = await deps.get_redis()
+        retry = await prefilter.check(r, checks, window)
+        if retry > 0:
+            rid = getattr(request.state, "request_id", "-")
+            logger.warning(f"[{rid}] 限流 {' / '.join(k for k, _ in checks)} retry_after={retry:.1f}s")
+            return JSONResponse(
+                status_code=429,
+                content={"code": 42900, "message": "请求过于频繁，请稍后再试"},
+                headers={"Retry-After": str(max(1, math.ceil(retry)))},
+            )
+    except Exception as e:
+        # Redis 不可用时放行，不因限流组件故障拒绝服务
+        logger.warning(f"限流检查失败，放行: {e}")
+    return await call_next(request)
+
+def stats() -> dict:
+    return {"local_hits": prefilter.local_hits, "remote_calls": prefilter.remote_calls, "keys": len(prefilter._leases)}
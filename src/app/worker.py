@@ -0,0 +1,37 @@
+import asyncio, logging, os
+from app.cache import question as question_cache
+from app.db import writebehind
+from app.deps import close_redis, init_redis
+from app.llm import client as llm_client
+from app.services import dimension, jobs
+from app.utils.logging import setup_logging
+
+logger = logging.getLogger("app.worker")
+
+# 异步任务 worker：python -m app.worker（工作目录 src），可与 web 进程分别扩容
+
+async def main() -> None:
+    await init_redis()
+    await llm_client.startup()
+    try:
+        await dimension.load()
+    except Exception as e:
+        logger.exception(f"启动时加载知识维度目录失败，将在首次使用时重试: {e}")
+    tasks = [asyncio.create_task(question_cache.listen_invalidations()), asyncio.create_task(jobs.run_worker())]
+    if writebehind.enabled():
+        tasks.append(asyncio.create_task(writebehind.flusher()))
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        for t in tasks:
+            t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await llm_client.shutdown()
+        await close_redis()
+
+if __name__ == "__main__":
+    setup_logging(os.getenv("LOG_LEVEL", "INFO"))
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,32 @@
+import os, sys, tempfile
+from pathlib import Path
+
+# 应用模块在导入时读取配置并创建数据库引擎：先补上 src 路径与 DATABASE_URL（SQLite，测试不连真实库）
+_ROOT = Path(__file__).resolve().parent.parent
+sys.path[:0] = [str(_ROOT / "src"), str(_ROOT)]
+os.environ.setdefault("DATABASE_URL", f"sqlite+aiosqlite:///{tempfile.gettempdir()}/ittc_test.db")
+
+import fakeredis
+import pytest
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+@pytest.fixture
+async def redis(monkeypatch):
+    """进程内 Redis（fakeredis + lupa 执行 Lua），替换 deps 中的全局客户端。"""
+    from app import deps
+    r = fakeredis.aioredis.FakeRedis(decode_responses=True)
+    monkeypatch.setattr(deps, "_redis", r)
+    yield r
+    await r.aclose()
+
+@pytest.fixture
+async def db():
+    """SQLite 测试库：每个用例重建表并灌入维度、用户与少量题目（bench.fixtures 的种子数据）。"""
+    from bench import fixtures
+    from app.db.base import engine
+    await fixtures.create_schema(engine)
+    await fixtures.seed(engine, users=2, questions=3)
+    yield engine
@@ -0,0 +1,56 @@
+import pytest
+from app.llm.resilience import CircuitBreaker, CircuitOpenError
+
+def _open(b: CircuitBreaker) -> None:
+    for _ in range(b.threshold):
+        b.check()
+        b.record(False)
+
+def _cool_down(b: CircuitBreaker) -> None:
+    b.opened_at -= b.cooldown
+
+def test_opens_after_consecutive_failures():
+    b = CircuitBreaker(threshold=3, cooldown=30)
+    for _ in range(2):
+        b.check()
+        b.record(False)
+    assert b.state == "closed"
+    # 中间一次成功清零连续失败计数
+    b.record(True)
+    _open(b)
+    assert b.state == "open"
+    with pytest.raises(CircuitOpenError):
+        b.check()
+    assert b.snapshot()["short_circuited"] == 1
+
+def test_half_open_allows_single_probe():
+    b = CircuitBreaker(threshold=2, cooldown=30)
+    _open(b)
+    _cool_down(b)
+    b.check()
+    assert b.state == "half_open"
+    with pytest.raises(CircuitOpenError):
+        b.check()
+    b.record(True)
+    assert b.state == "closed" and b.failures == 0
+    b.check()
+
+def test_failed_probe_reopens():
+    b = CircuitBreaker(threshold=5, cooldown=30)
+    _open(b)
+    _cool_down(b)
+    b.check()
+    # 半开时一次失败即重新打开，不等累计到阈值
+    b.record(False)
+    assert b.state == "open"
+    with pytest.raises(CircuitOpenError):
+        b.check()
+
+def test_abandoned_probe_lets_next_request_probe():
+    b = CircuitBreaker(threshold=2, cooldown=30)
+    _open(b)
+    _cool_down(b)
+    b.check()
+    b.abandon()
+    b.check()
+    assert b.state == "half_open"
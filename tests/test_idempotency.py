@@ -0,0 +1,113 @@
+import asyncio
+import httpx
+import pytest
+from fastapi import HTTPException, Response
+from starlette.requests import Request
+from app.api import routes_practice
+from app.schemas.practice import AnswerResponse, BatchAnswerItem, PracticeItem
+from app.utils import idempotency
+
+pytestmark = pytest.mark.anyio
+
+def _request(peer: str = "203.0.113.5") -> Request:
+    return Request({"type": "http", "method": "POST", "path": "/practice/generate", "client": (peer, 5000),
+                    "headers": []})
+
+class _Counter:
+    def __init__(self, delay: float = 0.0):
+        self.calls = 0
+        self.delay = delay
+
+    async def __call__(self) -> dict:
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        return {"question_id": self.calls}
+
+async def test_replay_returns_stored_body(redis):
+    fn = _Counter()
+    first, second = Response(), Response()
+    a = await idempotency.handle("generate", _request(), "k1", {"难度": 1}, fn, first)
+    b = await idempotency.handle("generate", _request(), "k1", {"难度": 1}, fn, second)
+    assert a == b == {"question_id": 1} and fn.calls == 1
+    assert idempotency.REPLAY_HEADER not in first.headers
+    assert second.headers[idempotency.REPLAY_HEADER] == "true"
+
+async def test_same_key_different_body_is_rejected(redis):
+    fn = _Counter()
+    await idempotency.handle("generate", _request(), "k1", {"难度": 1}, fn, Response())
+    with pytest.raises(HTTPException) as e:
+        await idempotency.handle("generate", _request(), "k1", {"难度": 2}, fn, Response())
+    assert e.value.status_code == 422 and fn.calls == 1
+
+async def test_concurrent_duplicate_waits_for_first(redis):
+    fn = _Counter(delay=0.2)
+    a, b = await asyncio.gather(
+        idempotency.handle("generate", _request(), "k1", {"难度": 1}, fn, Response()),
+        idempotency.handle("generate", _request(), "k1", {"难度": 1}, fn, Response()),
+    )
+    assert a == b and fn.calls == 1
+
+async def test_keys_are_scoped_by_route_and_caller(redis):
+    fn = _Counter()
+    await idempotency.handle("generate", _request("203.0.113.5"), "k1", {}, fn, Response())
+    await idempotency.handle("generate", _request("203.0.113.6"), "k1", {}, fn, Response())
+    await idempotency.handle("answer", _request("203.0.113.5"), "k1", {}, fn, Response())
+    assert fn.calls == 3
+
+async def test_failure_releases_the_key(redis):
+    async def boom():
+        raise RuntimeError("upstream")
+    with pytest.raises(RuntimeError):
+        await idempotency.handle("generate", _request(), "k1", {}, boom, Response())
+    fn = _Counter()
+    assert await idempotency.handle("generate", _request(), "k1", {}, fn, Response()) == {"question_id": 1}
+
+async def test_without_key_runs_every_time(redis):
+    fn = _Counter()
+    for _ in range(2):
+        await idempotency.handle("generate", _request(), None, {}, fn, Response())
+    assert fn.calls == 2
+
+@pytest.fixture
+async def client(redis):
+    from app.main import app
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as c:
+        yield c
+
+def _item() -> PracticeItem:
+    return PracticeItem(材料="材料" * 80, 题目="题目", 参考答案="答案", 评分标准="标准", 维度=[101],
+                        核心知识点=["要点一", "要点二"], 难度=1, 题型=1)
+
+async def test_batch_generate_replay(client, monkeypatch):
+    calls = []
+    async def fake_batch(req, session):
+        calls.append(req.数量)
+        return [(len(calls) * 10 + i, _item()) for i in range(2)], req.数量 - 2
+    monkeypatch.setattr(routes_practice, "generate_practice_batch", fake_batch)
+    body = {"维度": [101], "难度": 1, "题型": 1, "数量": 3}
+    first = await client.post("/practice/generate/batch", json=body, headers={"Idempotency-Key": "b1"})
+    again = await client.post("/practice/generate/batch", json=body, headers={"Idempotency-Key": "b1"})
+    assert first.status_code == again.status_code == 200 and calls == [3]
+    assert again.json() == first.json() and first.json()["shortfall"] == 1
+    assert again.headers[idempotency.REPLAY_HEADER] == "true"
+    # 同一个 key 换了请求体：拒绝
+    changed = await client.post("/practice/generate/batch", json={**body, "数量": 4}, headers={"Idempotency-Key": "b1"})
+    assert changed.status_code == 422 and calls == [3]
+
+async def test_batch_answer_replay(client, monkeypatch):
+    calls = []
+    async def fake_batch(items, session):
+        calls.append(len(items))
+        return [BatchAnswerItem(index=i, question_id=it.question_id, ok=True,
+                                result=AnswerResponse(answer_record_id=100 * len(calls) + i, total_score=6))
+                for i, it in enumerate(items)]
+    monkeypatch.setattr(routes_practice, "submit_answers_batch", fake_batch)
+    body = {"items": [{"question_id": 1, "original_answer": "作答一"}, {"question_id": 2, "original_answer": "作答二"}]}
+    first = await client.post("/practice/answer/batch", json=body, headers={"Idempotency-Key": "a1"})
+    again = await client.post("/practice/answer/batch", json=body, headers={"Idempotency-Key": "a1"})
+    assert first.status_code == again.status_code == 200 and calls == [2]
+    # 重放首次的作答记录 ID，不会重复入库
+    assert [it["result"]["answer_record_id"] for it in again.json()["items"]] == [100, 101]
+    # 不带 key 时每次都执行
+    await client.post("/practice/answer/batch", json=body)
+    assert calls == [2, 2]
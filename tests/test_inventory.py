@@ -0,0 +1,44 @@
+import pytest
+from app import config
+from app.services import inventory
+
+pytestmark = pytest.mark.anyio
+
+@pytest.fixture(autouse=True)
+def _inventory_config(monkeypatch):
+    monkeypatch.setattr(config, "INVENTORY_ENABLED", True)
+    monkeypatch.setattr(config, "INVENTORY_BUCKET_DEPTHS", {"1:1:1": 3})
+    monkeypatch.setattr(config, "INVENTORY_AUTO_MIN_MISSES", 3)
+    monkeypatch.setattr(config, "INVENTORY_MAX_BUCKETS", 50)
+
+async def test_bucket_registered_after_repeated_misses(redis):
+    for _ in range(2):
+        assert await inventory.pop([5], 1, 1) is None
+    # 偶发未命中不登记，只补配置桶
+    assert await inventory._known_buckets(redis) == ["1:1:1"]
+    await inventory.pop([5], 1, 1)
+    assert await inventory._known_buckets(redis) == ["1:1:1", "5:1:1"]
+    assert 0 < await redis.ttl("inv:miss:5:1:1") <= config.INVENTORY_AUTO_WINDOW
+
+async def test_auto_registration_can_be_disabled(redis, monkeypatch):
+    monkeypatch.setattr(config, "INVENTORY_AUTO_MIN_MISSES", 0)
+    for _ in range(5):
+        await inventory.pop([5], 1, 1)
+    assert await inventory._known_buckets(redis) == ["1:1:1"]
+
+async def test_idle_buckets_pruned_with_their_queue(redis, monkeypatch):
+    for _ in range(3):
+        await inventory.pop([5], 1, 1)
+    await redis.rpush("inv:q:5:1:1", "x")
+    monkeypatch.setattr(config, "INVENTORY_BUCKET_IDLE", -1)
+    await inventory._prune_hot(redis)
+    assert await inventory._known_buckets(redis) == ["1:1:1"]
+    assert not await redis.exists("inv:q:5:1:1")
+
+async def test_hot_buckets_capped_keeps_most_recent(redis, monkeypatch):
+    monkeypatch.setattr(config, "INVENTORY_MAX_BUCKETS", 1)
+    for dims in ([6], [7]):
+        for _ in range(3):
+            await inventory.pop(dims, 1, 1)
+    await inventory._prune_hot(redis)
+    assert await inventory._known_buckets(redis) == ["1:1:1", "7:1:1"]
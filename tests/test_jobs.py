@@ -0,0 +1,85 @@
+import time
+import pytest
+from app import config
+from app.services import jobs
+
+pytestmark = pytest.mark.anyio
+
+class _Handler:
+    def __init__(self, *errors: Exception):
+        self.errors = list(errors)
+        self.calls = 0
+
+    async def __call__(self, payload: dict) -> dict:
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return {"ok": payload}
+
+async def _deliver(r) -> None:
+    """模拟一个消费协程读取并处理一条消息。"""
+    resp = await r.xreadgroup(jobs._GROUP, jobs._CONSUMER, {jobs._STREAM: ">"}, count=1)
+    for _, entries in resp:
+        for eid, fields in entries:
+            await jobs._process(r, eid, fields)
+
+async def _promote_all(r) -> int:
+    # 把延迟重试任务的到期时间视为已到
+    return await r.eval(jobs.PROMOTE_LUA, 2, jobs._DELAYED, jobs._STREAM, time.time() + 60, 100)
+
+@pytest.fixture
+async def worker(redis):
+    await jobs._ensure_group(redis)
+    return redis
+
+async def test_transient_error_retries_via_delayed_set(worker, monkeypatch):
+    handler = _Handler(RuntimeError("LLM 超时"))
+    monkeypatch.setitem(jobs._HANDLERS, "generate", handler)
+    job_id = await jobs.enqueue("generate", {"n": 1})
+    await _deliver(worker)
+    job = await jobs.get(job_id)
+    assert job["status"] == "queued" and job["attempts"] == 1 and "超时" in job["error"]
+    # 等待重试期间不占 Stream 与 PEL
+    assert await worker.zscore(jobs._DELAYED, job_id) > time.time()
+    assert await worker.xlen(jobs._STREAM) == 0
+    assert (await worker.xpending(jobs._STREAM, jobs._GROUP))["pending"] == 0
+    # 未到期不搬运
+    assert await worker.eval(jobs.PROMOTE_LUA, 2, jobs._DELAYED, jobs._STREAM, time.time(), 100) == 0
+    assert await _promote_all(worker) == 1
+    await _deliver(worker)
+    job = await jobs.get(job_id)
+    assert job["status"] == "done" and job["result"] == {"ok": {"n": 1}} and job["error"] is None
+    assert handler.calls == 2 and await worker.zcard(jobs._DELAYED) == 0
+
+async def test_permanent_error_fails_without_retry(worker, monkeypatch):
+    handler = _Handler(ValueError("题目不存在"))
+    monkeypatch.setitem(jobs._HANDLERS, "answer", handler)
+    job_id = await jobs.enqueue("answer", {})
+    await _deliver(worker)
+    job = await jobs.get(job_id)
+    assert job["status"] == "failed" and handler.calls == 1
+    assert await worker.zcard(jobs._DELAYED) == 0
+    dead = await worker.xrange(jobs._DEAD)
+    assert [f["job_id"] for _, f in dead] == [job_id]
+
+async def test_gives_up_after_max_attempts(worker, monkeypatch):
+    monkeypatch.setattr(config, "JOB_MAX_ATTEMPTS", 2)
+    handler = _Handler(RuntimeError("a"), RuntimeError("b"), RuntimeError("c"))
+    monkeypatch.setitem(jobs._HANDLERS, "generate", handler)
+    job_id = await jobs.enqueue("generate", {})
+    await _deliver(worker)
+    await _promote_all(worker)
+    await _deliver(worker)
+    job = await jobs.get(job_id)
+    assert job["status"] == "failed" and job["attempts"] == 2 and handler.calls == 2
+    assert await worker.xlen(jobs._DEAD) == 1 and await worker.zcard(jobs._DELAYED) == 0
+
+async def test_duplicate_delivery_of_finished_job_is_acked(worker, monkeypatch):
+    handler = _Handler()
+    monkeypatch.setitem(jobs._HANDLERS, "generate", handler)
+    job_id = await jobs.enqueue("generate", {})
+    await _deliver(worker)
+    await worker.xadd(jobs._STREAM, {"job_id": job_id})
+    await _deliver(worker)
+    assert handler.calls == 1
+    assert (await worker.xpending(jobs._STREAM, jobs._GROUP))["pending"] == 0
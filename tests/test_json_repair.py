@@ -0,0 +1,36 @@
+import json
+import pytest
+from app.llm.json_repair import first_balanced, fix_syntax, loads_tolerant, strip_code_fences, strip_think
+
+def test_valid_json_is_not_repaired():
+    assert loads_tolerant('{"a": 1}') == ({"a": 1}, False)
+
+def test_think_block_and_code_fence_are_stripped():
+    text = '<think>先想一想 {"x": 0}</think>\n```json\n{"题目": "问路", "难度": 1}\n```'
+    assert loads_tolerant(text) == ({"题目": "问路", "难度": 1}, True)
+
+def test_unclosed_think_is_dropped_up_to_first_brace():
+    assert strip_think('<think>推理被截断 {"a": 1}') == '{"a": 1}'
+
+def test_opening_fence_only():
+    assert strip_code_fences('```json\n{"a": 1}') == '{"a": 1}'
+
+def test_prose_around_object():
+    data, repaired = loads_tolerant('好的，结果如下：{"score": 3, "hit": true} 以上。')
+    assert data == {"score": 3, "hit": True} and repaired
+
+def test_first_balanced_ignores_brackets_in_strings():
+    assert first_balanced('x {"a": "}{]", "b": [1, {"c": 2}]} y') == '{"a": "}{]", "b": [1, {"c": 2}]}'
+    assert first_balanced("no json here") is None
+
+def test_trailing_commas_and_unquoted_keys():
+    data, repaired = loads_tolerant('{score: 2, 要点: ["a", "b",], comment: "x, }",}')
+    assert data == {"score": 2, "要点": ["a", "b"], "comment": "x, }"} and repaired
+
+def test_fix_syntax_leaves_strings_alone():
+    s = '{"k": "a,]b", "t": "key: v"}'
+    assert fix_syntax(s) == s
+
+def test_unrepairable_raises():
+    with pytest.raises(json.JSONDecodeError):
+        loads_tolerant("完全不是 JSON")
@@ -0,0 +1,63 @@
+import pytest
+from app import config
+from app.cache.question import GradingView
+from app.services.pregrade import Automaton, pregrade
+
+def _q(**kw) -> GradingView:
+    base = dict(
+        id=1, question_type=1, score=10, word_limit=100,
+        score_points=["分层提问", "即时反馈", "同伴互评"],
+        scoring_criteria="满分：要点齐全；部分：覆盖部分要点；不得分：偏题。",
+        title="请分析材料中的教学问题并提出改进建议。",
+        answer_content="要点1：分层提问并留出等待时间；要点2：即时反馈；要点3：同伴互评。",
+    )
+    base.update(kw)
+    return GradingView(**base)
+
+def test_automaton_finds_overlapping_patterns():
+    a = Automaton(["提问", "分层提问", "反馈"])
+    assert a.find("教师采用分层提问与即时反馈") == {0, 1, 2}
+    assert a.find("无关内容") == set()
+
+def test_too_short():
+    pre = pregrade(_q(), "不知道")
+    assert pre.outcome == "too_short"
+    assert pre.grading["total_score"] == 0.0
+    assert set(pre.grading["subitem_scores"]) == {"分层提问", "即时反馈", "同伴互评"}
+
+def test_over_limit():
+    pre = pregrade(_q(word_limit=10), "分层提问" * 20)
+    assert pre.outcome == "over_limit" and pre.grading is not None
+
+def test_copy_question():
+    pre = pregrade(_q(), "请分析材料中的教学问题并提出改进建议。")
+    assert pre.outcome == "copy_question"
+
+def test_copy_reference():
+    pre = pregrade(_q(word_limit=None), _q().answer_content)
+    assert pre.outcome == "copy_reference"
+
+def test_no_points():
+    pre = pregrade(_q(), "今天天气很好，我们去公园散步，看到很多花和小鸟。")
+    assert pre.outcome == "no_points"
+    assert pre.grading["hit_score_points"] == []
+
+def test_partial_hits_are_passed_to_llm():
+    pre = pregrade(_q(), "我会先采用分层提问，让不同水平的学生都能参与，再组织讨论。")
+    assert pre.outcome == "llm" and pre.grading is None
+    assert pre.hit_points == ["分层提问"]
+    assert pre.missed_points == ["即时反馈", "同伴互评"]
+    assert "分层提问" in pre.hints()
+
+def test_missing_title_and_reference_skip_copy_checks():
+    q = _q(title=None, answer_content=None)
+    pre = pregrade(q, "请分析材料中的教学问题并提出改进建议，分层提问。")
+    assert pre.outcome == "llm"
+
+@pytest.mark.parametrize("limit", [0, None])
+def test_no_word_limit(limit):
+    assert pregrade(_q(word_limit=limit), "分层提问" * 50).outcome != "over_limit"
+
+def test_min_chars_is_configurable(monkeypatch):
+    monkeypatch.setattr(config, "PREGRADE_MIN_CHARS", 2)
+    assert pregrade(_q(), "教师要分层提问").outcome == "llm"
@@ -0,0 +1,19 @@
+import pytest
+from app.cache import question as question_cache
+from app.cache.question import GradingView
+
+pytestmark = pytest.mark.anyio
+
+def _view(q_id: int, dims):
+    return GradingView(id=q_id, question_type=1, score=10, word_limit=None, score_points=None,
+                       scoring_criteria=None, dims=dims)
+
+async def test_pending_views_not_cached(redis, monkeypatch):
+    monkeypatch.setattr(question_cache, "_local", type(question_cache._local)())
+    async def loader(ids):
+        # 1 为写后队列中的题目（维度未落库），2 为已落库但没有维度关系的题目
+        return {1: _view(1, None), 2: _view(2, [])}
+    got = await question_cache.get_many([1, 2], loader)
+    assert set(got) == {1, 2}
+    assert not await redis.exists(f"{question_cache._REDIS_PREFIX}1") and 1 not in question_cache._local
+    assert await redis.exists(f"{question_cache._REDIS_PREFIX}2") and 2 in question_cache._local
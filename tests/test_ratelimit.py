@@ -0,0 +1,71 @@
+import pytest
+from starlette.requests import Request
+from app import config
+from app.utils import ratelimit
+from app.utils.ratelimit import LocalPrefilter, take
+
+pytestmark = pytest.mark.anyio
+
+async def test_bucket_grants_up_to_capacity(redis):
+    got = [await take(redis, [("rl:t", 3)], 60) for _ in range(4)]
+    assert [g for g, _ in got] == [1, 1, 1, 0]
+    # 每 20s 补一个令牌
+    assert 0 < got[-1][1] <= 20
+
+async def test_want_is_capped_by_available_tokens(redis):
+    assert (await take(redis, [("rl:t", 5)], 60, want=3))[0] == 3
+    assert (await take(redis, [("rl:t", 5)], 60, want=3))[0] == 2
+
+async def test_multi_bucket_deducts_all_or_none(redis):
+    user, ip = ("rl:user:u1", 1), ("rl:ip:1.2.3.4", 10)
+    assert (await take(redis, [user, ip], 60))[0] == 1
+    # 用户桶已空：拒绝，且不扣 IP 桶
+    assert (await take(redis, [user, ip], 60))[0] == 0
+    assert float(await redis.hget("rl:ip:1.2.3.4", "tokens")) == pytest.approx(9, abs=0.01)
+
+async def test_buckets_expire(redis):
+    # 空桶补满所需时间（window）之后过期
+    await take(redis, [("rl:t", 2)], 10)
+    assert 10 <= await redis.ttl("rl:t") <= 11
+
+async def test_prefilter_leases_tokens_locally(redis):
+    pf = LocalPrefilter(lease_size=5, lease_ttl=10)
+    buckets = [("rl:p", 100)]
+    assert [await pf.check(redis, buckets, 60) for _ in range(5)] == [0] * 5
+    assert pf.remote_calls == 1 and pf.local_hits == 4
+
+def _request(peer: str, headers: dict) -> Request:
+    return Request({"type": "http", "method": "POST", "path": "/practice/answer", "client": (peer, 5000),
+                    "headers": [(k.lower().encode(), v.encode()) for k, v in headers.items()]})
+
+async def test_prefilter_default_config_mostly_local(redis):
+    # 默认配置（无可信网关）只有 IP 桶，按 IP 桶自己的容量预领
+    pf = LocalPrefilter(config.RATE_LIMIT_LEASE_SIZE, 60)
+    checks, window = ratelimit._checks(_request("203.0.113.5", {}), "answer")
+    allowed = [await pf.check(redis, checks, window) for _ in range(200)].count(0)
+    assert allowed == 200
+    assert pf.remote_calls <= allowed // 5
+
+async def test_prefilter_small_user_bucket_keeps_ip_lease(redis, monkeypatch):
+    monkeypatch.setattr(config, "RATE_LIMIT_TRUSTED_PROXIES", "10.0.0.0/8")
+    pf = LocalPrefilter(config.RATE_LIMIT_LEASE_SIZE, 60)
+    limit, _ = ratelimit._budgets("answer")
+    u1, window = ratelimit._checks(_request("10.0.0.2", {"X-User-ID": "u1"}), "answer")
+    assert await pf.check(redis, u1, window) == 0
+    # IP 桶按自己的容量预领，不因用户桶容量小而逐个领取
+    ip_key, ip_cap = u1[1]
+    assert pf._want(ip_cap) > 1 and pf._leases[ip_key].tokens == pf._want(ip_cap) - 1
+    assert [await pf.check(redis, u1, window) for _ in range(limit - 1)] == [0] * (limit - 1)
+    assert await pf.check(redis, u1, window) > 0
+    # u1 被拒不影响同一 IP 下其他用户
+    u2, _ = ratelimit._checks(_request("10.0.0.2", {"X-User-ID": "u2"}), "answer")
+    assert await pf.check(redis, u2, window) == 0
+
+def test_forwarded_headers_only_trusted_from_proxies(monkeypatch):
+    monkeypatch.setattr(config, "RATE_LIMIT_TRUSTED_PROXIES", "10.0.0.0/8")
+    spoofed = {"X-Forwarded-For": "9.9.9.9", "X-User-ID": "victim"}
+    direct = _request("203.0.113.5", spoofed)
+    assert ratelimit.caller_identity(direct) == "ip:203.0.113.5"
+    proxied = _request("10.0.0.2", {"X-Forwarded-For": "1.1.1.1, 198.51.100.7, 10.0.0.3"})
+    assert ratelimit.caller_identity(proxied) == "ip:198.51.100.7"
+    assert ratelimit.caller_identity(_request("10.0.0.2", {"X-User-ID": "u1"})) == "user:u1"
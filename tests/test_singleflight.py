@@ -0,0 +1,63 @@
+import asyncio, json
+import pytest
+from app import config
+from app.llm import singleflight
+
+pytestmark = pytest.mark.anyio
+
+@pytest.fixture(autouse=True)
+def _enabled(monkeypatch):
+    monkeypatch.setattr(config, "SINGLEFLIGHT_ENABLED", True)
+    monkeypatch.setattr(config, "SINGLEFLIGHT_REDIS", False)
+
+class _Upstream:
+    def __init__(self, result=None, error: Exception = None, delay: float = 0.05):
+        self.calls = 0
+        self.result, self.error, self.delay = result, error, delay
+
+    async def __call__(self):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+async def test_concurrent_calls_share_one_request():
+    up = _Upstream(result={"items": [1]})
+    a, b = await asyncio.gather(singleflight.do("k", up), singleflight.do("k", up))
+    assert a == b == {"items": [1]} and up.calls == 1
+    # 每个调用方拿到独立副本
+    a["items"].append(2)
+    assert b == {"items": [1]}
+
+async def test_error_propagates_to_all_waiters():
+    up = _Upstream(error=RuntimeError("upstream 500"))
+    res = await asyncio.gather(singleflight.do("k", up), singleflight.do("k", up), return_exceptions=True)
+    assert all(isinstance(e, RuntimeError) for e in res) and up.calls == 1
+    assert "k" not in singleflight._inflight
+
+async def test_cancelled_waiter_does_not_cancel_others():
+    up = _Upstream(result="ok", delay=0.1)
+    first = asyncio.ensure_future(singleflight.do("k", up))
+    second = asyncio.ensure_future(singleflight.do("k", up))
+    await asyncio.sleep(0.01)
+    first.cancel()
+    assert await second == "ok" and up.calls == 1
+    with pytest.raises(asyncio.CancelledError):
+        await first
+
+async def test_remote_reuses_result_from_other_process(redis, monkeypatch):
+    monkeypatch.setattr(config, "SINGLEFLIGHT_REDIS", True)
+    await redis.set(singleflight._RESULT_PREFIX + "k", json.dumps({"v": 1}))
+    up = _Upstream(result={"v": 2})
+    assert await singleflight.do("k", up) == {"v": 1} and up.calls == 0
+
+async def test_remote_error_releases_lock(redis, monkeypatch):
+    monkeypatch.setattr(config, "SINGLEFLIGHT_REDIS", True)
+    with pytest.raises(RuntimeError):
+        await singleflight.do("k", _Upstream(error=RuntimeError("upstream 500")))
+    assert not await redis.exists(singleflight._LOCK_PREFIX + "k")
+    assert not await redis.exists(singleflight._RESULT_PREFIX + "k")
+    # 锁已释放：下一次调用直接请求上游
+    up = _Upstream(result="ok")
+    assert await singleflight.do("k", up) == "ok" and up.calls == 1
@@ -0,0 +1,69 @@
+import json
+import pytest
+from sqlalchemy import select, text
+from app.db import models as m
+from app.db.base import AsyncSessionLocal
+from app.services import transfer
+
+pytestmark = pytest.mark.anyio
+
+def _line(title: str, dims=(101,), dim_names=("课堂提问",)) -> str:
+    return json.dumps({"question_type": 1, "difficulty": 1, "title": title, "material": "材料", "score": 10,
+                       "answer_content": "参考答案", "scoring_criteria": "评分标准",
+                       "dims": list(dims), "dim_names": list(dim_names)}, ensure_ascii=False) + "\n"
+
+async def _chunks(*parts):
+    for p in parts:
+        yield p.encode("utf-8")
+
+async def _dims_of(title: str) -> list:
+    async with AsyncSessionLocal() as session:
+        q = (await session.execute(select(m.Question.id).where(m.Question.title == title))).scalar_one()
+        rel = m.QuestionKdRelation
+        return list((await session.execute(select(rel.kd_id).where(rel.q_id == q))).scalars().all())
+
+async def test_dims_resolved_by_name_before_id(db):
+    # 种子数据：101=课堂提问，102=课堂管理，103=反馈与纠错
+    items = [{"_dims": [101], "_dim_names": ["课堂管理"]},   # 源库 ID 撞号：按名称
+             {"_dims": [101], "_dim_names": []},            # 没有名称：按 ID
+             {"_dims": [101], "_dim_names": ["不存在"]},      # 撞号且名称找不到：不关联
+             {"_dims": [9999], "_dim_names": ["反馈与纠错"]}]  # ID 不存在：按名称
+    async with AsyncSessionLocal() as session:
+        await transfer._resolve_dims(session, items)
+    assert [(it["_resolved"], it["_dim_mismatch"]) for it in items] == [([102], 1), ([101], 0), ([], 1), ([103], 0)]
+    assert [it["dim_key"] for it in items] == ["102", "101", None, "103"]
+
+async def test_import_counts_and_dim_mapping(db):
+    body = _line("新题一", dims=(101,), dim_names=("课堂管理",)) + "不是 JSON\n" + _line("新题二", dims=(9999,), dim_names=("",))
+    # 任意位置切分的块也能还原为行
+    stats = await transfer.import_questions(_chunks(body[:7], body[7:]))
+    assert stats == {"read": 3, "inserted": 2, "duplicate": 0, "invalid": 1, "unresolved_dims": 1, "dim_mismatch": 1}
+    assert await _dims_of("新题一") == [102]
+    assert await _dims_of("新题二") == []
+
+async def test_duplicate_content_hash_is_skipped(db):
+    stats = await transfer.import_questions(_chunks(_line("同一题") + _line("同一题")))
+    assert stats["inserted"] == 1 and stats["duplicate"] == 1
+    # 再导入一次：全部按 content_hash 跳过
+    stats = await transfer.import_questions(_chunks(_line("同一题")))
+    assert stats["inserted"] == 0 and stats["duplicate"] == 1
+    async with db.begin() as conn:
+        assert (await conn.execute(text("SELECT count(*) FROM question WHERE title = '同一题'"))).scalar() == 1
+
+async def test_conflict_after_precheck_counts_as_duplicate(db):
+    # 预查之后被并发写入的题目由 ON CONFLICT 跳过，不整批失败
+    items = [transfer._question_of(json.loads(_line(t))) for t in ("并发题", "另一题")]
+    for it in items:
+        it["_dims"], it["_dim_names"] = [101], ["课堂提问"]
+    async with AsyncSessionLocal() as session:
+        await transfer._resolve_dims(session, items)
+        await transfer._plain_insert(session, items[:1])
+        await session.commit()
+        written = await transfer._plain_insert(session, items)
+        await session.commit()
+    assert [it["title"] for it in written] == ["另一题"]
+
+async def test_export_then_reimport_is_all_duplicates(db):
+    chunks = [c async for c in transfer.export("questions", "ndjson", transfer.Filters())]
+    stats = await transfer.import_questions(_chunks(*chunks))
+    assert stats["read"] == 3 and stats["duplicate"] == 3 and stats["inserted"] == 0
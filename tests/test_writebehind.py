@@ -0,0 +1,81 @@
+import pytest
+from sqlalchemy import text
+from app import config
+from app.db import repo, writebehind as wb
+
+pytestmark = pytest.mark.anyio
+
+@pytest.fixture(autouse=True)
+def _fresh_state(monkeypatch):
+    monkeypatch.setattr(wb, "_queue", None)
+    monkeypatch.setattr(wb, "_retrying", {})
+    monkeypatch.setattr(wb, "_pending_questions", {})
+    monkeypatch.setattr(wb, "_stats", dict.fromkeys(wb._stats, 0))
+    monkeypatch.setattr(config, "WRITE_BEHIND_MAX_ATTEMPTS", 2)
+
+def _answer(rec_id: int, text_: str = "作答"):
+    return [("answer_record", {"id": rec_id, **repo._answer_row(user_id=1, q_id=1, original_answer=text_,
+                                                                  grading={"total_score": 1.0})})]
+
+async def _answer_ids(engine) -> list:
+    async with engine.begin() as conn:
+        return [r[0] for r in (await conn.execute(text("SELECT id FROM answer_record ORDER BY id"))).all()]
+
+async def test_flush_isolates_failed_groups(db, redis):
+    await wb._flush([_answer(1)])
+    # 主键冲突的组失败，同批的其他组照常写入
+    assert await wb._flush([_answer(1, "重复"), _answer(2)]) == [0]
+    assert await _answer_ids(db) == [1, 2]
+
+async def test_memory_retry_then_dead_letter(db, redis):
+    await wb._flush([_answer(1)])
+    bad = _answer(1, "重复")
+    await wb._retry_later([(0, bad)])
+    assert wb.stats()["retrying"] == 1 and wb.stats()["retried"] == 1
+    # 定时器到点：重新入队，flusher 再次失败后达到上限转入死信
+    handle, _ = next(iter(wb._retrying.values()))
+    handle.cancel()
+    wb._requeue(next(iter(wb._retrying)))
+    attempts, rows = wb._get_queue().get_nowait()
+    assert (attempts, rows) == (1, bad)
+    assert await wb._flush([rows]) == [0]
+    await wb._retry_later([(attempts, rows)])
+    assert wb.stats()["retrying"] == 0 and wb.stats()["dead"] == 1
+    dead = await redis.xrange(wb._DEAD)
+    assert len(dead) == 1 and "重复" in dead[0][1]["rows"]
+
+async def test_drain_flushes_retrying_groups(db, redis):
+    await wb._retry_later([(0, _answer(5))])
+    await wb.drain()
+    assert await _answer_ids(db) == [5] and wb.stats()["retrying"] == 0
+
+async def test_redis_reclaims_abandoned_messages(db, redis, monkeypatch):
+    monkeypatch.setattr(config, "WRITE_BEHIND_MODE", "redis")
+    monkeypatch.setattr(config, "WRITE_BEHIND_CLAIM_IDLE_MS", 0)
+    # 投递次数：首次读取 1 次，每次接管再 +1
+    monkeypatch.setattr(config, "WRITE_BEHIND_MAX_ATTEMPTS", 3)
+    await wb._flush([_answer(1)])
+    await wb._ensure_group(redis)
+    await wb.put(_answer(2))
+    await wb.put(_answer(1, "重复"))
+    # 被已退出的消费者读走但未确认
+    await redis.xreadgroup(wb._GROUP, "gone-1", {wb._STREAM: ">"}, count=10)
+    await wb._reclaim(redis)
+    assert await _answer_ids(db) == [1, 2]
+    # 失败的消息留在 PEL 等待再次投递
+    assert (await redis.xpending(wb._STREAM, wb._GROUP))["pending"] == 1
+    assert wb.stats()["reclaimed"] == 2 and wb.stats()["retried"] == 1
+    await wb._reclaim(redis)
+    assert (await redis.xpending(wb._STREAM, wb._GROUP))["pending"] == 0
+    assert await redis.xlen(wb._STREAM) == 0 and await redis.xlen(wb._DEAD) == 1
+
+async def test_pending_question_visible_until_flushed(db, redis, monkeypatch):
+    monkeypatch.setattr(config, "WRITE_BEHIND_MODE", "memory")
+    row = {"id": 500, **repo._question_row({"题型": 1, "难度": 1, "题目": "待落库", "材料": "m", "维度": [101]})}
+    await wb.put([("question", row)])
+    assert wb.pending_question(500)["title"] == "待落库"
+    # 其他进程从 Redis 读到
+    assert (await wb.remote_pending_questions([500]))[500]["title"] == "待落库"
+    _, rows = wb._get_queue().get_nowait()
+    assert await wb._flush([rows]) == []
+    assert wb.pending_question(500) is None and not await redis.exists(f"{wb._PENDING_PREFIX}500")